@@ -2,117 +2,136 @@
 # -*- coding: utf-8 -*-
 # @Author  : huxiansheng (you@example.org)
 # @Date    : 2024/8/6
+# 坐标按采集时的分辨率归一化保存，使用时通过 ScrcpyADB.resolve 换算成当前画面的像素坐标
+from data.coordinate.layout import TextButton, battle_point, menu_point
 
 ############## 一级界面坐标 ###################
 # 取消继续游戏
-cancel_continue = 758, 484
+cancel_continue = menu_point(758, 484)
 # 开始游戏
-start_game = 865, 628
+start_game = menu_point(865, 628)
 # 选择角色开始
-start_role = 868, 742
+start_role = menu_point(868, 742)
 # 角色头像
-role_head = 158, 56
+role_head = menu_point(158, 56)
 # 展开箭头
-expand_arrow = 1414, 41
+expand_arrow = menu_point(1414, 41)
 # 福利
-welfare = 1076, 47
+welfare = menu_point(1076, 47)
 # 拍卖行
-auction_house = 1156, 47
+auction_house = menu_point(1156, 47)
 # 兑换商店
-exchange_shop = 1400, 47
+exchange_shop = menu_point(1400, 47)
 # 商城
-shop = 1318, 47
+shop = menu_point(1318, 47)
 # 设置
-setting = 1597, 146
+setting = menu_point(1597, 146)
 # 公会
-guild = 1569, 350
+guild = menu_point(1569, 350)
 # 委托任务
-task_delegate = 1573, 448
-# 轮盘
-roulette_wheel = 567, 977
+task_delegate = menu_point(1573, 448)
+# 轮盘（战斗界面）
+roulette_wheel = battle_point(567, 977)
 # 背包
-pack = 1560, 728
+pack = menu_point(1560, 728)
 # 退出二级界面
-exit_second_page = 127, 30
+exit_second_page = menu_point(127, 30)
 
 ############## 背包内坐标 ###################
 # 分解装备
-decompose_equip = 1551, 754
+decompose_equip = menu_point(1551, 754)
 # 普通装备
-common_equip = 444, 702
+common_equip = menu_point(444, 702)
 # 高级装备
-high_equip = 590, 702
+high_equip = menu_point(590, 702)
 # 稀有装备
-rare_equip = 740, 702
+rare_equip = menu_point(740, 702)
 # 启动分解
-start_decompose = 1340, 700
+start_decompose = menu_point(1340, 700)
 # 确认分解
-confirm_decompose = 972, 592
+confirm_decompose = menu_point(972, 592)
 # 分解完成确认
-decompose_finish = 865, 603
+decompose_finish = menu_point(865, 603)
 # 关闭分解
-close_decompose = 1483, 86
+close_decompose = menu_point(1483, 86)
 # 金库
-gold_vault = 137, 430
+gold_vault = menu_point(137, 430)
 # 冒险团金库
-guild_gold_vault = 560, 109
+guild_gold_vault = menu_point(560, 109)
 # 材料tab
-material_tab = 1388, 111
+material_tab = menu_point(1388, 111)
 # 存入金库
-deposit_gold_vault = 962, 485
+deposit_gold_vault = menu_point(962, 485)
 # 确认存入金库
-confirm_deposit_gold_vault = 861, 692
+confirm_deposit_gold_vault = menu_point(861, 692)
 
 ############## 公会内坐标 ###################
 # 签到 tab
-sign_in_tab = 135, 267
+sign_in_tab = menu_point(135, 267)
 # 一级签到
-sign_in_first = 583, 752
+sign_in_first = menu_point(583, 752)
 
 ############## 委托任务内坐标 ###################
 # 迷惘之塔
-lost_tower = 646, 176
+lost_tower = menu_point(646, 176)
 # 迷惘之塔速通
-lost_tower_speed = 1220, 739
+lost_tower_speed = menu_point(1220, 739)
 # 移动到可入场地区
-move_to_enter_area = 1456, 724
+move_to_enter_area = menu_point(1456, 724)
 # 特产地下城
-special_place_dungeon = 138, 520
+special_place_dungeon = menu_point(138, 520)
 # 山脊
-mountain_ridge = 646, 176
+mountain_ridge = menu_point(646, 176)
 # 弹窗版本移动到可入场地区
-move_to_enter_area_popup = 1364, 674
+move_to_enter_area_popup = menu_point(1364, 674)
 
 ############## 选择地下城 ###################
 # 关闭选择地下城弹窗
-close_select_dungeon = 1397, 676
+close_select_dungeon = menu_point(1397, 676)
 # 布万家
-bwj = 1227, 622
+bwj = menu_point(1227, 622)
 # 冰龙
-bl = 1390, 371
+bl = menu_point(1390, 371)
 # 战斗开始
-battle_start = 1409, 682
+battle_start = menu_point(1409, 682)
 
 ############## 技能坐标 ###################
 # 普通攻击
-attack = 2372,1132
+attack = battle_point(2372, 1132)
 # buff1
-buff1 = 2266,610
+buff1 = battle_point(2266, 610)
 # buff2
-buff2 = 2393,610
+buff2 = battle_point(2393, 610)
 # 觉醒技能
-awaken_skill = 1985,610
+awaken_skill = battle_point(1985, 610)
 # 技能1
-skill1 = 2051,770
+skill1 = battle_point(2051, 770)
 # 技能2
-skill2 = 2235,770
+skill2 = battle_point(2235, 770)
 # 技能3
-skill3 = 2418,770
+skill3 = battle_point(2418, 770)
 # 技能4
-skill4 = 1864,960
+skill4 = battle_point(1864, 960)
 # 技能5
-skill5 = 2049,960
+skill5 = battle_point(2049, 960)
 # 技能6
-skill6 = 2230,960
+skill6 = battle_point(2230, 960)
 # 技能7
-skill7 = 1921,1160
+skill7 = battle_point(1921, 1160)
+
+############## 通关结算 ###################
+# 结算界面的按钮还没有在设备上采集过坐标，按文字在画面下半部分找，找不到就不点
+settlement_buttons = menu_point(0, 384), menu_point(1664, 768)
+# 再次挑战
+again_challenge = TextButton("再次挑战", settlement_buttons)
+# 返回城镇
+return_town = TextButton("返回城镇", settlement_buttons)
+
+############## HUD 数字区域（左上、右下） ###################
+# 区域按界面布局估算，需要在实际设备上重新采集，字符模板用 utils/digit_reader.extract_glyphs 生成
+# 疲劳值
+fatigue_region = menu_point(212, 80), menu_point(330, 104)
+# 金币
+gold_region = menu_point(1130, 12), menu_point(1260, 36)
+# 等级
+level_region = menu_point(84, 80), menu_point(132, 104)
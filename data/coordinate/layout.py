@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/16
+from typing import Dict, Tuple
+
+# 各组坐标采集时的画面分辨率（宽、高），坐标按这个分辨率归一化保存
+# 菜单坐标是在同一台设备 1664 宽的画面上采的，技能、轮盘坐标是在 2688 宽的画面上采的
+REFERENCE_RESOLUTION = {
+    "menu": (1664, 768),
+    "battle": (2688, 1242),
+}
+
+
+class LayoutPoint:
+    """
+    归一化坐标，取值 0~1，属于某一组布局
+    不能直接当 (x, y) 用，必须经过 CoordinateMapper 换算成当前画面的像素坐标
+    """
+    __slots__ = ("group", "x", "y")
+
+    def __init__(self, group: str, x: float, y: float):
+        self.group = group
+        self.x = x
+        self.y = y
+
+    def __repr__(self):
+        return f"LayoutPoint({self.group!r}, {self.x:.4f}, {self.y:.4f})"
+
+
+class TextButton:
+    """
+    位置不固定的按钮，点击时按文字在区域里找，找不到不会盲点
+    """
+    __slots__ = ("text", "region")
+
+    def __init__(self, text: str, region: Tuple[LayoutPoint, LayoutPoint]):
+        """
+        :param text: 按钮文字
+        :param region: 查找区域，(左上, 右下) 两个归一化坐标
+        """
+        self.text = text
+        self.region = region
+
+    def __repr__(self):
+        return f"TextButton({self.text!r})"
+
+
+def layout_point(group: str, x: int or float, y: int or float) -> LayoutPoint:
+    """
+    把采集时的像素坐标归一化
+    :param group: 布局分组
+    :param x: 采集时的像素 x
+    :param y: 采集时的像素 y
+    :return:
+    """
+    ref_w, ref_h = REFERENCE_RESOLUTION[group]
+    return LayoutPoint(group, round(x / ref_w, 5), round(y / ref_h, 5))
+
+
+def menu_point(x: int or float, y: int or float) -> LayoutPoint:
+    return layout_point("menu", x, y)
+
+
+def battle_point(x: int or float, y: int or float) -> LayoutPoint:
+    return layout_point("battle", x, y)
+
+
+class CoordinateMapper:
+    """
+    归一化坐标到当前画面像素坐标的映射
+    每组布局每个轴是一个线性映射 pixel = n * scale + offset，
+    默认按分辨率缩放，校准后用锚点修正不同长宽比下 UI 的偏移
+    """
+
+    def __init__(self, width: int, height: int, transforms: Dict[str, Tuple[float, float, float, float]] = None):
+        """
+        :param width: 画面宽
+        :param height: 画面高
+        :param transforms: 每组布局的 (x 缩放, x 偏移, y 缩放, y 偏移)，没有的组按分辨率缩放
+        """
+        self.width = width
+        self.height = height
+        self.transforms = dict(transforms or {})
+
+    def transform(self, group: str) -> Tuple[float, float, float, float]:
+        return self.transforms.get(group, (self.width, 0.0, self.height, 0.0))
+
+    def to_pixels(self, point: LayoutPoint) -> Tuple[int, int]:
+        """
+        归一化坐标换算成像素坐标
+        :param point:
+        :return:
+        """
+        sx, ox, sy, oy = self.transform(point.group)
+        return int(round(point.x * sx + ox)), int(round(point.y * sy + oy))
+
+    def scale_length(self, length: int or float, group: str) -> float:
+        """
+        把采集分辨率下的长度（比如轮盘半径）换算到当前画面
+        :param length: 采集时的像素长度
+        :param group: 布局分组
+        :return:
+        """
+        ref_w, _ = REFERENCE_RESOLUTION[group]
+        sx, _, _, _ = self.transform(group)
+        return length * sx / ref_w
+
+    def fit_anchors(self, group: str, anchors: Dict[LayoutPoint, Tuple[float, float]]):
+        """
+        用锚点的实际位置拟合映射，两个锚点可以同时解出缩放和偏移，一个锚点只修正偏移
+        :param group: 布局分组
+        :param anchors: {归一化坐标: 实际像素坐标}
+        :return:
+        """
+        pairs = [(point, pixel) for point, pixel in anchors.items() if point.group == group]
+        if not pairs:
+            return
+        sx, ox, sy, oy = self.transform(group)
+        if len(pairs) >= 2:
+            (p1, (x1, y1)), (p2, (x2, y2)) = pairs[:2]
+            if abs(p2.x - p1.x) > 1e-3:
+                sx = (x2 - x1) / (p2.x - p1.x)
+            if abs(p2.y - p1.y) > 1e-3:
+                sy = (y2 - y1) / (p2.y - p1.y)
+        # 偏移取所有锚点的平均残差
+        ox = sum(x - p.x * sx for p, (x, _) in pairs) / len(pairs)
+        oy = sum(y - p.y * sy for p, (_, y) in pairs) / len(pairs)
+        self.transforms[group] = (sx, ox, sy, oy)
+
+    def to_dict(self) -> dict:
+        return {"width": self.width, "height": self.height, "transforms": {k: list(v) for k, v in self.transforms.items()}}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'CoordinateMapper':
+        transforms = {k: tuple(v) for k, v in data.get("transforms", {}).items()}
+        return cls(data["width"], data["height"], transforms)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/16
+import json
+import os
+import threading
+from typing import List, Optional, Tuple
+
+import cv2 as cv
+
+from data.coordinate.game_coordinate import attack, roulette_wheel
+from data.coordinate.layout import REFERENCE_RESOLUTION, CoordinateMapper
+from utils.logger import logger
+from utils.path_manager import PathManager
+
+# 校准用的锚点，模板图片放在 data/coordinate/templates/<名称>.png，按锚点所在布局的采集分辨率截取
+# 用 capture_templates 从一张战斗界面的截图生成：python -m device_manager.calibration img/battle.png
+CALIBRATION_ANCHORS = {
+    "roulette_wheel": roulette_wheel,
+    "attack": attack,
+}
+
+_cache_lock = threading.Lock()
+
+
+def calibration_key(serial: str, width: int, height: int) -> str:
+    return f"{serial}_{width}x{height}"
+
+
+def load_cached_mapper(key: str) -> Optional[CoordinateMapper]:
+    """
+    读取缓存的校准结果
+    :param key: 设备序列号 + 分辨率
+    :return:
+    """
+    with _cache_lock:
+        if not os.path.exists(PathManager.DEVICE_CALIBRATION_PATH):
+            return None
+        with open(PathManager.DEVICE_CALIBRATION_PATH, encoding="utf-8") as f:
+            data = json.load(f).get(key)
+    return CoordinateMapper.from_dict(data) if data else None
+
+
+def save_mapper(key: str, mapper: CoordinateMapper):
+    """
+    缓存校准结果，同一台设备同一个分辨率只需要校准一次
+    :param key: 设备序列号 + 分辨率
+    :param mapper:
+    :return:
+    """
+    with _cache_lock:
+        cache = {}
+        if os.path.exists(PathManager.DEVICE_CALIBRATION_PATH):
+            with open(PathManager.DEVICE_CALIBRATION_PATH, encoding="utf-8") as f:
+                cache = json.load(f)
+        cache[key] = mapper.to_dict()
+        tmp_path = PathManager.DEVICE_CALIBRATION_PATH + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(cache, f, indent=2)
+        os.replace(tmp_path, PathManager.DEVICE_CALIBRATION_PATH)
+
+
+def locate_anchor(gray: cv.Mat, template: cv.Mat, expected: Tuple[int, int], scale: float,
+                  search_ratio: float = 0.15, threshold: float = 0.7) -> Optional[Tuple[int, int]]:
+    """
+    在预期位置附近用模板匹配找锚点
+    :param gray: 当前画面灰度图
+    :param template: 采集分辨率下的模板灰度图
+    :param expected: 按分辨率缩放后的预期像素坐标
+    :param scale: 当前画面相对采集分辨率的缩放
+    :param search_ratio: 搜索范围占画面宽度的比例
+    :param threshold: 匹配阈值
+    :return: 锚点中心的像素坐标，找不到返回 None
+    """
+    template = cv.resize(template, None, fx=scale, fy=scale, interpolation=cv.INTER_AREA)
+    th, tw = template.shape[:2]
+    h, w = gray.shape[:2]
+    radius = int(w * search_ratio)
+    ex, ey = expected
+    x1, y1 = max(0, ex - radius - tw // 2), max(0, ey - radius - th // 2)
+    x2, y2 = min(w, ex + radius + tw // 2), min(h, ey + radius + th // 2)
+    roi = gray[y1:y2, x1:x2]
+    if roi.shape[0] < th or roi.shape[1] < tw:
+        return None
+
+    result = cv.matchTemplate(roi, template, cv.TM_CCOEFF_NORMED)
+    _, score, _, (mx, my) = cv.minMaxLoc(result)
+    if score < threshold:
+        return None
+    return x1 + mx + tw // 2, y1 + my + th // 2
+
+
+def capture_templates(frame: cv.Mat, template_dir: str = PathManager.LAYOUT_TEMPLATE_PATH, size: int = 160) -> List[str]:
+    """
+    从战斗界面的截图里截取锚点模板，截图要是标准布局（没有黑边、按分辨率等比例缩放）
+    模板按采集分辨率保存，任意分辨率的截图都可以
+    :param frame: 战斗界面截图，能看到轮盘和普通攻击按钮
+    :param template_dir: 模板目录
+    :param size: 模板边长，采集分辨率下的像素
+    :return: 保存的模板文件
+    """
+    h, w = frame.shape[:2]
+    mapper = CoordinateMapper(w, h)
+    gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    os.makedirs(template_dir, exist_ok=True)
+    paths = []
+    for name, point in CALIBRATION_ANCHORS.items():
+        scale = w / REFERENCE_RESOLUTION[point.group][0]
+        half = int(size * scale / 2)
+        x, y = mapper.to_pixels(point)
+        crop = gray[max(0, y - half):y + half, max(0, x - half):x + half]
+        # 缩放回采集分辨率，和 calibrate 里的换算一致
+        template = cv.resize(crop, None, fx=1 / scale, fy=1 / scale, interpolation=cv.INTER_AREA)
+        path = os.path.join(template_dir, f"{name}.png")
+        cv.imwrite(path, template)
+        paths.append(path)
+    logger.info(f"锚点模板已保存：{paths}")
+    return paths
+
+
+def calibrate(frame: cv.Mat, key: str = None, template_dir: str = PathManager.LAYOUT_TEMPLATE_PATH) -> CoordinateMapper:
+    """
+    根据当前画面校准坐标映射：先按分辨率缩放，再用锚点修正
+    锚点要在战斗界面才能找到，找不到的锚点跳过，全部找不到就只按分辨率缩放
+    :param frame: 当前画面
+    :param key: 缓存的 key，不传不缓存
+    :param template_dir: 锚点模板目录
+    :return:
+    """
+    h, w = frame.shape[:2]
+    mapper = CoordinateMapper(w, h)
+    gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
+
+    missing = [name for name in CALIBRATION_ANCHORS if not os.path.exists(os.path.join(template_dir, f"{name}.png"))]
+    if missing:
+        logger.warning(f"{template_dir} 下缺少锚点模板 {missing}，这些锚点不参与校准；"
+                       f"用 python -m device_manager.calibration <战斗界面截图> 生成")
+
+    found = {}
+    for name, point in CALIBRATION_ANCHORS.items():
+        if name in missing:
+            continue
+        template_path = os.path.join(template_dir, f"{name}.png")
+        template = cv.imread(template_path, cv.IMREAD_GRAYSCALE)
+        scale = w / REFERENCE_RESOLUTION[point.group][0]
+        position = locate_anchor(gray, template, mapper.to_pixels(point), scale)
+        if position is None:
+            logger.info(f"校准锚点 {name} 没有找到")
+            continue
+        found[point] = position
+
+    groups = {point.group for point in found}
+    for group in groups:
+        mapper.fit_anchors(group, found)
+    if found:
+        logger.info(f"坐标校准完成，分辨率 {w}x{h}，找到锚点 {len(found)} 个")
+    else:
+        logger.warning(f"没有找到任何锚点，分辨率 {w}x{h} 只按分辨率缩放，不是标准布局的设备会点偏")
+
+    # 没找到任何锚点的不缓存，下次还要再校准
+    if key and found:
+        save_mapper(key, mapper)
+    return mapper
+
+
+if __name__ == '__main__':
+    # 生成锚点模板：python -m device_manager.calibration img/battle.png
+    import sys
+
+    capture_templates(cv.imread(sys.argv[1]))
@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/29
+import contextvars
+import random
+import threading
+import time
+from typing import Callable, Optional, Sequence, TYPE_CHECKING
+
+from device_manager.frame_rate import GamePhase
+from utils.logger import logger
+
+if TYPE_CHECKING:
+    from device_manager.scrcpy_adb import ScrcpyADB
+
+
+class ConnectionState:
+    """
+    连接状态
+    """
+    CONNECTING = "connecting"
+    CONNECTED = "connected"
+    RECONNECTING = "reconnecting"
+    CLOSED = "closed"
+
+
+class Backoff:
+    """
+    指数退避，每次失败等待时间翻倍，加一点随机抖动，连接成功后重置
+    """
+
+    def __init__(self, initial: float = 1.0, maximum: float = 30.0, factor: float = 2.0, jitter: float = 0.1):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+        self.attempts = 0
+
+    def next(self) -> float:
+        delay = min(self.maximum, self.initial * self.factor ** self.attempts)
+        self.attempts += 1
+        return delay * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def reset(self):
+        self.attempts = 0
+
+
+class ConnectionManager:
+    """
+    设备连接管理：负责查找设备、scrcpy 断开或者画面卡住时自动重连
+    scrcpy 画面不变时不推帧，城镇、菜单、加载界面可能很久没有新帧，只在打怪、捡材料这种画面一直在动的阶段检查卡住
+    重连只重启推流和控制通道，模型、状态中心、识别回调都保留，控制循环拿不到新状态时会自己等待，连上后继续执行
+    """
+
+    def __init__(self, serial: str = None, addresses: Sequence[str] = ("127.0.0.1:5555",), stall_timeout: float = 10.0,
+                 check_interval: float = 1.0, backoff: Backoff = None,
+                 stall_phases: Sequence[str] = (GamePhase.COMBAT, GamePhase.LOOTING)):
+        """
+        :param serial: 设备序列号，不传使用第一个设备
+        :param addresses: 查找设备前先 adb connect 的地址，模拟器和无线调试用
+        :param stall_timeout: 超过这么久没有新画面就重连，不要设得太小
+        :param check_interval: 看门狗检查间隔
+        :param backoff: 重连的退避策略
+        :param stall_phases: 检查画面卡住的阶段，其他阶段只看推流是否断开
+        """
+        self.serial = serial
+        self.addresses = tuple(addresses)
+        self.stall_timeout = stall_timeout
+        self.check_interval = check_interval
+        self.backoff = backoff or Backoff()
+        self.stall_phases = tuple(stall_phases)
+
+        self.state = ConnectionState.CONNECTING
+        self.reconnects = 0
+        self._adb: Optional['ScrcpyADB'] = None
+        self._listeners = []
+        self._connected = threading.Event()
+        self._reconnect_reason = None
+        self._wakeup = threading.Event()
+        self._closed = threading.Event()
+        self._thread = None
+        self._stall_since = 0.0  # 进入需要检查卡住的阶段的时间，从这时开始计时
+
+    def add_listener(self, listener: Callable[[str, str], None]):
+        """
+        连接状态变化回调，参数为 (旧状态, 新状态)
+        :param listener:
+        :return:
+        """
+        self._listeners.append(listener)
+
+    def _set_state(self, state: str):
+        old_state, self.state = self.state, state
+        if old_state == state:
+            return
+        if state == ConnectionState.CONNECTED:
+            self._connected.set()
+        else:
+            self._connected.clear()
+        logger.info(f"设备连接状态：{old_state} -> {state}")
+        for listener in self._listeners:
+            try:
+                listener(old_state, state)
+            except Exception as e:
+                logger.error(e)
+
+    @property
+    def connected(self) -> bool:
+        return self._connected.is_set()
+
+    def wait_connected(self, timeout: float = None) -> bool:
+        """
+        等待连接恢复
+        :param timeout: 超时时间，不传一直等
+        :return: 是否已连接
+        """
+        return self._connected.wait(timeout)
+
+    def discover(self):
+        """
+        查找设备，先 connect 再列设备，刚启动的模拟器才能被列出来
+        :return: adbutils 的设备
+        """
+        from adbutils import adb
+
+        for address in self.addresses:
+            try:
+                adb.connect(address, timeout=3)
+            except Exception as e:
+                logger.debug(f"adb connect {address} 失败：{e}")
+        devices = adb.device_list()
+        if self.serial is not None:
+            devices = [device for device in devices if device.serial == self.serial]
+        if not devices:
+            raise ConnectionError("No devices connected")
+        return devices[0]
+
+    def wait_for_device(self, timeout: float = None):
+        """
+        按退避策略反复查找设备，直到找到或者超时
+        :param timeout: 超时时间，不传一直等
+        :return: adbutils 的设备
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                device = self.discover()
+                self.backoff.reset()
+                return device
+            except Exception as e:
+                delay = self.backoff.next()
+                if deadline is not None and time.monotonic() + delay > deadline:
+                    raise
+                logger.info(f"没有找到设备：{e}，{delay:.1f} 秒后重试")
+                if self._closed.wait(delay):
+                    raise ConnectionError("connection manager closed")
+
+    def attach(self, adb: 'ScrcpyADB') -> 'ConnectionManager':
+        """
+        接管设备的推流，启动看门狗，设备已经连上推流之后调用
+        :param adb:
+        :return:
+        """
+        self._adb = adb
+        self._set_state(ConnectionState.CONNECTED)
+        if self._thread is None:
+            self._thread = threading.Thread(target=contextvars.copy_context().run, args=(self._watchdog,),
+                                            name="connection-watchdog", daemon=True)
+            self._thread.start()
+        return self
+
+    def request_reconnect(self, reason: str):
+        """
+        请求重连，在看门狗线程里执行，可以在推流线程的回调里调用
+        :param reason: 重连原因
+        :return:
+        """
+        if self.state != ConnectionState.CONNECTED:
+            return
+        self._reconnect_reason = reason
+        self._wakeup.set()
+
+    def close(self):
+        self._closed.set()
+        self._wakeup.set()
+        self._set_state(ConnectionState.CLOSED)
+
+    def _check(self) -> Optional[str]:
+        """
+        检查连接是否健康
+        :return: 不健康的原因，健康返回 None
+        """
+        adb = self._adb
+        # 阶段切换正在重启推流，这时候推流停了是正常的
+        if adb.restarting:
+            return None
+        client = adb.client
+        if client is None or not client.alive:
+            return "推流已停止"
+        now = time.monotonic()
+        if adb.governor.phase not in self.stall_phases:
+            self._stall_since = now
+            return None
+        last_frame_time = max(adb.last_frame_time, self._stall_since)
+        if last_frame_time and now - last_frame_time > self.stall_timeout:
+            return f"{adb.governor.phase} 阶段 {self.stall_timeout:g} 秒没有新画面"
+        return None
+
+    def _watchdog(self):
+        while not self._closed.is_set():
+            self._wakeup.wait(self.check_interval)
+            self._wakeup.clear()
+            if self._closed.is_set() or self.state != ConnectionState.CONNECTED:
+                continue
+            reason, self._reconnect_reason = self._reconnect_reason, None
+            reason = reason or self._check()
+            if reason is not None:
+                self._reconnect(reason)
+
+    def _reconnect(self, reason: str):
+        """
+        重新查找设备并重启推流，失败按退避策略一直重试
+        :param reason: 重连原因
+        :return:
+        """
+        logger.warning(f"设备连接异常：{reason}，开始重连")
+        self._set_state(ConnectionState.RECONNECTING)
+        adb = self._adb
+        while not self._closed.is_set():
+            try:
+                adb.restart_stream(self.wait_for_device())
+                self.reconnects += 1
+                self.backoff.reset()
+                self._set_state(ConnectionState.CONNECTED)
+                logger.info(f"设备重连成功，累计重连 {self.reconnects} 次")
+                return
+            except Exception as e:
+                delay = self.backoff.next()
+                logger.error(f"设备重连失败：{e}，{delay:.1f} 秒后重试")
+                if self._closed.wait(delay):
+                    return
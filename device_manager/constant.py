@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 # @Author  : huxiansheng (you@example.org)
 # @Date    : 2024/8/8
+import colorsys
 
 # 目标颜色画框
 TARGET_COLOUR = {
@@ -24,3 +25,19 @@ TARGET_COLOUR = {
     # 青色
     8.0: (0, 255, 255)
 }
+
+
+def get_label_colour(label: int or float) -> tuple:
+    """
+    获取标签画框的颜色，TARGET_COLOUR 里没有的标签按色相均匀生成，保证同一个标签颜色固定
+    :param label: 标签下标
+    :return:
+    """
+    colour = TARGET_COLOUR.get(float(label))
+    if colour is None:
+        # 黄金分割取色相，相邻标签颜色差异大
+        hue = (int(label) * 0.618033988749895) % 1.0
+        r, g, b = colorsys.hsv_to_rgb(hue, 0.85, 1.0)
+        colour = (int(r * 255), int(g * 255), int(b * 255))
+        TARGET_COLOUR[float(label)] = colour
+    return colour
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/23
+import queue
+import threading
+import time
+from collections import deque
+from typing import Dict, TYPE_CHECKING
+
+from utils.logger import logger
+
+if TYPE_CHECKING:
+    import cv2 as cv
+
+
+class DropPolicy:
+    """
+    缓冲区满了之后的处理方式
+    """
+    DROP_OLDEST = "drop_oldest"  # 丢掉最旧的帧，消费者永远拿到比较新的画面
+    DROP_NEWEST = "drop_newest"  # 丢掉新来的帧，消费者按顺序处理，不跳帧
+
+
+class FrameCursor:
+    """
+    环形缓冲区的读游标，每个消费者一个，互不影响
+    """
+
+    def __init__(self, buffer: 'FrameRingBuffer', name: str, next_seq: int):
+        self.buffer = buffer
+        self.name = name
+        self.next_seq = next_seq
+        self.consumed = 0
+        self.dropped = 0  # 没来得及读就被覆盖的帧
+        self.max_depth = 0
+
+    @property
+    def depth(self) -> int:
+        """
+        还没读的帧数
+        :return:
+        """
+        return self.buffer.depth(self)
+
+    def get(self, timeout: float = None, latest: bool = False) -> 'cv.Mat':
+        """
+        读下一帧，用法和 queue.Queue.get 一样
+        :param timeout: 超时抛出 queue.Empty，不传一直等
+        :param latest: 跳过积压的帧，直接读最新的一帧
+        :return:
+        """
+        return self.buffer.read(self, timeout, latest)
+
+    def stats(self) -> dict:
+        return {"depth": self.depth, "max_depth": self.max_depth, "consumed": self.consumed, "dropped": self.dropped}
+
+
+class FrameRingBuffer:
+    """
+    有界的帧环形缓冲区，一个生产者多个消费者
+    每个消费者一个游标，显示和识别各读各的，不会互相抢帧；读得慢的游标按丢帧策略处理，内存不会无限增长
+    """
+
+    def __init__(self, capacity: int = 3, policy: str = DropPolicy.DROP_OLDEST, report_interval: float = 30):
+        """
+        :param capacity: 最多缓存的帧数
+        :param policy: 缓冲区满了之后的处理方式
+        :param report_interval: 定时输出队列深度统计的间隔，0 表示不输出
+        """
+        if capacity < 1:
+            raise ValueError("capacity must be greater than 0")
+        if policy not in (DropPolicy.DROP_OLDEST, DropPolicy.DROP_NEWEST):
+            raise ValueError(f"{policy} is not support")
+        self.capacity = capacity
+        self.policy = policy
+        self.report_interval = report_interval
+
+        self._frames = deque(maxlen=capacity)
+        self._next_seq = 0  # 下一帧的序号
+        self._cursors: Dict[str, FrameCursor] = {}
+        self._cond = threading.Condition()
+        self.written = 0
+        self.rejected = 0  # DROP_NEWEST 策略下没写进去的帧
+        self._last_report = time.monotonic()
+
+    @property
+    def _oldest_seq(self) -> int:
+        return self._next_seq - len(self._frames)
+
+    def cursor(self, name: str) -> FrameCursor:
+        """
+        获取消费者的游标，同名的返回同一个，新游标从下一帧开始读
+        :param name:
+        :return:
+        """
+        with self._cond:
+            if name not in self._cursors:
+                self._cursors[name] = FrameCursor(self, name, self._next_seq)
+            return self._cursors[name]
+
+    def depth(self, cursor: FrameCursor) -> int:
+        return min(self._next_seq - cursor.next_seq, len(self._frames))
+
+    def put(self, frame: 'cv.Mat') -> bool:
+        """
+        写入一帧
+        :param frame:
+        :return: 是否写入，DROP_NEWEST 策略下有游标积压满了会拒绝写入
+        """
+        with self._cond:
+            if self.policy == DropPolicy.DROP_NEWEST and len(self._frames) == self.capacity:
+                if any(self.depth(c) >= self.capacity for c in self._cursors.values()):
+                    self.rejected += 1
+                    return False
+            self._frames.append(frame)
+            self._next_seq += 1
+            self.written += 1
+            for c in self._cursors.values():
+                c.max_depth = max(c.max_depth, self.depth(c))
+            self._cond.notify_all()
+
+        now = time.monotonic()
+        if self.report_interval and now - self._last_report >= self.report_interval:
+            self._last_report = now
+            logger.info(self.format_stats())
+        return True
+
+    def read(self, cursor: FrameCursor, timeout: float = None, latest: bool = False) -> 'cv.Mat':
+        with self._cond:
+            if not self._cond.wait_for(lambda: cursor.next_seq < self._next_seq, timeout):
+                raise queue.Empty
+            target = self._next_seq - 1 if latest else max(cursor.next_seq, self._oldest_seq)
+            cursor.dropped += target - cursor.next_seq
+            frame = self._frames[target - self._oldest_seq]
+            cursor.next_seq = target + 1
+            cursor.consumed += 1
+            return frame
+
+    def stats(self) -> dict:
+        """
+        缓冲区统计
+        :return:
+        """
+        with self._cond:
+            return {
+                "capacity": self.capacity,
+                "written": self.written,
+                "rejected": self.rejected,
+                "cursors": {name: c.stats() for name, c in self._cursors.items()},
+            }
+
+    def format_stats(self) -> str:
+        stats = self.stats()
+        cursors = "，".join(f"{name} 积压 {c['depth']}/{self.capacity}（最大 {c['max_depth']}）丢弃 {c['dropped']}"
+                           for name, c in stats["cursors"].items())
+        return f"帧缓冲：写入 {stats['written']} 帧，拒绝 {stats['rejected']} 帧，{cursors or '没有消费者'}"
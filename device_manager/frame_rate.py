@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/12
+import math
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict
+
+from utils.logger import logger
+
+
+class GamePhase:
+    """
+    游戏阶段，不同阶段对反应速度的要求不一样
+    """
+    COMBAT = "combat"  # 打怪
+    LOOTING = "looting"  # 捡材料
+    TRANSITION = "transition"  # 过图
+    MENU = "menu"  # 城镇、菜单、选图、加载
+
+
+# 各阶段需要的处理帧率
+DEFAULT_PHASE_FPS = {
+    GamePhase.COMBAT: 15,
+    GamePhase.LOOTING: 10,
+    GamePhase.TRANSITION: 10,
+    GamePhase.MENU: 2,
+}
+
+# 推流帧率分组，同一组里切换阶段只抽帧；切换到另一组时才按新的帧率重启推流，只在进出副本的时候发生
+STREAM_GROUPS = (
+    (GamePhase.COMBAT, GamePhase.LOOTING, GamePhase.TRANSITION),
+    (GamePhase.MENU,),
+)
+
+
+class FpsMeter:
+    """
+    滑动窗口帧率统计
+    """
+
+    def __init__(self, window: float = 2.0):
+        self.window = window
+        self._stamps = deque()
+
+    def tick(self, now: float):
+        self._stamps.append(now)
+        self._trim(now)
+
+    def rate(self, now: float = None) -> float:
+        now = time.monotonic() if now is None else now
+        self._trim(now)
+        return len(self._stamps) / self.window
+
+    def _trim(self, now: float):
+        while self._stamps and now - self._stamps[0] > self.window:
+            self._stamps.popleft()
+
+
+class FrameRateGovernor:
+    """
+    帧率调节器
+    scrcpy 以当前阶段所在分组的最高帧率推流，按当前阶段的目标帧率抽帧，只把需要的帧交给识别
+    """
+
+    def __init__(self, phase_fps: Dict[str, float] = None, phase: str = GamePhase.MENU, report_interval: float = 30):
+        """
+        :param phase_fps: 各阶段的目标帧率
+        :param phase: 初始阶段
+        :param report_interval: 定时输出帧率统计的间隔，0 表示不输出
+        """
+        self.phase_fps = dict(DEFAULT_PHASE_FPS)
+        if phase_fps:
+            self.phase_fps.update(phase_fps)
+        self.phase = phase
+        self.report_interval = report_interval
+
+        self.input_meter = FpsMeter()
+        self.processed_meter = FpsMeter()
+        self.dropped = 0
+
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._last_accept = 0.0
+        self._last_report = time.monotonic()
+
+    @property
+    def target_fps(self) -> float:
+        return self.phase_fps.get(self.phase, max(self.phase_fps.values()))
+
+    @property
+    def stream_fps(self) -> int:
+        """
+        scrcpy 推流需要的帧率，当前阶段所在分组里最高的目标帧率
+        :return:
+        """
+        group = next((group for group in STREAM_GROUPS if self.phase in group), (self.phase,))
+        return int(math.ceil(max(self.phase_fps.get(phase, self.target_fps) for phase in group)))
+
+    def add_listener(self, listener: Callable[[str, str], None]):
+        """
+        阶段切换回调，参数为 (旧阶段, 新阶段)
+        :param listener:
+        :return:
+        """
+        self._listeners.append(listener)
+
+    def set_phase(self, phase: str):
+        """
+        切换游戏阶段
+        :param phase:
+        :return:
+        """
+        if phase not in self.phase_fps:
+            raise ValueError(f"{phase} is not support")
+        with self._lock:
+            old_phase, self.phase = self.phase, phase
+        if old_phase == phase:
+            return
+        logger.info(f"切换阶段：{old_phase} -> {phase}，目标帧率 {self.target_fps}，{self.format_stats()}")
+        for listener in self._listeners:
+            try:
+                listener(old_phase, phase)
+            except Exception as e:
+                logger.error(e)
+
+    def accept(self, now: float = None) -> bool:
+        """
+        新帧到达时调用，返回这一帧是否需要处理
+        :param now: 帧到达时间
+        :return:
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self.input_meter.tick(now)
+            # 留 10% 余量，避免推流抖动导致把本该处理的帧丢掉
+            min_interval = 0.9 / self.target_fps
+            accepted = now - self._last_accept >= min_interval
+            if accepted:
+                self._last_accept = now
+                self.processed_meter.tick(now)
+            else:
+                self.dropped += 1
+
+        if self.report_interval and now - self._last_report >= self.report_interval:
+            self._last_report = now
+            logger.info(self.format_stats())
+        return accepted
+
+    def stats(self) -> dict:
+        """
+        当前帧率统计
+        :return:
+        """
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "phase": self.phase,
+                "target_fps": self.target_fps,
+                "input_fps": round(self.input_meter.rate(now), 2),
+                "processed_fps": round(self.processed_meter.rate(now), 2),
+                "dropped": self.dropped,
+            }
+
+    def format_stats(self) -> str:
+        stats = self.stats()
+        return f"输入帧率 {stats['input_fps']}，处理帧率 {stats['processed_fps']}，已丢弃 {stats['dropped']} 帧"
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/12
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2 as cv
+
+from device_manager.constant import get_label_colour
+from utils.logger import logger
+
+
+def draw_detections(frame: cv.Mat, objs, class_names):
+    """
+    在 cv 中画出目标框，并显示标签名称和置信度
+    :param frame: 要绘制的帧，会被直接修改
+    :param objs: 检测结果
+    :param class_names: 标签名称列表
+    :return: 绘制后的帧
+    """
+    font = cv.FONT_HERSHEY_SIMPLEX  # 字体样式
+    font_scale = 1  # 字体大小
+    thickness = 3  # 文本线条厚
+
+    for obj in objs:
+        color = get_label_colour(obj.label)
+        cv.rectangle(frame, (int(obj.rect.x), int(obj.rect.y)), (int(obj.rect.x + obj.rect.w), int(obj.rect.y + obj.rect.h)), color, 2)
+
+        # 构造显示的标签文本
+        label_text = f"{class_names[int(obj.label)]}:{obj.prob:.2f}"
+
+        # 计算文本位置
+        text_x = int(obj.rect.x)
+        text_y = int(obj.rect.y - 5)  # 将文本放置在矩形框上方
+
+        # 如果文本超出边界，则将其放置在矩形框下方
+        if text_y < 0:
+            text_y = int(obj.rect.y + obj.rect.h + 5)
+
+        # 绘制标签文本
+        cv.putText(frame, label_text, (text_x, text_y), font, font_scale, color, thickness=thickness)
+    return frame
+
+
+class PreviewSink:
+    """
+    低频预览输出，无显示器的服务器上使用
+    控制循环只负责把最新帧的引用交过来，绘制、JPEG 编码、写文件、推流都在独立线程里完成
+    """
+
+    def __init__(self, path: str = None, port: int = None, fps: float = 1.0, quality: int = 70):
+        """
+        :param path: 预览图片保存路径，每次原子替换为最新的一帧
+        :param port: MJPEG 推流端口，只监听 127.0.0.1，浏览器打开 http://127.0.0.1:port 即可查看
+        :param fps: 预览帧率
+        :param quality: JPEG 质量
+        """
+        self.path = path
+        self.port = port
+        self.interval = 1.0 / fps if fps > 0 else 1.0
+        self.quality = quality
+
+        self._pending = None
+        self._pending_lock = threading.Lock()
+        self._jpeg = None
+        self._jpeg_cond = threading.Condition()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._server = None
+
+    def submit(self, frame: cv.Mat, objs, class_names):
+        """
+        提交最新一帧，只保存引用，不做任何拷贝和绘制
+        :param frame: 帧
+        :param objs: 检测结果
+        :param class_names: 标签名称列表
+        :return:
+        """
+        with self._pending_lock:
+            self._pending = (frame, objs, class_names)
+
+    def start(self):
+        """
+        启动预览线程和推流服务
+        :return:
+        """
+        if self._thread is not None:
+            return self
+        if self.port:
+            self._server = ThreadingHTTPServer(("127.0.0.1", self.port), self._make_handler())
+            self._server.daemon_threads = True
+            threading.Thread(target=self._server.serve_forever, name="preview-http", daemon=True).start()
+            logger.info(f"预览推流地址：http://127.0.0.1:{self.port}")
+        self._thread = threading.Thread(target=self._run, name="preview", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        停止预览
+        :return:
+        """
+        self._stop_event.set()
+        with self._jpeg_cond:
+            self._jpeg_cond.notify_all()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            with self._pending_lock:
+                pending, self._pending = self._pending, None
+            if pending is None:
+                continue
+
+            frame, objs, class_names = pending
+            try:
+                canvas = draw_detections(frame.copy(), objs, class_names)
+                ok, buf = cv.imencode(".jpg", canvas, [int(cv.IMWRITE_JPEG_QUALITY), self.quality])
+                if not ok:
+                    continue
+                jpeg = buf.tobytes()
+                if self.path:
+                    self._write_file(jpeg)
+                with self._jpeg_cond:
+                    self._jpeg = jpeg
+                    self._jpeg_cond.notify_all()
+            except Exception as e:
+                logger.error(e)
+
+    def _write_file(self, jpeg: bytes):
+        # 先写临时文件再替换，避免读到写了一半的图片
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(jpeg)
+        os.replace(tmp_path, self.path)
+
+    def _wait_jpeg(self, last):
+        with self._jpeg_cond:
+            while not self._stop_event.is_set() and (self._jpeg is None or self._jpeg is last):
+                self._jpeg_cond.wait(timeout=self.interval * 2)
+            return self._jpeg
+
+    def _make_handler(self):
+        sink = self
+
+        class MJPEGHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=frame")
+                self.end_headers()
+                last = None
+                try:
+                    while not sink._stop_event.is_set():
+                        jpeg = sink._wait_jpeg(last)
+                        if jpeg is None or jpeg is last:
+                            continue
+                        last = jpeg
+                        self.wfile.write(b"--frame\r\nContent-Type: image/jpeg\r\n")
+                        self.wfile.write(f"Content-Length: {len(jpeg)}\r\n\r\n".encode())
+                        self.wfile.write(jpeg)
+                        self.wfile.write(b"\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, format, *args):
+                # 不往日志里刷每一个请求
+                pass
+
+        return MJPEGHandler
+
+
+if __name__ == '__main__':
+    sink = PreviewSink(port=8081, fps=1).start()
+    time.sleep(60)
+    sink.stop()
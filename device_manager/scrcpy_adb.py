@@ -2,20 +2,31 @@
 # -*- coding: utf-8 -*-
 # @Author  : huxiansheng (you@example.org)
 # @Date    : 2024/8/5
+import contextvars
+import functools
+import math
 import queue
 import sys
 import threading
 import time
-from typing import Tuple
+from typing import Callable, List, Tuple, Union, TYPE_CHECKING
 
-import scrcpy
-from adbutils import adb
-import cv2 as cv
-from ncnn.utils import Detect_Object
+from data.coordinate.layout import CoordinateMapper, LayoutPoint
+from device_manager.connection import ConnectionManager
+from device_manager.frame_buffer import FrameRingBuffer
+from device_manager.frame_rate import FrameRateGovernor, GamePhase
+from utils.logger import bind_log_device, logger, update_log_context
+from utils.model_loader import ModelLoader
+from utils.startup_report import startup_timer
 
-from device_manager.constant import TARGET_COLOUR
-from utils.logger import logger
-from utils.yolov5 import YoloV5s
+# scrcpy、adbutils、cv2、ncnn 都比较重，只在真正用到的时候再 import
+if TYPE_CHECKING:
+    import cv2 as cv
+    from ncnn.utils import Detect_Object
+    from device_manager.preview import PreviewSink
+
+# 像素坐标或者归一化坐标
+Coordinate = Union[LayoutPoint, Tuple[int or float, int or float]]
 
 
 class ScrcpyADB:
@@ -23,56 +34,380 @@ class ScrcpyADB:
     连接设备，并启动 scrcpy
     """
 
-    def __init__(self):
-        devices = adb.device_list()[0]
-        if not devices:
-            raise Exception("No devices connected")
-        adb.connect("127.0.0.1:5555")
+    def __init__(self, headless: bool = False, preview: 'PreviewSink' = None, governor: FrameRateGovernor = None, reconfigure_stream: bool = False, model: str = None, max_width: int = 2688,
+                 frame_buffer: FrameRingBuffer = None, detection_cache: bool = False, motion_gate: bool = False,
+                 pipeline: bool = False, tiled: bool = False, connection: ConnectionManager = None, record: bool = None):
+        """
+        :param headless: 无界面模式，不绘制检测框也不弹出窗口
+        :param preview: 低频预览输出，可以和无界面模式配合使用
+        :param governor: 帧率调节器，按游戏阶段抽帧
+        :param reconfigure_stream: 每次切换阶段都按目标帧率重启 scrcpy 推流，重启大约需要 1 秒；默认只在进出副本时重启，副本内只抽帧
+        :param model: manifest 里的模型名称，可以选择 fp16 / int8 量化模型，不传使用默认模型
+        :param max_width: 推流最大宽度，调小可以加快识别，点击坐标会按实际画面分辨率换算
+        :param frame_buffer: mac 上的帧缓冲区，默认缓存 3 帧，读得慢时丢掉最旧的帧
+        :param detection_cache: 是否缓存识别结果，站着不动等静止画面跳过推理
+        :param motion_gate: 是否开启帧差门控，画面变化小时复用上次的识别结果，按镜头平移修正位置
+        :param pipeline: 是否用三段流水线识别，提高持续吞吐但单帧延迟不变，对延迟要求高时不要开；只对非 mac 系统的推流识别生效
+        :param tiled: 是否开启分块识别，材料、箭头没识别到时把画面切成小块再找一遍，提高小目标的召回
+        :param connection: 设备连接管理，负责查找设备和断线重连，不传使用第一个设备
+        :param record: 是否录制对局给难例挖掘用，不传看环境变量 DNFM_RECORD_SESSION
+        """
+        # 先在后台加载模型，和连接设备同时进行
+        self.detection_cache = detection_cache
+        self.motion_gate = motion_gate
+        self.tiled = tiled
+        self.model_loader = self.init_yolov5(model, detection_cache, motion_gate, tiled)
 
-        self.client = scrcpy.Client(device=devices, max_width=2688, max_fps=5)
-        self.client.add_listener(scrcpy.EVENT_FRAME, self.on_frame)
-        self.client.start(threaded=True)
+        self.headless = headless
+        self.preview = preview
+        if self.preview is not None:
+            self.preview.start()
+        self.governor = governor or FrameRateGovernor()
+        self.reconfigure_stream = reconfigure_stream
+        self.governor.add_listener(self._on_phase_change)
 
-        self.last_screen = None
-        self.yolo = self.init_yolov5()
+        self.pipeline = None
+        if pipeline:
+            from utils.detection_pipeline import DetectionPipeline
 
-        self.frame_queue = queue.Queue()
+            self.pipeline = DetectionPipeline(lambda: self.yolo).start()
+
+        # 只识别这些标签，None 表示全部，按当前要做的事缩小范围可以减少后处理
+        self.detect_classes = None
+        # 上次同步给模型的 (模型, 阶段)，识别缓存按阶段调整过期时间
+        self._model_phase = None
+        # 模型加载失败只在状态变化时报一次错
+        self._model_failed = False
+
+        self.max_width = max_width
+        self._layout = None
+        self.last_screen = None
+        self.last_frame_time = 0.0
+        # 最近一次识别完成的时间，发触摸操作时用来算从识别到操作的延迟
+        self.last_detection_time = 0.0
+        # mac 上推流线程只写缓冲区，显示和识别各用一个游标读
+        self.frame_buffer = frame_buffer or FrameRingBuffer()
+        self.frame_queue = self.frame_buffer.cursor("perception")
+        self._frame_listeners = []
+        self._detection_listeners = []
         self.stop_event = threading.Event()
 
+        self.connection = connection or ConnectionManager()
+        self.device = self.connection.discover()
+        bind_log_device(self.device.serial)
+        startup_timer.mark("device_connected")
+        # 设置了 DNFM_PROFILE_HZ / DNFM_PROFILE_PORT 才开启采样分析
+        from utils.profiler import start_profiler_from_env
+
+        self.profiler = start_profiler_from_env(self.device.serial)
+
+        self.client = None
+        # 阶段切换和断线重连都会重启推流，分别在控制线程和看门狗线程里，同一时间只能有一个在重启
+        self._stream_lock = threading.Lock()
+        self.restarting = False
+        self._start_client(self._stream_fps())
+        self.connection.attach(self)
+
+        from device_manager.session_recorder import start_session_recorder
+
+        self.recorder = start_session_recorder(self, record)
+
+    @property
+    def yolo(self):
+        """
+        识别模型，后台还没加载完就等待
+        :return:
+        """
+        return self.model_loader.get()
+
+    @property
+    def layout(self) -> CoordinateMapper:
+        """
+        当前画面的坐标映射，分辨率变化时重新生成，优先使用缓存的校准结果
+        :return:
+        """
+        if self.last_screen is not None:
+            height, width = self.last_screen.shape[:2]
+        else:
+            width, height = self.client.resolution
+        if self._layout is None or (self._layout.width, self._layout.height) != (width, height):
+            from device_manager.calibration import calibration_key, load_cached_mapper
+
+            mapper = load_cached_mapper(calibration_key(self.device.serial, width, height))
+            self._layout = mapper or CoordinateMapper(width, height)
+        return self._layout
+
+    def calibrate(self, frame: 'cv.Mat' = None) -> CoordinateMapper:
+        """
+        用锚点校准坐标映射并缓存，需要在战斗界面调用，能看到轮盘和普通攻击按钮
+        :param frame: 校准用的画面，不传使用最新画面
+        :return:
+        """
+        from device_manager.calibration import calibrate, calibration_key
+
+        frame = self.last_screen if frame is None else frame
+        height, width = frame.shape[:2]
+        self._layout = calibrate(frame, calibration_key(self.device.serial, width, height))
+        return self._layout
+
+    def resolve(self, coordinate: Coordinate) -> Tuple[int, int]:
+        """
+        把归一化坐标换算成当前画面的像素坐标，像素坐标原样返回
+        :param coordinate:
+        :return:
+        """
+        if isinstance(coordinate, LayoutPoint):
+            return self.layout.to_pixels(coordinate)
+        x, y = coordinate
+        return int(x), int(y)
+
+    def _start_client(self, max_fps: int or float):
+        """
+        启动 scrcpy 推流，已经启动的先停掉
+        :param max_fps: 推流帧率
+        :return:
+        """
+        import scrcpy
+
+        if self.client is not None:
+            self.client.stop()
+        client = scrcpy.Client(device=self.device, max_width=self.max_width, max_fps=int(math.ceil(max_fps)))
+        client.add_listener(scrcpy.EVENT_FRAME, self.on_frame)
+        client.add_listener(scrcpy.EVENT_DISCONNECT, lambda: self._on_disconnect(client))
+        self.client = client
+        client.start(threaded=True)
+
+    def _restart_client(self, max_fps: int or float, device=None):
+        """
+        加锁重启推流，重启期间看门狗不检查连接
+        :param max_fps: 推流帧率
+        :param device: 重新找到的设备，不传使用原来的设备
+        :return:
+        """
+        with self._stream_lock:
+            self.restarting = True
+            try:
+                if device is not None:
+                    self.device = device
+                try:
+                    self._start_client(max_fps)
+                except Exception:
+                    if device is None:
+                        raise
+                    # 断线重连时旧的推流可能已经断了，停不掉也要重新启动
+                    self.client = None
+                    self._start_client(max_fps)
+                self.last_frame_time = time.monotonic()
+            finally:
+                self.restarting = False
+
+    def _stream_fps(self) -> float:
+        return self.governor.target_fps if self.reconfigure_stream else self.governor.stream_fps
+
+    def _on_disconnect(self, client):
+        # 主动重启时停掉的旧推流也会触发断开，不用重连
+        if self.restarting or client is not self.client:
+            return
+        self.connection.request_reconnect("推流断开")
+
+    def restart_stream(self, device=None):
+        """
+        重启推流和控制通道，断线重连时由 ConnectionManager 调用，模型和各种回调都保留
+        :param device: 重新找到的设备，不传使用原来的设备
+        :return:
+        """
+        self._restart_client(self._stream_fps(), device or self.device)
+
+    def _on_phase_change(self, old_phase: str, new_phase: str):
+        """
+        阶段切换后推流帧率变了就重启推流
+        :return:
+        """
+        max_fps = int(math.ceil(self._stream_fps()))
+        if self.client is not None and self.client.max_fps != max_fps:
+            logger.info(f"重启推流，帧率 {self.client.max_fps} -> {max_fps}")
+            self._restart_client(max_fps)
+
+    def _sync_model_phase(self, yolo):
+        """
+        把当前阶段同步给识别缓存，模型刚加载完或者热切换后也会同步一次
+        :param yolo: 当前模型
+        :return:
+        """
+        phase = self.governor.phase
+        if self._model_phase == (id(yolo), phase):
+            return
+        set_phase = getattr(yolo, "set_phase", None)
+        if set_phase is not None:
+            set_phase(phase)
+        self._model_phase = id(yolo), phase
+
+    def set_phase(self, phase: str):
+        """
+        切换游戏阶段，调整处理帧率
+        :param phase: GamePhase
+        :return:
+        """
+        update_log_context(phase=phase)
+        self.governor.set_phase(phase)
+
     @staticmethod
-    def init_yolov5():
+    def init_yolov5(model: str = None, cache: bool = False, motion_gate: bool = False, tiled: bool = False) -> ModelLoader:
+        """
+        初始化 yolo v5，后台加载并预热，整个进程共享一份
+        :param model: manifest 里的模型名称，不传使用默认模型
+        :param cache: 是否缓存识别结果
+        :param motion_gate: 是否开启帧差门控
+        :param tiled: 是否开启分块识别
+        :return:
+        """
+        return ModelLoader.shared(num_threads=4, use_gpu=True, model=model, cache=cache, motion_gate=motion_gate,
+                                  tiled=tiled)
+
+    def swap_model(self, model: str, wait: bool = False):
+        """
+        热切换模型，新模型在后台加载预热完成后再替换，切换过程中继续用旧模型识别
+        :param model: manifest 里的模型名称
+        :param wait: 是否等待切换完成
+        :return:
         """
-        初始化 yolo v5
+        loader = self.init_yolov5(model, self.detection_cache, self.motion_gate, self.tiled)
+
+        def _swap():
+            # 当前的模型可能也加载失败了，不能用 self.yolo
+            current = self.model_loader.model
+            old_name = current.name if current is not None else "无"
+            try:
+                loader.get()
+            except Exception as e:
+                logger.error(f"模型 {model} 加载失败，继续使用 {old_name}：{e}")
+                return
+            self.model_loader = loader
+            logger.info(f"模型切换完成：{old_name} -> {model}")
+
+        if wait:
+            _swap()
+        else:
+            threading.Thread(target=contextvars.copy_context().run, args=(_swap,), name="model-swap", daemon=True).start()
+
+    def add_frame_listener(self, listener: Callable[['cv.Mat'], None]):
+        """
+        新帧回调，只回调按当前阶段帧率需要处理的帧
+        回调在推流线程里执行，不要做耗时操作
+        :param listener:
         :return:
         """
-        return YoloV5s(num_threads=4, use_gpu=True)
+        self._frame_listeners.append(listener)
+
+    def remove_frame_listener(self, listener):
+        if listener in self._frame_listeners:
+            self._frame_listeners.remove(listener)
 
-    def on_frame(self, frame: cv.Mat):
+    def add_detection_listener(self, listener: Callable[['cv.Mat', List['Detect_Object'], List[str]], None]):
+        """
+        识别回调，每识别完一帧调用一次，参数为 (帧, 识别结果, 标签名称列表)
+        回调在推流线程里执行，不要做耗时操作
+        :param listener:
+        :return:
+        """
+        self._detection_listeners.append(listener)
+
+    def remove_detection_listener(self, listener):
+        if listener in self._detection_listeners:
+            self._detection_listeners.remove(listener)
+
+    def _notify_detection(self, frame: 'cv.Mat', result: List['Detect_Object'], class_names: List[str]):
+        for listener in self._detection_listeners:
+            try:
+                listener(frame, result, class_names)
+            except Exception as e:
+                logger.error(e)
+
+    def on_frame(self, frame: 'cv.Mat'):
         """
         把当前帧添加到队列里面
         """
         if frame is not None:
             self.last_screen = frame
-            # mac 系统需要把帧添加到队列
+            self.last_frame_time = time.monotonic()
+            startup_timer.mark("first_frame")
+            # 模型还在后台加载，先不做识别；加载失败时报一次错，不要悄悄丢帧
+            if not self.model_loader.ready:
+                if self.model_loader.failed and not self._model_failed:
+                    self._model_failed = True
+                    logger.error(f"模型加载失败，画面不再识别，可以用 swap_model 重新加载：{self.model_loader.error!r}")
+                return
+            if self._model_failed:
+                self._model_failed = False
+                logger.info("模型加载成功，恢复识别")
+            startup_timer.report_once()
+            self._sync_model_phase(self.yolo)
+            # 当前阶段不需要这么高的帧率，只更新最新画面，不做识别
+            if not self.governor.accept():
+                return
+            received = time.monotonic()
+            for listener in self._frame_listeners:
+                try:
+                    listener(frame)
+                except Exception as e:
+                    logger.error(e)
+            # mac 系统需要把帧添加到缓冲区
             if sys.platform.startswith('darwin'):
-                self.frame_queue.put(frame)
+                self.frame_buffer.put(frame)
+            elif self.governor.phase == GamePhase.MENU:
+                # 菜单、加载界面靠界面分类导航，不跑 yolo
+                return
             else:
                 try:
-                    result = self.yolo(frame)
-                    self.picture_frame(frame, result)
+                    if self.pipeline is not None:
+                        # 流水线满了直接丢帧，不阻塞推流
+                        self.pipeline.submit(frame, functools.partial(self._on_detection, received=received),
+                                             classes=self.detect_classes)
+                    else:
+                        # 模型可能被热切换，识别结果和标签要来自同一个模型
+                        yolo = self.yolo
+                        self._on_detection(frame, yolo(frame, classes=self.detect_classes), yolo.class_names,
+                                           received=received)
                 except Exception as e:
                     logger.error(e)
 
+    def _on_detection(self, frame: 'cv.Mat', result: List['Detect_Object'], class_names: List[str],
+                      received: float = None):
+        """
+        一帧识别完成
+        :param received: 收到这一帧的 time.monotonic()，用来算识别延迟
+        :return:
+        """
+        if received is not None:
+            self.record_detection_latency(received)
+        self.picture_frame(frame, result)
+        self._notify_detection(frame, result, class_names)
+
+    def record_detection_latency(self, received: float):
+        """
+        记录一帧从收到到识别完成的延迟，写进日志上下文，之后这个设备的每条结构化日志都带上 detect_ms
+        :param received: 收到这一帧（或者开始识别）的 time.monotonic()
+        :return:
+        """
+        now = time.monotonic()
+        self.last_detection_time = now
+        update_log_context(detect_ms=round((now - received) * 1000, 1))
+
     def display_frames(self):
         """
         渲染帧
         :return:
         """
+        if self.headless:
+            return
         # mac 系统需要把帧添加到队列
         if sys.platform.startswith('darwin'):
+            import cv2 as cv
+
+            display_frames = self.frame_buffer.cursor("display")
             while not self.stop_event.is_set():
                 try:
-                    frame = self.frame_queue.get(timeout=1)
+                    frame = display_frames.get(timeout=1)
                     if frame is not None:
                         cv.imshow('frame', frame)
                         cv.waitKey(1)
@@ -81,65 +416,84 @@ class ScrcpyADB:
                 except Exception as e:
                     logger.error(e)
 
-    def picture_frame(self, frame: cv.Mat, objs: [Detect_Object]):
+    def picture_frame(self, frame: 'cv.Mat', objs: ['Detect_Object'], show: bool = True):
         """
         在 cv 中画出目标框，并显示标签名称和置信度
+        无界面模式下只把帧交给预览输出，不做任何绘制
+        :param frame: 当前帧
+        :param objs: 检测结果
+        :param show: 是否弹窗显示
         :return:
         """
-        font = cv.FONT_HERSHEY_SIMPLEX  # 字体样式
-        font_scale = 1  # 字体大小
-        thickness = 3  # 文本线条厚
-
-        for obj in objs:
-            color = TARGET_COLOUR.get(obj.label)
-            cv.rectangle(frame, (int(obj.rect.x), int(obj.rect.y)), (int(obj.rect.x + obj.rect.w), int(obj.rect.y + + obj.rect.h)), color, 2)
-
-            # 构造显示的标签文本
-            label_text = f"{self.yolo.class_names[int(obj.label)]}:{obj.prob:.2f}"
+        if self.preview is not None:
+            self.preview.submit(frame, objs, self.yolo.class_names)
 
-            # 计算文本位置
-            text_size, _ = cv.getTextSize(label_text, font, font_scale, thickness)
-            text_x = int(obj.rect.x)
-            text_y = int(obj.rect.y - 5)  # 将文本放置在矩形框上方
+        if self.headless or not show:
+            return
 
-            # 如果文本超出边界，则将其放置在矩形框下方
-            if text_y < 0:
-                text_y = int(obj.rect.y + obj.rect.h + 5)
+        import cv2 as cv
+        from device_manager.preview import draw_detections
 
-            # 绘制标签文本
-            cv.putText(frame, label_text, (text_x, text_y), font, font_scale, color, thickness=thickness)
-
-        cv.imshow('frame', frame)
+        # 在副本上画框，避免污染后续还要用来识别的原始帧
+        canvas = draw_detections(frame.copy(), objs, self.yolo.class_names)
+        cv.imshow('frame', canvas)
         cv.waitKey(1)
 
-    def touch_start(self, coordinate: Tuple[int or float, int or float]):
+    def _touch(self, coordinate: Coordinate, action: int, touch_id: int):
+        """
+        发送触摸事件，重连期间直接丢掉这次操作不等待，不阻塞控制循环和 asyncio 的事件循环，也不让控制循环因为断线崩掉
+        :param coordinate: 坐标
+        :param action: scrcpy 的触摸动作
+        :param touch_id: 触点 id
+        :return:
+        """
+        if not self.connection.connected:
+            logger.warning("设备未连接，忽略触摸操作")
+            return
+        x, y = self.resolve(coordinate)
+        try:
+            self.client.control.touch(x, y, action, touch_id)
+        except (OSError, ConnectionError) as e:
+            logger.error(f"触摸操作失败：{e}")
+            self.connection.request_reconnect("控制通道断开")
+
+    def touch_start(self, coordinate: Coordinate, touch_id: int = -1):
         """
         触摸屏幕
         :param coordinate:坐标
+        :param touch_id: 触点 id，同时按住多个位置时每个触点用不同的 id
         :return:
         """
-        x, y = coordinate
-        self.client.control.touch(int(x), int(y), scrcpy.ACTION_DOWN)
+        import scrcpy
+
+        # 从最近一次识别完成到发出操作的延迟，只在按下时记，滑动、抬起是同一个操作的后续
+        if self.last_detection_time:
+            update_log_context(act_ms=round((time.monotonic() - self.last_detection_time) * 1000, 1))
+        self._touch(coordinate, scrcpy.ACTION_DOWN, touch_id)
 
-    def touch_move(self, coordinate: Tuple[int or float, int or float]):
+    def touch_move(self, coordinate: Coordinate, touch_id: int = -1):
         """
         触摸拖动
         :param coordinate: 坐标
+        :param touch_id: 触点 id
         :return:
         """
-        x, y = coordinate
-        self.client.control.touch(int(x), int(y), scrcpy.ACTION_MOVE)
+        import scrcpy
 
-    def touch_end(self, coordinate: Tuple[int or float, int or float] = (0, 0)):
+        self._touch(coordinate, scrcpy.ACTION_MOVE, touch_id)
+
+    def touch_end(self, coordinate: Coordinate = (0, 0), touch_id: int = -1):
         """
         释放触摸
         :param coordinate:坐标
+        :param touch_id: 触点 id，和按下时一致
         :return:
         """
-        x, y = coordinate
-        self.client.control.touch(int(x), int(y), scrcpy.ACTION_UP)
+        import scrcpy
+
+        self._touch(coordinate, scrcpy.ACTION_UP, touch_id)
 
-    def touch(self, coordinate: Tuple[int or float, int or float], t: int or float = 0.5):
+    def touch(self, coordinate: Coordinate, t: int or float = 0.5):
         """
         :param coordinate:坐标
         :param t:按压时间
@@ -149,7 +503,7 @@ class ScrcpyADB:
         time.sleep(t)
         self.touch_end()
 
-    def swipe(self, start_coordinate: Tuple[int or float, int or float], end_coordinate: Tuple[int or float, int or float], t: int or float = 0.5):
+    def swipe(self, start_coordinate: Coordinate, end_coordinate: Coordinate, t: int or float = 0.5):
         """
         实现屏幕拖动（滑动手势）
         :param start_coordinate: 起始点的坐标
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/28
+import atexit
+import contextvars
+import json
+import os
+import queue
+import threading
+import time
+import weakref
+from typing import Optional, TYPE_CHECKING
+
+import cv2 as cv
+
+from utils.logger import logger
+from utils.path_manager import PathManager
+
+if TYPE_CHECKING:
+    from device_manager.scrcpy_adb import ScrcpyADB
+
+# 通过环境变量开启：DNFM_RECORD_SESSION=1 连接设备后就开始录制对局
+RECORD_SESSION_ENV = "DNFM_RECORD_SESSION"
+
+
+class _Stop:
+    pass
+
+
+class SessionRecorder:
+    """
+    对局录制：按固定间隔保存画面，同时记录卡死、过图失败等事件，给难例挖掘用
+    写文件在单独的线程里，推流线程只把帧放进队列，队列满了直接丢帧
+
+    目录结构：
+        data/sessions/20240828_153000/
+            frames/000001.jpg
+            frames.jsonl  每行 {"index", "time", "file"}
+            events.jsonl  每行 {"event", "time", "frame", ...}
+    """
+
+    def __init__(self, adb: 'ScrcpyADB', root: str = PathManager.SESSION_PATH, interval: float = 0.5,
+                 max_frames: int = 5000, quality: int = 90, queue_size: int = 16):
+        """
+        :param adb: 设备
+        :param root: 录制根目录，每次录制一个子目录
+        :param interval: 保存画面的间隔
+        :param max_frames: 最多保存多少帧，超过后只记录事件
+        :param quality: jpg 质量
+        :param queue_size: 待写入的帧数上限
+        """
+        self.adb = adb
+        self.root = root
+        self.interval = interval
+        self.max_frames = max_frames
+        self.quality = quality
+        self.session_dir = None
+        self.frames = 0
+        self.dropped = 0
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._last_saved = 0.0
+        self._frame_index = 0
+
+    def start(self) -> 'SessionRecorder':
+        if self._thread is not None:
+            return self
+        self.session_dir = os.path.join(self.root, time.strftime("%Y%m%d_%H%M%S"))
+        os.makedirs(os.path.join(self.session_dir, "frames"), exist_ok=True)
+        self._thread = threading.Thread(target=contextvars.copy_context().run, args=(self._write_loop,),
+                                        name="session-recorder", daemon=True)
+        self._thread.start()
+        self.adb.add_frame_listener(self._on_frame)
+        with _recorders_lock:
+            _recorders[self.adb] = self
+        logger.info(f"开始录制对局：{self.session_dir}")
+        return self
+
+    def stop(self):
+        """
+        停止录制，队列里的帧写完再退出
+        :return:
+        """
+        if self._thread is None:
+            return
+        self.adb.remove_frame_listener(self._on_frame)
+        with _recorders_lock:
+            if _recorders.get(self.adb) is self:
+                del _recorders[self.adb]
+        self._queue.put(_Stop())
+        self._thread.join(timeout=5)
+        self._thread = None
+        logger.info(f"对局录制结束：保存 {self.frames} 帧，丢弃 {self.dropped} 帧")
+
+    def _on_frame(self, frame: cv.Mat):
+        now = time.time()
+        if now - self._last_saved < self.interval or self._frame_index >= self.max_frames:
+            return
+        self._last_saved = now
+        self._frame_index += 1
+        self._put(("frame", self._frame_index, now, frame))
+
+    def mark(self, event: str, **fields):
+        """
+        记录事件，同时保存当前画面，挖掘时事件前后的帧会被标记成难例
+        :param event: 事件名称，比如 stuck、transition_failed
+        :param fields: 附加信息，需要能序列化成 json
+        :return:
+        """
+        frame = self.adb.last_screen
+        if frame is not None and self._frame_index < self.max_frames:
+            self._frame_index += 1
+            self._put(("frame", self._frame_index, time.time(), frame))
+        self._put(("event", self._frame_index, time.time(), {"event": event, **fields}))
+
+    def _put(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def _write_loop(self):
+        with open(os.path.join(self.session_dir, "frames.jsonl"), "a", encoding="utf-8") as frames_file, \
+                open(os.path.join(self.session_dir, "events.jsonl"), "a", encoding="utf-8") as events_file:
+            while True:
+                item = self._queue.get()
+                if isinstance(item, _Stop):
+                    return
+                kind, index, timestamp, payload = item
+                try:
+                    if kind == "frame":
+                        name = f"{index:06d}.jpg"
+                        cv.imwrite(os.path.join(self.session_dir, "frames", name), payload,
+                                   [cv.IMWRITE_JPEG_QUALITY, self.quality])
+                        frames_file.write(json.dumps({"index": index, "time": timestamp, "file": name}) + "\n")
+                        frames_file.flush()
+                        self.frames += 1
+                    else:
+                        events_file.write(json.dumps({**payload, "time": timestamp, "frame": index}, ensure_ascii=False) + "\n")
+                        events_file.flush()
+                except Exception as e:
+                    logger.error(f"对局录制写入失败：{e}")
+
+
+_recorders: 'weakref.WeakKeyDictionary[ScrcpyADB, SessionRecorder]' = weakref.WeakKeyDictionary()
+_recorders_lock = threading.Lock()
+
+
+def get_session_recorder(adb: 'ScrcpyADB') -> Optional[SessionRecorder]:
+    """
+    获取设备正在进行的录制，没有录制返回 None
+    :param adb:
+    :return:
+    """
+    with _recorders_lock:
+        return _recorders.get(adb)
+
+
+def record_event(adb: 'ScrcpyADB', event: str, **fields):
+    """
+    记录事件，设备没有在录制时什么都不做
+    :param adb: 设备
+    :param event: 事件名称
+    :param fields: 附加信息
+    :return:
+    """
+    recorder = get_session_recorder(adb)
+    if recorder is not None:
+        recorder.mark(event, **fields)
+
+
+def start_session_recorder(adb: 'ScrcpyADB', record: bool = None) -> Optional[SessionRecorder]:
+    """
+    按参数或者环境变量开始录制对局，退出时把队列里的帧写完
+    :param adb: 设备
+    :param record: 是否录制，不传看 DNFM_RECORD_SESSION
+    :return: 没有开启返回 None
+    """
+    if record is None:
+        record = os.environ.get(RECORD_SESSION_ENV, "") not in ("", "0")
+    if not record:
+        return None
+    recorder = SessionRecorder(adb).start()
+    atexit.register(recorder.stop)
+    return recorder
@@ -0,0 +1,357 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/22
+import asyncio
+import inspect
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, List, Optional, Set, TYPE_CHECKING
+
+from data.coordinate.game_coordinate import attack, roulette_wheel
+from device_manager.frame_rate import GamePhase
+from device_manager.scrcpy_adb import Coordinate, ScrcpyADB
+from game.dengeon.game_state import GameState, GameStateStore, get_state_store
+from utils.logger import logger
+
+if TYPE_CHECKING:
+    import cv2 as cv
+    from game.hero_control.hero_control_base import HeroControlBase
+
+
+class LatestValue:
+    """
+    推流线程里产生、事件循环里等待的值，只保留最新的一份，处理慢的协程不会积压旧帧
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._waiters: List[asyncio.Future] = []
+        self.value = None
+        self.seq = 0
+
+    def set_threadsafe(self, value):
+        """
+        在其他线程里更新值
+        :param value:
+        :return:
+        """
+        self._loop.call_soon_threadsafe(self._set, value)
+
+    def _set(self, value):
+        self.value = value
+        self.seq += 1
+        waiters, self._waiters = self._waiters, []
+        for fut in waiters:
+            if not fut.done():
+                fut.set_result(value)
+
+    async def next(self, timeout: float = None):
+        """
+        等待下一个值
+        :param timeout: 超时抛出 asyncio.TimeoutError
+        :return:
+        """
+        fut = self._loop.create_future()
+        self._waiters.append(fut)
+        return await asyncio.wait_for(fut, timeout)
+
+
+class AsyncInput:
+    """
+    异步输入回放，按下和抬起之间用 asyncio.sleep 等待，不占线程
+    每个触点分配独立的 touch id，可以一边按住轮盘移动一边放技能
+    """
+    MAX_POINTERS = 10
+
+    def __init__(self, adb: ScrcpyADB):
+        self.adb = adb
+        self._free_ids = list(range(self.MAX_POINTERS))
+        self._positions = {}
+
+    @asynccontextmanager
+    async def pointer(self, coordinate: Coordinate):
+        """
+        按下一个触点，退出时抬起
+        :param coordinate: 按下的位置
+        :return: 触点 id，可以用来 move
+        """
+        if not self._free_ids:
+            raise RuntimeError("没有空闲的触点")
+        touch_id = self._free_ids.pop(0)
+        self.adb.touch_start(coordinate, touch_id)
+        self._positions[touch_id] = coordinate
+        try:
+            yield touch_id
+        finally:
+            # 在最后的位置抬起，不然滑动结束时触点会跳回起点
+            self.adb.touch_end(self._positions.pop(touch_id), touch_id)
+            self._free_ids.append(touch_id)
+
+    def move(self, touch_id: int, coordinate: Coordinate):
+        """
+        拖动已经按下的触点
+        :param touch_id:
+        :param coordinate:
+        :return:
+        """
+        self.adb.touch_move(coordinate, touch_id)
+        self._positions[touch_id] = coordinate
+
+    async def tap(self, coordinate: Coordinate, t: float = 0.1):
+        """
+        点击
+        :param coordinate:
+        :param t: 按压时间
+        :return:
+        """
+        async with self.pointer(coordinate):
+            await asyncio.sleep(t)
+
+    async def swipe(self, start: Coordinate, end: Coordinate, t: float = 0.5):
+        """
+        滑动，和 ScrcpyADB.swipe 的时序一致
+        :param start:
+        :param end:
+        :param t: 滑到终点后按住的时间
+        :return:
+        """
+        async with self.pointer(start) as touch_id:
+            await asyncio.sleep(0.1)
+            self.move(touch_id, end)
+            await asyncio.sleep(t)
+
+
+class AsyncHeroControl:
+    """
+    英雄控制的异步版本，坐标计算复用同步的英雄控制
+    """
+
+    def __init__(self, hero_ctrl: 'HeroControlBase', input_: AsyncInput):
+        self.hero_ctrl = hero_ctrl
+        self.input = input_
+
+    async def move(self, angle: float, t: float = 0.5):
+        """
+        角色移动，移动期间可以同时放技能
+        :param angle:
+        :param t:
+        :return:
+        """
+        await self.input.swipe(roulette_wheel, self.hero_ctrl.calc_mov_point(angle), t)
+
+    async def normal_attack(self, t: float = 1):
+        await self.input.tap(attack, t)
+
+    async def skill_attack(self, skill_coordinate: Coordinate, t: float = 0.1):
+        await self.input.tap(skill_coordinate, t)
+
+    async def combination_skill_attack(self, skill_coordinates: List[Coordinate], interval: float = 0.5):
+        """
+        组合技能攻击
+        :param skill_coordinates:
+        :param interval: 技能间隔
+        :return:
+        """
+        for skill_coordinate in skill_coordinates:
+            await self.skill_attack(skill_coordinate)
+            await asyncio.sleep(interval)
+
+
+class AsyncRuntime:
+    """
+    基于 asyncio 的控制运行时
+    新帧、识别结果、输入回放、定时器都是可以 await 的对象，一个事件循环里可以同时跑多个行为，
+    比如一边移动一边放技能、后台盯着死亡或弹窗界面，不用每个任务开一个线程
+    同步的 GameAction 不受影响，两种写法可以混用
+    """
+
+    def __init__(self, adb: ScrcpyADB, state_store: GameStateStore = None):
+        self.adb = adb
+        self.state_store = state_store or get_state_store(adb)
+        self.input = AsyncInput(adb)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._frames: Optional[LatestValue] = None
+        self._states: Optional[LatestValue] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._unsubscribe = None
+        # mac 上推流线程不做识别，放到单独的线程里识别，识别期间来的帧只保留最新的
+        self._executor = None
+        self._detecting = False
+
+    def hero(self, hero_ctrl: 'HeroControlBase') -> AsyncHeroControl:
+        return AsyncHeroControl(hero_ctrl, self.input)
+
+    def _attach(self):
+        self.loop = asyncio.get_running_loop()
+        self._frames = LatestValue(self.loop)
+        self._states = LatestValue(self.loop)
+        self.adb.add_frame_listener(self._on_frame)
+        self._unsubscribe = self.state_store.subscribe(self._states.set_threadsafe)
+        if sys.platform.startswith("darwin"):
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="async-detect")
+
+    def _detach(self):
+        self.adb.remove_frame_listener(self._on_frame)
+        if self._unsubscribe is not None:
+            self._unsubscribe()
+            self._unsubscribe = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def _on_frame(self, frame: 'cv.Mat'):
+        # 推流线程里调用
+        self._frames.set_threadsafe(frame)
+        # 和推流线程一样，菜单阶段不跑 yolo
+        if self._executor is not None and not self._detecting and self.adb.governor.phase != GamePhase.MENU:
+            self._detecting = True
+            self._executor.submit(self._detect, frame)
+
+    def _detect(self, frame: 'cv.Mat'):
+        try:
+            yolo = self.adb.yolo
+            start = time.monotonic()
+            result = yolo(frame, classes=self.adb.detect_classes)
+            self.adb.record_detection_latency(start)
+            self.adb.picture_frame(frame, result, show=False)
+            self.state_store.publish(frame, result, yolo.class_names)
+        except Exception as e:
+            logger.error(e)
+        finally:
+            self._detecting = False
+
+    async def next_frame(self, timeout: float = None) -> 'cv.Mat':
+        """
+        等待下一帧
+        :param timeout: 超时抛出 asyncio.TimeoutError
+        :return:
+        """
+        return await self._frames.next(timeout)
+
+    async def next_state(self, timeout: float = None) -> GameState:
+        """
+        等待下一帧的识别结果
+        :param timeout: 超时抛出 asyncio.TimeoutError
+        :return:
+        """
+        return await self._states.next(timeout)
+
+    async def wait_state(self, predicate: Callable[[GameState], bool], timeout: float = None) -> GameState:
+        """
+        等待游戏状态满足条件，比如 await runtime.wait_state(lambda s: not s.monsters, 5)
+        :param predicate: 条件
+        :param timeout: 超时抛出 asyncio.TimeoutError
+        :return:
+        """
+
+        async def _wait():
+            while True:
+                state = await self._states.next()
+                if predicate(state):
+                    return state
+
+        return await asyncio.wait_for(_wait(), timeout)
+
+    async def states(self):
+        """
+        逐帧遍历识别结果，处理慢的时候跳过中间的帧
+        :return:
+        """
+        while True:
+            yield await self._states.next()
+
+    def spawn(self, coro: Awaitable, name: str = None) -> asyncio.Task:
+        """
+        启动一个后台行为，运行时退出时统一取消，异常只记日志不影响其他行为
+        :param coro:
+        :param name:
+        :return:
+        """
+        task = asyncio.ensure_future(coro)
+        if name:
+            task.set_name(name)
+        self._tasks.add(task)
+        task.add_done_callback(self._on_task_done)
+        return task
+
+    def _on_task_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"后台任务 {task.get_name()} 异常退出：{task.exception()!r}")
+
+    def every(self, interval: float, func: Callable[[], Any], name: str = None) -> asyncio.Task:
+        """
+        按固定间隔执行，按事件循环时钟对齐，不会因为执行耗时累积误差
+        :param interval: 间隔秒数
+        :param func: 普通函数或者协程函数
+        :param name:
+        :return:
+        """
+
+        async def _timer():
+            next_time = self.loop.time()
+            while True:
+                result = func()
+                if inspect.isawaitable(result):
+                    await result
+                next_time += interval
+                await asyncio.sleep(max(0.0, next_time - self.loop.time()))
+
+        return self.spawn(_timer(), name)
+
+    def watch(self, predicate: Callable[[GameState], bool], handler: Callable[[GameState], Any],
+              cooldown: float = 1.0, name: str = None) -> asyncio.Task:
+        """
+        后台盯着识别结果，条件成立时调用处理函数，比如死亡、弹窗
+        :param predicate: 条件
+        :param handler: 普通函数或者协程函数，参数为触发时的状态
+        :param cooldown: 触发后的冷却时间，避免同一个界面连续触发
+        :param name:
+        :return:
+        """
+
+        async def _watch():
+            async for state in self.states():
+                if predicate(state):
+                    result = handler(state)
+                    if inspect.isawaitable(result):
+                        await result
+                    await asyncio.sleep(cooldown)
+
+        return self.spawn(_watch(), name)
+
+    async def run(self, main: Callable[['AsyncRuntime'], Awaitable]):
+        """
+        运行主协程，结束时取消所有后台行为
+        :param main: 协程函数，参数为运行时
+        :return:
+        """
+        self._attach()
+        try:
+            return await main(self)
+        finally:
+            for task in list(self._tasks):
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            self._detach()
+
+
+if __name__ == '__main__':
+    from data.coordinate.game_coordinate import skill2, skill3
+    from game.hero_control.hero_control import get_hero_control
+
+    sadb = ScrcpyADB()
+
+    async def demo(runtime: AsyncRuntime):
+        hero = runtime.hero(get_hero_control("nv_qi_gong", sadb))
+        runtime.watch(lambda s: s.transition, lambda s: logger.info("正在过图"))
+        runtime.every(5, lambda: logger.info(sadb.governor.format_stats()))
+        # 一边移动一边放技能
+        await asyncio.gather(hero.move(0, 2), hero.combination_skill_attack([skill2, skill3]))
+        state = await runtime.wait_state(lambda s: s.hero is not None, timeout=10)
+        logger.info(state)
+
+    asyncio.run(AsyncRuntime(sadb).run(demo))
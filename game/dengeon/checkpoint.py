@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/30
+import json
+import os
+import tempfile
+import time
+from dataclasses import asdict, dataclass, field
+from typing import List, Optional, Tuple
+
+from utils.logger import logger
+from utils.path_manager import PathManager
+
+
+@dataclass
+class ChallengeCheckpoint:
+    """
+    副本挑战的进度，进程崩溃重启后从这里继续
+    """
+    hero_name: str
+    dungeon_name: str
+    path_name: str = "boss"  # boss / full，当前这一把走的路线
+    path_index: int = 0  # 当前房间在路线里的下标
+    room_coordinate: Tuple[int, int] = (0, 0)
+    completed_rooms: List[Tuple[int, int]] = field(default_factory=list)  # 这一把已经通过的房间
+    runs: int = 0  # 已经通关的次数
+    items_picked: int = 0  # 累计捡的材料数
+    fatigue_value: Optional[int] = None
+    updated_at: float = 0.0
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'ChallengeCheckpoint':
+        data = {**data}
+        data["room_coordinate"] = tuple(data.get("room_coordinate", (0, 0)))
+        data["completed_rooms"] = [tuple(room) for room in data.get("completed_rooms", [])]
+        return cls(**{key: value for key, value in data.items() if key in cls.__dataclass_fields__})
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class CheckpointStore:
+    """
+    进度存档，每个角色 + 副本一个文件，先写临时文件再原子替换，写到一半崩溃也不会留下坏文件
+    """
+
+    def __init__(self, path: str = PathManager.CHECKPOINT_PATH, max_age: float = 30 * 60, min_interval: float = 5.0):
+        """
+        :param path: 存档目录
+        :param max_age: 存档有效时间，超过就当作没有存档
+        :param min_interval: maybe_save 的最小保存间隔
+        """
+        self.path = path
+        self.max_age = max_age
+        self.min_interval = min_interval
+        self._last_save = 0.0
+
+    def file(self, hero_name: str, dungeon_name: str) -> str:
+        return os.path.join(self.path, f"{hero_name}_{dungeon_name}.json")
+
+    def save(self, checkpoint: ChallengeCheckpoint):
+        """
+        立即保存
+        :param checkpoint:
+        :return:
+        """
+        checkpoint.updated_at = time.time()
+        target = self.file(checkpoint.hero_name, checkpoint.dungeon_name)
+        os.makedirs(self.path, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.path, prefix=".checkpoint_", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(checkpoint.to_dict(), f, ensure_ascii=False, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, target)
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self._last_save = time.monotonic()
+
+    def maybe_save(self, checkpoint: ChallengeCheckpoint) -> bool:
+        """
+        距离上次保存超过最小间隔才保存，控制循环里可以每轮调用
+        :param checkpoint:
+        :return: 是否保存了
+        """
+        if time.monotonic() - self._last_save < self.min_interval:
+            return False
+        try:
+            self.save(checkpoint)
+        except OSError as e:
+            logger.error(f"保存进度失败：{e}")
+            return False
+        return True
+
+    def load(self, hero_name: str, dungeon_name: str) -> Optional[ChallengeCheckpoint]:
+        """
+        读取存档，不存在、损坏或者过期返回 None
+        :param hero_name: 角色
+        :param dungeon_name: 副本
+        :return:
+        """
+        target = self.file(hero_name, dungeon_name)
+        if not os.path.exists(target):
+            return None
+        try:
+            with open(target, encoding="utf-8") as f:
+                checkpoint = ChallengeCheckpoint.from_dict(json.load(f))
+        except (ValueError, TypeError) as e:
+            logger.error(f"进度存档损坏，忽略：{e}")
+            return None
+        if self.max_age and time.time() - checkpoint.updated_at > self.max_age:
+            logger.info("进度存档已过期，忽略")
+            return None
+        return checkpoint
+
+    def clear(self, hero_name: str, dungeon_name: str):
+        target = self.file(hero_name, dungeon_name)
+        if os.path.exists(target):
+            os.remove(target)
+
+
+def locate_room_on_minimap(state, coordinates: List[Tuple[int, int]]) -> Optional[Tuple[int, int]]:
+    """
+    根据小地图（map）和英雄所在位置（point）的识别结果推算当前房间
+    小地图按副本所有房间的坐标范围等分成格子，房间坐标 x 向右增大、y 向上增大
+    :param state: GameState
+    :param coordinates: 副本所有房间的坐标
+    :return: 推算出的房间，识别不到或者不在房间列表里返回 None
+    """
+    maps = state.objects("map")
+    points = state.objects("point")
+    if len(maps) != 1 or len(points) != 1 or not coordinates:
+        return None
+    rect = maps[0].rect
+    point = points[0].rect
+    if rect.w <= 0 or rect.h <= 0:
+        return None
+    xs = [c[0] for c in coordinates]
+    ys = [c[1] for c in coordinates]
+    cols = max(xs) - min(xs) + 1
+    rows = max(ys) - min(ys) + 1
+    rel_x = (point.x + point.w / 2 - rect.x) / rect.w
+    rel_y = (point.y + point.h / 2 - rect.y) / rect.h
+    if not (0 <= rel_x < 1 and 0 <= rel_y < 1):
+        return None
+    room = (min(xs) + int(rel_x * cols), max(ys) - int(rel_y * rows))
+    return room if room in coordinates else None
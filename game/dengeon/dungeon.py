@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/17
+import json
+
+from utils.path_manager import PathManager
+
+
+class DungeonInfo:
+    """
+    副本信息，从 data/dungeon_info.json 读取
+    房间坐标统一转成元组，可以直接作为字典的 key
+    """
+
+    def __init__(self, dungeon_name: str):
+        with open(PathManager.DUNGEON_INFO_PATH, encoding="utf-8") as f:
+            dungeon_info = json.load(f)
+        if dungeon_name not in dungeon_info:
+            raise ValueError(f'{dungeon_name} is not support')
+
+        info = dungeon_info[dungeon_name]
+        self.name = dungeon_name
+        self.cn_name = info["cn_name"]
+        self.en_name = info["en_name"]
+        self.coordinates = [tuple(c) for c in info["coordinates"]]
+        self.boss_path = [tuple(c) for c in info["boss_path"]]
+        self.full_figure_path = [tuple(c) for c in info["full_figure_path"]]
+        self.szt = tuple(info["szt"])
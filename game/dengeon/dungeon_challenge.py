@@ -3,133 +3,334 @@
 # @Author  : huxiansheng (you@example.org)
 # @Date    : 2024/8/7
 
+import time
+
+from data.coordinate.game_coordinate import fatigue_region
+from device_manager.frame_rate import GamePhase
 from device_manager.scrcpy_adb import ScrcpyADB
+from game.dengeon.checkpoint import ChallengeCheckpoint, CheckpointStore, locate_room_on_minimap
 from game.dengeon.dungeon import DungeonInfo
 from game.dengeon.map_action import GameAction
-from utils.logger import logger
+from game.ui.screen_classifier import Screen
+from game.ui.state_machine import MenuStateMachine
+from utils.digit_reader import DigitReader, crop_region
+from utils.logger import logger, update_log_context
 
 
 class DungeonChallenge:
     """
     副本挑战
     """
+    UNKNOWN_FATIGUE_VALUE = 999  # 疲劳值识别失败时的默认值
 
-    def __init__(self, hero_name: str, dungeon_name: str, adb: ScrcpyADB):
+    def __init__(self, hero_name: str, dungeon_name: str, adb: ScrcpyADB, checkpoints: CheckpointStore = None,
+                 allow_blind: bool = False):
+        """
+        :param hero_name: 角色
+        :param dungeon_name: 副本
+        :param adb: 设备
+        :param checkpoints: 进度存档，不传使用默认目录
+        :param allow_blind: 菜单界面没有录制指纹时是否按固定延时盲点，默认直接报错
+        """
+        self.hero_name = hero_name
         self.game_action = GameAction(hero_name, adb)
         self.dungeon = DungeonInfo(dungeon_name)
+        self.ui = MenuStateMachine(adb, allow_blind=allow_blind)
         self.room_coordinate = 0, 0  # 当前地图坐标
+        self.digit_reader = DigitReader()
+        self.fatigue_value = None  # 最近一次识别到的疲劳值
+        self.checkpoints = checkpoints or CheckpointStore()
+        self.checkpoint = ChallengeCheckpoint(hero_name, dungeon_name)
 
-    def move_to_dungeon(self, dungeon_name: str):
+    def move_to_dungeon(self, dungeon_name: str = None) -> bool:
         """
         移动到副本门口
         :return:
         """
-        pass
+        dungeon_name = dungeon_name or self.dungeon.name
+        return self.ui.navigate(Screen.DUNGEON_SELECT, dungeon_name, start=Screen.TOWN)
 
-    def select_and_challenge_dungeon(self, dungeon_name: str):
+    def select_and_challenge_dungeon(self, dungeon_name: str = None) -> bool:
         """
         选择并挑战副本
         :return:
         """
-        pass
+        dungeon_name = dungeon_name or self.dungeon.name
+        if not self.ui.navigate(Screen.BATTLE, dungeon_name, start=Screen.DUNGEON_SELECT):
+            return False
+        self.enter_battle()
+        return True
+
+    def enter_battle(self):
+        """
+        进入副本，切回过图阶段，菜单阶段推流线程不跑 yolo，拿不到游戏状态
+        :return:
+        """
+        self.game_action.adb.set_phase(GamePhase.TRANSITION)
 
     def determine_fatigue_value(self) -> int:
         """
-        检测当前角色的疲劳值
+        检测当前角色的疲劳值，识别失败沿用上一次的值
         :return:
         """
-        pass
+        adb = self.game_action.adb
+        frame = adb.last_screen
+        value = None
+        if frame is not None:
+            top_left, bottom_right = fatigue_region
+            roi = crop_region(frame, adb.resolve(top_left), adb.resolve(bottom_right))
+            try:
+                value = self.digit_reader.read_int(roi, separator="/")
+            except FileNotFoundError as e:
+                logger.error(f"疲劳值字符模板不存在：{e}")
+
+        if value is not None:
+            self.fatigue_value = value
+        elif self.fatigue_value is None:
+            # 从来没识别成功过，按疲劳充足处理，真没疲劳了游戏会拒绝进图
+            logger.info("疲劳值识别失败，按疲劳充足处理")
+            return self.UNKNOWN_FATIGUE_VALUE
+        return self.fatigue_value
 
-    def calculate_the_direction_of_the_next_room(self, room_coordinate) -> str:
+    @staticmethod
+    def calculate_the_direction_of_the_next_room(room_coordinate, next_room_coordinate) -> str:
         """
         计算下一个房间的方向
         :param room_coordinate: 当前房间的坐标
+        :param next_room_coordinate: 下一个房间的坐标
         :return:
         """
+        dx = next_room_coordinate[0] - room_coordinate[0]
+        dy = next_room_coordinate[1] - room_coordinate[1]
+        if dx > 0:
+            return "right"
+        elif dx < 0:
+            return "left"
+        elif dy > 0:
+            return "up"
+        else:
+            return "down"
 
     def reward_flip(self):
         """
         通关后翻牌
         :return:
         """
-        pass
+        state = self.game_action.next_state()
+        cards = state.objects("card") if state else []
+        if cards:
+            card = cards[0]
+            logger.info("翻牌")
+            self.game_action.adb.touch((card.rect.x + card.rect.w / 2, card.rect.y + card.rect.h / 2), 0.1)
+        # 等翻牌动画结束，没有结算界面的指纹时等卡片消失
+        screens = [Screen.SETTLEMENT, Screen.BATTLE]
+        if self.ui.recognizable(screens):
+            self.ui.wait_for(screens, timeout=5)
+        else:
+            self.game_action.wait_until(lambda s: not s.rewards, timeout=5)
 
-    def again_challenge(self):
+    def again_challenge(self) -> bool:
         """
         再次挑战
         :return:
         """
-        pass
+        self.game_action.adb.set_phase(GamePhase.MENU)
+        if not self.ui.go(Screen.SETTLEMENT, Screen.BATTLE, self.dungeon.name):
+            return False
+        self.enter_battle()
+        return True
 
-    def exit_dungeon(self):
+    def exit_dungeon(self) -> bool:
         """
         退出副本
         :return:
         """
-        pass
+        self.game_action.adb.set_phase(GamePhase.MENU)
+        return self.ui.go(Screen.SETTLEMENT, Screen.TOWN, self.dungeon.name)
+
+    def clearance_path(self, path_name: str) -> list:
+        return self.dungeon.full_figure_path if path_name == "full" else self.dungeon.boss_path
+
+    def save_checkpoint(self, path_name: str, index: int, force: bool = False):
+        """
+        保存进度，force 为 False 时按最小间隔保存
+        :param path_name: 路线
+        :param index: 当前房间在路线里的下标
+        :param force: 是否立即保存
+        :return:
+        """
+        checkpoint = self.checkpoint
+        checkpoint.path_name = path_name
+        checkpoint.path_index = index
+        checkpoint.room_coordinate = self.room_coordinate
+        checkpoint.items_picked = self.game_action.items_picked
+        checkpoint.fatigue_value = self.fatigue_value
+        if not force:
+            self.checkpoints.maybe_save(checkpoint)
+            return
+        try:
+            self.checkpoints.save(checkpoint)
+        except OSError as e:
+            logger.error(f"保存进度失败：{e}")
+
+    def locate_in_dungeon(self, timeout: float = 2):
+        """
+        判断当前是不是在副本里，不依赖界面指纹：小地图只在副本里出现，翻牌界面能识别到卡片
+        录制了指纹的界面先用指纹判断，明确不在副本里时不用再等识别结果
+        :param timeout: 等待识别结果的时间
+        :return: (界面, 识别到的状态)，不在副本里返回 (None, None)
+        """
+        in_dungeon = (Screen.BATTLE, Screen.LOADING, Screen.REWARD, Screen.SETTLEMENT)
+        screen = self.ui.current_screen()
+        if screen != Screen.UNKNOWN and screen not in in_dungeon:
+            return None, None
+        # 菜单阶段不跑 yolo，先按在副本里处理，不在再切回菜单
+        self.enter_battle()
+        if screen in (Screen.REWARD, Screen.SETTLEMENT):
+            return screen, None
+
+        state = self.game_action.wait_until(lambda s: bool(s.objects("map") or s.rewards), timeout)
+        if state is None:
+            self.game_action.adb.set_phase(GamePhase.MENU)
+            return None, None
+        if state.rewards and not state.objects("map"):
+            return Screen.REWARD, state
+        return Screen.BATTLE, state
+
+    def resume(self):
+        """
+        读取进度存档，和当前画面对一下，还在副本里就从存档的房间继续
+        :return: (路线, 房间下标)，不能继续返回 None
+        """
+        checkpoint = self.checkpoints.load(self.hero_name, self.dungeon.name)
+        if checkpoint is None:
+            return None
+        # 累计的次数不管能不能继续都保留
+        self.checkpoint = checkpoint
+        self.game_action.items_picked = checkpoint.items_picked
+        self.fatigue_value = checkpoint.fatigue_value
+
+        screen, state = self.locate_in_dungeon()
+        if screen is None:
+            logger.info("不在副本里，不从存档继续")
+            return None
+
+        path = self.clearance_path(checkpoint.path_name)
+        index = min(checkpoint.path_index, len(path) - 1)
+        if screen in (Screen.REWARD, Screen.SETTLEMENT):
+            # 已经打完 boss 了
+            index = len(path) - 1
+        elif screen == Screen.BATTLE:
+            room = locate_room_on_minimap(state, self.dungeon.coordinates) if state else None
+            if room in path and path[index] != room:
+                # 同一个房间可能在路线里出现多次，取离存档最近的
+                index = min((i for i, c in enumerate(path) if c == room), key=lambda i: abs(i - index))
+                logger.info(f"小地图显示在房间 {room}，存档记录的是 {checkpoint.room_coordinate}，以小地图为准")
+        logger.info(f"从存档继续：{checkpoint.path_name} 路线第 {index + 1} 个房间 {path[index]}，已通关 {checkpoint.runs} 次")
+        return checkpoint.path_name, index
 
     def run(self):
         """
-        挑战副本主入口
+        挑战副本主入口，有进度存档并且还在副本里时从存档的房间继续
+        没有疲劳值字符模板时不开始，否则 PL 用完也停不下来
         :return:
         """
-        # 没有 PL 了
-        if self.determine_fatigue_value() <= 0:
+        if not self.digit_reader.has_templates():
+            logger.error(f"{self.digit_reader.glyph_dir}{self.digit_reader.font} 下没有疲劳值字符模板，判断不了 PL 什么时候用完，不开始刷图；"
+                         f"先截一张疲劳值的图，用 utils.digit_reader.extract_glyphs 生成模板")
             return False
+        resume = self.resume()
+        if resume is None:
+            # 没有 PL 了
+            if self.determine_fatigue_value() <= 0:
+                return False
 
-        # 移动，选择副本
-        self.move_to_dungeon()
-        self.select_and_challenge_dungeon()
+            # 移动，选择副本
+            self.game_action.adb.set_phase(GamePhase.MENU)
+            if not self.move_to_dungeon() or not self.select_and_challenge_dungeon():
+                logger.error("进入副本失败")
+                return False
 
         # 循环通关路线
         while 1:
-            # 根据当前角色的 PL 判断要怎么刷图
-            fatigue_value = self.determine_fatigue_value()
-            if fatigue_value <= len(self.dungeon.boss_path):
-                clearance_path = self.dungeon.full_figure_path
+            if resume is not None:
+                path_name, start_index = resume
+                resume = None
             else:
-                clearance_path = self.dungeon.boss_path
+                # 根据当前角色的 PL 判断要怎么刷图
+                fatigue_value = self.determine_fatigue_value()
+                path_name = "full" if fatigue_value <= len(self.dungeon.boss_path) else "boss"
+                start_index = 0
+                self.checkpoint.completed_rooms = []
+            clearance_path = self.clearance_path(path_name)
 
-            for room_coordinate in clearance_path:
-                kill_monsters = get_items = move = boss_room = False
+            for index in range(start_index, len(clearance_path)):
+                room_coordinate = clearance_path[index]
+                self.room_coordinate = room_coordinate
+                update_log_context(room=f"{room_coordinate[0]},{room_coordinate[1]}")
+                self.save_checkpoint(path_name, index, force=True)
+                boss_room = False
+                # 加载、结算界面录制了指纹才按界面判断，否则全靠 yolo 的识别结果
+                track_screens = self.ui.recognizable([Screen.LOADING, Screen.REWARD, Screen.SETTLEMENT])
 
                 # 根据坐标判断当前在哪个房间
                 if room_coordinate == self.dungeon.szt:
                     logger.info("进入狮子头房间")
-                elif room_coordinate == clearance_path[-1]:
+                elif index == len(clearance_path) - 1:
                     logger.info("进入 Boss 房间")
                     boss_room = True
                 else:
                     logger.info(f"进入房间：{room_coordinate}")
 
                 while 1:
-                    # 获取当前房间信息，判断房间状态，打怪>捡东西>移动
-                    map_info = self.game_action.get_map_info()
+                    # 加载中只等界面切换，不去拿游戏状态
+                    screen = self.ui.current_screen() if track_screens else Screen.UNKNOWN
+                    if screen == Screen.LOADING:
+                        time.sleep(self.ui.poll_interval)
+                        continue
+
+                    if boss_room and screen == Screen.SETTLEMENT:
+                        state = None
+                    else:
+                        # 获取当前房间状态，打怪>捡东西>移动
+                        state = self.game_action.next_state()
+                        if state is None:
+                            continue
+                    self.save_checkpoint(path_name, index)
+
                     if boss_room:
                         # 打怪->翻牌->捡东西->再次挑战
-                        if self.game_action.is_exist_monster(map_info):
-                            kill_monsters = self.game_action.room_kill_monsters(room_coordinate)
-                        elif self.game_action.is_exist_reward(map_info):
+                        if state and state.monsters:
+                            self.game_action.room_kill_monsters(room_coordinate)
+                        elif screen == Screen.REWARD or (state and state.rewards):
                             self.reward_flip()
-                        elif self.game_action.is_exist_item(map_info):
-                            get_items = self.game_action.get_items()
+                        elif state and state.items:
+                            self.game_action.get_items()
                         else:
+                            self.checkpoint.runs += 1
+                            self.checkpoint.completed_rooms = []
                             fatigue_value = self.determine_fatigue_value()
                             if fatigue_value <= 0:
                                 logger.info("PL 耗尽")
                                 self.exit_dungeon()
+                                self.checkpoints.clear(self.hero_name, self.dungeon.name)
                                 return True
                             else:
-                                self.again_challenge()
+                                # 重新进图前先存一下，这时候崩溃重启会从新一把的第一个房间开始
+                                self.save_checkpoint(path_name, 0, force=True)
+                                if not self.again_challenge():
+                                    logger.error("没有找到再次挑战按钮")
+                                    return False
                                 break
                     else:
                         # 打怪->捡东西->移动
-                        if self.game_action.is_exist_monster(map_info):
-                            kill_monsters = self.game_action.room_kill_monsters(room_coordinate)
-                        elif self.game_action.is_exist_item(map_info):
-                            get_items = self.game_action.get_items()
+                        if state.monsters:
+                            self.game_action.room_kill_monsters(room_coordinate)
+                        elif state.items:
+                            self.game_action.get_items()
                         else:
-                            direction = self.calculate_the_direction_of_the_next_room(room_coordinate)
-                            move = self.game_action.mov_to_next_room(direction)
-                        if kill_monsters and get_items and move:
-                            break
+                            direction = self.calculate_the_direction_of_the_next_room(room_coordinate, clearance_path[index + 1])
+                            # 过图成功返回 True，失败返回 (False, 原因)
+                            if self.game_action.mov_to_next_room(direction) is True:
+                                self.checkpoint.completed_rooms.append(room_coordinate)
+                                break
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/21
+import threading
+import time
+import weakref
+from typing import Callable, List, Optional, Tuple, TYPE_CHECKING
+
+from utils.logger import logger
+
+if TYPE_CHECKING:
+    import cv2 as cv
+    from ncnn.utils.objects import Detect_Object
+    from device_manager.scrcpy_adb import ScrcpyADB
+
+Point = Tuple[int, int]
+
+MONSTER_LABELS = ("Monster", "Monster_ds", "Monster_szt")
+ITEM_LABEL = "equipment"
+REWARD_LABEL = "card"
+MARK_LABEL = "go"
+
+
+def get_detect_obj_bottom(obj: 'Detect_Object') -> Point:
+    """
+    获取检测对象的底部坐标
+    :param obj:
+    :return:
+    """
+    return int(obj.rect.x + obj.rect.w / 2), int(obj.rect.y + obj.rect.h)
+
+
+def build_map_info(result: List['Detect_Object'], class_names: List[str]) -> dict:
+    """
+    把识别结果按标签整理成地图信息
+    :param result: 识别结果
+    :param class_names: 标签名称列表
+    :return: {标签: {"count": 数量, "objects": 识别结果, "bottom_centers": 底部坐标}}
+    """
+    result_dict = {label: [] for label in class_names}
+    for detection in result:
+        label = class_names[int(detection.label)]
+        if label in result_dict:
+            result_dict[label].append(detection)
+
+    return {
+        label: {
+            "count": len(objects),
+            "objects": objects,
+            "bottom_centers": [get_detect_obj_bottom(obj) for obj in objects],
+        }
+        for label, objects in result_dict.items()
+    }
+
+
+def is_blank_frame(frame: 'cv.Mat', tolerance: int = 10) -> bool:
+    """
+    过图时画面是一整块纯色，隔行隔列抽样判断，不用处理整张图
+    :param frame:
+    :param tolerance: 允许的像素值波动
+    :return:
+    """
+    sample = frame[::8, ::8]
+    return int(sample.max()) - int(sample.min()) <= tolerance
+
+
+class GameState:
+    """
+    某一帧的游戏状态快照，创建后不再修改，可以在线程之间随意传递
+    """
+    __slots__ = ("frame_id", "timestamp", "map_info", "hero", "hero_count", "monsters", "items", "rewards", "marks", "transition")
+
+    def __init__(self, frame_id: int, map_info: dict, transition: bool = False, timestamp: float = None):
+        self.frame_id = frame_id
+        self.timestamp = time.monotonic() if timestamp is None else timestamp
+        self.map_info = map_info
+        self.transition = transition  # 正在过图，画面是纯色
+
+        hero = map_info.get("hero", {}).get("bottom_centers", [])
+        self.hero_count = len(hero)
+        # 识别到多个英雄时位置不可信，当作没找到
+        self.hero: Optional[Point] = hero[0] if len(hero) == 1 else None
+        self.monsters: List[Point] = [p for label in MONSTER_LABELS for p in self.centers(label)]
+        self.items: List[Point] = self.centers(ITEM_LABEL)
+        self.rewards: List[Point] = self.centers(REWARD_LABEL)
+        self.marks: List[Point] = self.centers(MARK_LABEL)
+
+    def centers(self, label: str) -> List[Point]:
+        """
+        某个标签所有目标的底部坐标
+        :param label:
+        :return:
+        """
+        return self.map_info.get(label, {}).get("bottom_centers", [])
+
+    def objects(self, label: str) -> List['Detect_Object']:
+        return self.map_info.get(label, {}).get("objects", [])
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.timestamp
+
+    def __repr__(self):
+        return (f"GameState(frame={self.frame_id}, hero={self.hero}, monsters={len(self.monsters)}, "
+                f"items={len(self.items)}, rewards={len(self.rewards)}, transition={self.transition})")
+
+
+StatePredicate = Callable[[GameState], bool]
+
+
+class GameStateStore:
+    """
+    游戏状态中心，识别线程每处理一帧更新一次，决策代码订阅变化或者等待条件成立，不用自己反复识别
+    订阅回调在识别线程里执行，不要在回调里做耗时操作
+    """
+
+    def __init__(self):
+        self._state: Optional[GameState] = None
+        self._frame_id = 0
+        self._cond = threading.Condition()
+        self._subscribers: List[Tuple[Callable[[GameState], None], Optional[StatePredicate]]] = []
+
+    @property
+    def state(self) -> Optional[GameState]:
+        """
+        最新的状态，还没有识别过返回 None
+        :return:
+        """
+        return self._state
+
+    def publish(self, frame: 'cv.Mat', result: List['Detect_Object'], class_names: List[str]) -> GameState:
+        """
+        用一帧的识别结果更新状态
+        :param frame: 当前帧
+        :param result: 识别结果
+        :param class_names: 标签名称列表
+        :return: 新的状态
+        """
+        map_info = build_map_info(result, class_names)
+        transition = is_blank_frame(frame) if frame is not None else False
+        with self._cond:
+            self._frame_id += 1
+            state = GameState(self._frame_id, map_info, transition)
+            self._state = state
+            self._cond.notify_all()
+            subscribers = list(self._subscribers)
+
+        for callback, predicate in subscribers:
+            try:
+                if predicate is None or predicate(state):
+                    callback(state)
+            except Exception as e:
+                logger.error(e)
+        return state
+
+    def subscribe(self, callback: Callable[[GameState], None], predicate: StatePredicate = None) -> Callable[[], None]:
+        """
+        订阅状态更新
+        :param callback: 回调，参数为新的状态
+        :param predicate: 只在条件成立时回调，不传每一帧都回调
+        :return: 取消订阅的函数
+        """
+        entry = (callback, predicate)
+        with self._cond:
+            self._subscribers.append(entry)
+
+        def unsubscribe():
+            with self._cond:
+                if entry in self._subscribers:
+                    self._subscribers.remove(entry)
+
+        return unsubscribe
+
+    def wait_next(self, timeout: float = None, after: int = None) -> Optional[GameState]:
+        """
+        等待下一帧的状态
+        :param timeout: 超时时间，不传一直等
+        :param after: 等待帧号大于这个值的状态，不传等待比当前更新的状态
+        :return: 超时返回 None
+        """
+        with self._cond:
+            if after is None:
+                after = self._frame_id
+            ok = self._cond.wait_for(lambda: self._frame_id > after, timeout)
+            return self._state if ok else None
+
+    def wait_until(self, predicate: StatePredicate, timeout: float = None, fresh: bool = False) -> Optional[GameState]:
+        """
+        阻塞直到状态满足条件，比如 wait_until(lambda s: not s.monsters, 5)
+        :param predicate: 条件
+        :param timeout: 超时时间，不传一直等
+        :param fresh: 只看调用之后的新状态，不拿当前状态判断
+        :return: 满足条件的状态，超时返回 None
+        """
+        with self._cond:
+            after = self._frame_id if fresh else self._frame_id - 1
+            ok = self._cond.wait_for(lambda: self._frame_id > after and self._state is not None and predicate(self._state), timeout)
+            return self._state if ok else None
+
+
+_stores: 'weakref.WeakKeyDictionary[ScrcpyADB, GameStateStore]' = weakref.WeakKeyDictionary()
+_stores_lock = threading.Lock()
+
+
+def get_state_store(adb: 'ScrcpyADB') -> GameStateStore:
+    """
+    获取设备对应的状态中心，同一个设备共用一个，第一次获取时挂到设备的识别回调上
+    :param adb:
+    :return:
+    """
+    with _stores_lock:
+        store = _stores.get(adb)
+        if store is None:
+            store = GameStateStore()
+            adb.add_detection_listener(store.publish)
+            _stores[adb] = store
+        return store
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/20
+import math
+from typing import List, Optional, Tuple
+
+Point = Tuple[int, int]
+
+
+def _dist(p1: Point, p2: Point) -> float:
+    return math.hypot(p1[0] - p2[0], p1[1] - p2[1])
+
+
+def path_length(start: Point, route: List[Point], end: Point = None) -> float:
+    """
+    路线总长度
+    :param start: 起点
+    :param route: 途经点
+    :param end: 终点，可以没有
+    :return:
+    """
+    points = [start] + list(route) + ([end] if end is not None else [])
+    return sum(_dist(points[i], points[i + 1]) for i in range(len(points) - 1))
+
+
+def nearest_neighbor_route(start: Point, items: List[Point]) -> List[Point]:
+    """
+    最近邻构造初始路线
+    :param start: 起点
+    :param items: 途经点
+    :return:
+    """
+    remaining = list(items)
+    route = []
+    current = start
+    while remaining:
+        nearest = min(remaining, key=lambda p: _dist(current, p))
+        remaining.remove(nearest)
+        route.append(nearest)
+        current = nearest
+    return route
+
+
+def two_opt_order(start: Point, route: List[Point], end: Point = None, max_rounds: int = 20) -> List[int]:
+    """
+    2-opt 优化，起点固定，终点有的话也固定，反转中间的片段直到没有改进
+    返回下标而不是坐标，坐标相同的材料也能分清谁是谁
+    :param start: 起点
+    :param route: 初始路线
+    :param end: 终点
+    :param max_rounds: 最大轮数
+    :return: 优化后的路线在初始路线里的下标
+    """
+    n = len(route)
+    order = list(range(n))
+    if n < 2:
+        return order
+    points = [start] + list(route) + ([end] if end is not None else [])
+
+    for _ in range(max_rounds):
+        improved = False
+        # 反转 points[i..j]，比较断开的两条边和重连后的两条边
+        for i in range(1, n):
+            for j in range(i + 1, n + 1):
+                a, b = points[i - 1], points[i]
+                c = points[j]
+                d = points[j + 1] if j + 1 < len(points) else None
+                before = _dist(a, b) + (_dist(c, d) if d is not None else 0)
+                after = _dist(a, c) + (_dist(b, d) if d is not None else 0)
+                if after < before - 1e-6:
+                    points[i:j + 1] = reversed(points[i:j + 1])
+                    order[i - 1:j] = reversed(order[i - 1:j])
+                    improved = True
+        if not improved:
+            break
+    return order
+
+
+def two_opt(start: Point, route: List[Point], end: Point = None, max_rounds: int = 20) -> List[Point]:
+    """
+    2-opt 优化，返回优化后的路线
+    :param start: 起点
+    :param route: 初始路线
+    :param end: 终点
+    :param max_rounds: 最大轮数
+    :return:
+    """
+    return [route[i] for i in two_opt_order(start, route, end, max_rounds)]
+
+
+def plan_route(start: Point, items: List[Point], end: Point = None) -> List[Point]:
+    """
+    从英雄位置出发经过所有材料，最后靠近出口的拾取顺序
+    :param start: 英雄位置
+    :param items: 材料位置
+    :param end: 出口位置，可以没有
+    :return:
+    """
+    return two_opt(start, nearest_neighbor_route(start, items), end)
+
+
+class LootPlanner:
+    """
+    捡材料路线规划
+    每一帧把上一帧的材料和新识别的材料对应起来，连续几帧找不到的材料认为已经捡到，
+    材料集合变化时才重新规划，没变化只更新坐标，避免路线来回跳
+    """
+
+    def __init__(self, match_distance: float = 150, vanish_frames: int = 3):
+        """
+        :param match_distance: 前后两帧同一个材料允许的最大位移（画面会跟着英雄移动）
+        :param vanish_frames: 连续多少帧没看到就认为捡到了
+        """
+        self.match_distance = match_distance
+        self.vanish_frames = vanish_frames
+        self.route: List[Point] = []
+        self._missing: List[int] = []
+        self.picked = 0
+
+    def reset(self):
+        self.route = []
+        self._missing = []
+        self.picked = 0
+
+    def _match(self, detections: List[Point]) -> Tuple[List[Optional[Point]], List[Point]]:
+        """
+        按距离贪心匹配路线上的材料和新识别的材料
+        :return: (路线上每个材料对应的新坐标，没匹配到为 None, 新出现的材料)
+        """
+        pairs = sorted(
+            (_dist(old, new), i, j)
+            for i, old in enumerate(self.route)
+            for j, new in enumerate(detections)
+        )
+        matched: List[Optional[Point]] = [None] * len(self.route)
+        used = set()
+        for distance, i, j in pairs:
+            if distance > self.match_distance:
+                break
+            if matched[i] is None and j not in used:
+                matched[i] = detections[j]
+                used.add(j)
+        return matched, [p for j, p in enumerate(detections) if j not in used]
+
+    def next_target(self, hero: Point, items: List[Point], exit_pos: Point = None) -> Optional[Point]:
+        """
+        更新材料并返回下一个要去捡的材料
+        :param hero: 英雄位置
+        :param items: 当前帧识别到的材料
+        :param exit_pos: 出口位置，可以没有
+        :return:
+        """
+        matched, new_items = self._match(items)
+        route, missing = [], []
+        changed = bool(new_items)
+        for point, new_point, count in zip(self.route, matched, self._missing):
+            if new_point is not None:
+                route.append(new_point)
+                missing.append(0)
+            elif count + 1 < self.vanish_frames:
+                # 暂时被英雄或者特效挡住，先保留旧坐标
+                route.append(point)
+                missing.append(count + 1)
+            else:
+                self.picked += 1
+                changed = True
+
+        if changed:
+            # 新材料按最便宜的位置插入，再用 2-opt 整体优化
+            for item in new_items:
+                route, missing = self._cheapest_insert(hero, route, missing, item, exit_pos)
+            order = two_opt_order(hero, route, exit_pos)
+            route = [route[i] for i in order]
+            missing = [missing[i] for i in order]
+        self.route, self._missing = route, missing
+
+        # 优先去当前能看到的材料
+        for point, count in zip(self.route, self._missing):
+            if count == 0:
+                return point
+        return self.route[0] if self.route else None
+
+    @staticmethod
+    def _cheapest_insert(hero: Point, route: List[Point], missing: List[int], item: Point, exit_pos: Point = None):
+        best_index, best_cost = len(route), None
+        points = [hero] + route
+        for i in range(len(points)):
+            nxt = points[i + 1] if i + 1 < len(points) else exit_pos
+            cost = _dist(points[i], item) + (_dist(item, nxt) - _dist(points[i], nxt) if nxt is not None else 0)
+            if best_cost is None or cost < best_cost:
+                best_index, best_cost = i, cost
+        return route[:best_index] + [item] + route[best_index:], missing[:best_index] + [0] + missing[best_index:]
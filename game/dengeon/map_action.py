@@ -1,27 +1,25 @@
-import os.path
+import queue
 import random
 import sys
-from typing import Tuple, List
+from contextlib import contextmanager
+from typing import Callable, Optional, Tuple, List
 
-from utils.yolov5 import YoloV5s
 from utils.logger import logger
+from device_manager.frame_rate import GamePhase
 from device_manager.scrcpy_adb import ScrcpyADB
+from device_manager.session_recorder import record_event
+from game.dengeon.game_state import GameState, get_state_store
+from game.dengeon.loot_planner import LootPlanner
 from game.hero_control.hero_control import get_hero_control
-from utils.path_manager import PathManager
 import time
-import cv2 as cv
-from ncnn.utils.objects import Detect_Object
 import math
-import numpy as np
 
-
-def get_detect_obj_bottom(obj: Detect_Object) -> Tuple[int, int]:
-    """
-    获取检测对象的底部坐标
-    :param obj:
-    :return:
-    """
-    return int(obj.rect.x + obj.rect.w / 2), int(obj.rect.y + obj.rect.h)
+# 跑图时只需要英雄、箭头和门，怪物和材料用来判断能不能过图
+TRANSITION_CLASSES = (
+    "hero", "go", "go_d", "go_r", "go_u",
+    "opendoor_d", "opendoor_l", "opendoor_r", "opendoor_u",
+    "Monster", "Monster_ds", "Monster_szt", "equipment",
+)
 
 
 def calc_angle(hero_pos: Tuple[int, int], target_pos: Tuple[int, int]) -> float:
@@ -122,20 +120,24 @@ class GameAction:
     """
     游戏控制
     """
-    LABLE_LIST = [line.strip() for line in open(os.path.join(PathManager.MODEL_PATH, "new.txt")).readlines()]
-
-    LABLE_INDEX = {}
-    for i, lable in enumerate(LABLE_LIST):
-        LABLE_INDEX[i] = lable
 
     def __init__(self, hero_name: str, adb: ScrcpyADB):
         self.hero_ctrl = get_hero_control(hero_name, adb)
-        self.yolo = YoloV5s(num_threads=4, use_gpu=True)
         self.adb = adb
         self.room_index = 0
         self.special_room = False  # 狮子头
         self.boss_room = False  # boss
         self.next_room_direction = "down"  # 下一个房间的方向
+        self.items_picked = 0  # 累计捡的材料数
+        self.state_store = get_state_store(adb)
+
+    @property
+    def yolo(self):
+        """
+        和设备共用一个模型，不重复加载
+        :return:
+        """
+        return self.adb.yolo
 
     def random_move(self):
         """
@@ -145,39 +147,66 @@ class GameAction:
         logger.info("随机移动一下")
         self.hero_ctrl.move(random.randint(0, 360), 0.5)
 
+    def detect(self, frame, show=False) -> GameState:
+        """
+        识别指定的画面并更新游戏状态
+        :param frame:
+        :param show:
+        :return:
+        """
+        # 模型可能被热切换，识别结果和标签要来自同一个模型
+        yolo = self.yolo
+        start = time.monotonic()
+        result = yolo(frame, classes=self.adb.detect_classes)
+        self.adb.record_detection_latency(start)
+        self.adb.picture_frame(frame, result, show)
+        return self.state_store.publish(frame, result, yolo.class_names)
+
+    def next_state(self, timeout: float = 1) -> Optional[GameState]:
+        """
+        等待下一帧的游戏状态
+        mac 上推流线程只把帧放进队列，在这里识别；其他系统推流线程已经识别并更新了状态，直接等结果
+        :param timeout: 超时时间
+        :return: 超时返回 None
+        """
+        if sys.platform.startswith("darwin"):
+            try:
+                # 只识别最新的一帧，识别期间积压的旧帧直接跳过
+                frame = self.adb.frame_queue.get(timeout=timeout, latest=True)
+            except queue.Empty:
+                return None
+            return self.detect(frame, show=True)
+        return self.state_store.wait_next(timeout)
+
+    def wait_until(self, predicate: Callable[[GameState], bool], timeout: float) -> Optional[GameState]:
+        """
+        等待游戏状态满足条件，只看调用之后的新帧
+        :param predicate: 条件
+        :param timeout: 超时时间
+        :return: 满足条件的状态，超时返回 None
+        """
+        if not sys.platform.startswith("darwin"):
+            return self.state_store.wait_until(predicate, timeout, fresh=True)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            state = self.next_state(max(0.0, deadline - time.monotonic()))
+            if state is not None and predicate(state):
+                return state
+        return None
+
     def get_map_info(self, frame=None, show=False):
         """
         获取当前地图信息
+        :param frame: 指定画面时识别这一帧，不传等待下一帧的识别结果
+        :param show: 是否弹窗显示
         :return:
         """
-        if sys.platform.startswith("win"):
-            frame = self.adb.last_screen if frame is None else frame
-        else:
-            frame = self.adb.frame_queue.get(timeout=1) if frame is None else frame
-        result = self.yolo(frame)
-        self.adb.picture_frame(frame, result)
-
-        lable_list = [line.strip() for line in open(os.path.join(PathManager.MODEL_PATH, "new.txt")).readlines()]
-        result_dict = {}
-        for lable in lable_list:
-            result_dict[lable] = []
-
-        for detection in result:
-            label = GameAction.LABLE_INDEX.get(detection.label)
-            if label in result_dict:
-                result_dict[label].append(detection)
-
-        final_result = {}
-        for label, objects in result_dict.items():
-            count = len(objects)
-            bottom_centers = [get_detect_obj_bottom(obj) for obj in objects]
-            final_result[label] = {
-                "count": count,
-                "objects": objects,
-                "bottom_centers": bottom_centers
-            }
-
-        return final_result
+        if frame is not None:
+            return self.detect(frame, show).map_info
+        state = self.next_state()
+        if state is None:
+            raise TimeoutError("等待识别结果超时")
+        return state.map_info
 
     def get_items(self):
         """
@@ -185,23 +214,29 @@ class GameAction:
         :return:
         """
         logger.info("开始捡材料")
+        self.adb.set_phase(GamePhase.LOOTING)
         start_move = False
+        planner = LootPlanner()
         while True:
-            map_info = self.get_map_info(show=True)
-            itme_list = self.is_exist_item(map_info)
-            if not itme_list:
-                logger.info("材料全部捡完")
+            state = self.next_state()
+            if state is None:
+                continue
+            if not state.items:
+                logger.info(f"材料全部捡完，共 {planner.picked + len(planner.route)} 个")
+                self.items_picked += planner.picked + len(planner.route)
                 self.adb.touch_end()
                 return True
             else:
-                if map_info["hero"]["count"] != 1:
+                if state.hero is None:
                     self.random_move()
+                    # 随机移动会松开轮盘，需要重新按下
+                    start_move = False
                     continue
                 else:
-                    # 循环捡东西
-                    hx, hy = map_info["hero"]["bottom_centers"][0]
-                    closest_item = find_nearest_target_to_the_hero((hx, hy), itme_list)
-                    angle = calc_angle((hx, hy), closest_item)
+                    # 按规划的路线捡东西，最后停在出口附近
+                    exit_pos = find_nearest_target_to_the_hero(state.hero, state.marks)
+                    target_item = planner.next_target(state.hero, state.items, exit_pos)
+                    angle = calc_angle(state.hero, target_item)
                     if not start_move:
                         self.hero_ctrl.touch_roulette_wheel()
                         start_move = True
@@ -231,6 +266,7 @@ class GameAction:
         """
         # TODO 目前还有两个问题，1：怪物多的时候，视频比较卡，导致画面信息和实际游戏画面不一致，操作变形；2：有时候英雄会把怪物挡住，导致以为怪物击杀完毕，实际还没杀完
         logger.info("开始击杀怪物")
+        self.adb.set_phase(GamePhase.COMBAT)
         room_skill_combo_status = False
         while True:
             # 使用技能连招
@@ -239,126 +275,110 @@ class GameAction:
                 room_skill_combo()
                 room_skill_combo_status = True
 
-            map_info = self.get_map_info(show=True)
-            monster_list = self.is_exist_monster(map_info)
-            if not monster_list:
-                logger.info("怪物击杀完毕")
-                return True
+            state = self.next_state()
+            if state is None:
+                continue
+            if not state.monsters:
+                # 英雄可能把怪物挡住了，多看几帧确认怪物真的杀完了
+                if self.wait_until(lambda s: bool(s.monsters), 0.3) is None:
+                    logger.info("怪物击杀完毕")
+                    return True
+                continue
             else:
-                if map_info["hero"]["count"] != 1:
+                if state.hero is None:
                     self.random_move()
                     continue
                 else:
-                    hx, hy = map_info["hero"]["bottom_centers"][0]
-                    self._kill_monsters((hx, hy), monster_list)
+                    self._kill_monsters(state.hero, state.monsters)
 
     @staticmethod
-    def is_exist_monster(map_info):
-        """
-        判断房间是否存在怪物,如果存在怪物就把怪物坐标返回去，否则返回空
-        :return:
-        """
-        if map_info["Monster"]["count"] and map_info["Monster_ds"]["count"] and map_info["Monster_szt"]["count"] == 0:
-            return []
-        else:
-            monster = []
-            if map_info["Monster"]["count"] > 0:
-                monster.extend(map_info["Monster"]["bottom_centers"])
-            if map_info["Monster_ds"]["count"] > 0:
-                monster.extend(map_info["Monster_ds"]["bottom_centers"])
-            if map_info["Monster_szt"]["count"] > 0:
-                monster.extend(map_info["Monster_szt"]["bottom_centers"])
-            return monster
-
-    @staticmethod
-    def is_exist_item(map_info):
-        """
-        判断房间是否材料
-        :return:
-        """
-        if map_info["equipment"]["count"] == 0:
-            return []
-        else:
-            return map_info["equipment"]["bottom_centers"]
-
-    @staticmethod
-    def is_exist_reward(map_info):
-        """
-        判断是否存在翻牌奖励
-        :return:
-        """
-        if map_info["card"]["count"] == 0:
-            return []
-        else:
-            return map_info["card"]["bottom_centers"]
-
-    def is_allow_move(self, map_info):
+    def is_allow_move(state: GameState):
         """
         判断是否满足移动条件，如果不满足返回原因
         :return:
         """
-        if self.is_exist_monster(map_info):
+        if state.monsters:
             logger.info("怪物未击杀完毕，不满足过图条件,结束跑图")
             return False, "怪物未击杀"
-        if self.is_exist_item(map_info):
+        if state.items:
             logger.info("存在没检的材料，不满足过图条件,结束跑图")
             return False, "存在没检的材料"
         return True, ""
 
+    @contextmanager
+    def detect_only(self, classes):
+        """
+        临时只识别部分标签，退出时恢复
+        :param classes: 标签名称
+        :return:
+        """
+        old_classes, self.adb.detect_classes = self.adb.detect_classes, classes
+        try:
+            yield
+        finally:
+            self.adb.detect_classes = old_classes
+
     def mov_to_next_room(self, direction=None):
         """
         移动到下一个房间
         :param direction:
         :return:
         """
+        with self.detect_only(TRANSITION_CLASSES):
+            return self._mov_to_next_room(direction)
+
+    def _mov_to_next_room(self, direction=None):
         # TODO 偶现角色突然就不动了，也没卡死，就是不走了
         start_move = False
         hlx, hly = 0, 0
         logger.info("开始跑图")
+        self.adb.set_phase(GamePhase.TRANSITION)
         move_count = 0
         kasi = 0
         while True:
-            screen = self.hero_ctrl.adb.last_screen
-            if screen is None:
+            state = self.next_state()
+            if state is None:
                 continue
 
-            ada_image = cv.adaptiveThreshold(cv.cvtColor(screen, cv.COLOR_BGR2GRAY), 255, cv.ADAPTIVE_THRESH_GAUSSIAN_C, cv.THRESH_BINARY_INV, 13, 3)
-            if np.sum(ada_image) == 0:
+            # 过图时画面是纯色
+            if state.transition:
                 logger.info("过图成功")
                 self.adb.touch_end()
                 return True
 
             if kasi == 50:
                 logger.info("卡死次数超过 50 次，过图失败")
+                record_event(self.adb, "transition_failed", room_index=self.room_index, direction=direction)
                 self.adb.touch_end()
                 return False, "过图失败"
 
-            map_info = self.get_map_info(screen, show=True)
-            if map_info["hero"]["count"] == 0:
+            map_info = state.map_info
+            if state.hero_count == 0:
                 logger.info("没有找到英雄")
                 self.random_move()
                 continue
             else:
-                hx, hy = map_info["hero"]["bottom_centers"][0]
+                hx, hy = state.centers("hero")[0]
                 if move_count > 10:
                     kasi = is_within_error_margin((hlx, hly), (hx, hy), 50, 50)
                     if kasi:
                         logger.info(f"英雄坐标长时间未变化，应该是卡死了，10 次前坐标：{hlx, hly}，当前坐标{hx, hy}，随机移动一下")
+                        record_event(self.adb, "stuck", room_index=self.room_index, hero=[int(hx), int(hy)])
                         self.random_move()
                         kasi += 1
                         continue
 
             # 判断是否达到移动下一个房间的条件
-            conditions, reason = self.is_allow_move(map_info)
+            conditions, reason = self.is_allow_move(state)
             if not conditions:
                 return False, reason
 
-            if map_info["go"]["count"] == 0:
+            if not state.marks:
                 logger.info("没有找到标记")
                 self.random_move()
                 continue
             else:
-                marks = map_info["go"]["bottom_centers"]
+                marks = state.marks
 
             closest_mark = find_nearest_target_to_the_hero((hx, hy), marks)
             if closest_mark is None:
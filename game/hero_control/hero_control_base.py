@@ -8,6 +8,7 @@ from typing import Tuple
 
 from device_manager.scrcpy_adb import ScrcpyADB
 from data.coordinate.game_coordinate import *
+from data.coordinate.layout import LayoutPoint
 import math
 from utils.logger import logger
 
@@ -20,16 +21,16 @@ class HeroControlBase:
     def __init__(self, adb: ScrcpyADB):
         self.adb = adb
 
-    @staticmethod
-    def calc_mov_point(angle: float) -> Tuple[int, int]:
+    def calc_mov_point(self, angle: float) -> Tuple[int, int]:
         """
         根据角度计算轮盘 x y 坐标
         :param angle:
         :return:
         """
         # 手机是横屏的，计算角度是按照横屏去计算的，所以这里要修改一下坐标判断
-        rx, ry = roulette_wheel
-        r = 125
+        rx, ry = self.adb.resolve(roulette_wheel)
+        # 轮盘半径按 2688 宽的画面采集，换算到当前分辨率
+        r = self.adb.layout.scale_length(125, roulette_wheel.group)
 
         # 将角度转换为弧度
         angle_rad = math.radians(angle)
@@ -43,8 +44,7 @@ class HeroControlBase:
         按压轮盘中心位置
         :return:
         """
-        rx, ry = roulette_wheel
-        self.adb.touch_start((rx, ry))
+        self.adb.touch_start(roulette_wheel)
 
     def swipe_roulette_wheel(self, angle: float):
         """
@@ -61,11 +61,10 @@ class HeroControlBase:
         :param t:
         :return:
         """
-        rx, ry = roulette_wheel
         # 计算轮盘x, y坐标
         x, y = self.calc_mov_point(angle)
         logger.debug(f"移动到坐标:{x},{y}")
-        self.adb.swipe((rx, ry), (x, y), t)
+        self.adb.swipe(roulette_wheel, (x, y), t)
 
     def quick_move(self, direction: str, t: int or float):
         """
@@ -95,22 +94,20 @@ class HeroControlBase:
         普通攻击
         :return:
         """
-        x, y = attack
         logger.info("执行普通攻击")
-        self.adb.touch((x, y), t)
+        self.adb.touch(attack, t)
 
-    def skill_attack(self, skill_coordinate: Tuple[int, int], t: float or int = 0.1):
+    def skill_attack(self, skill_coordinate: LayoutPoint, t: float or int = 0.1):
         """
         技能攻击
         :param skill_coordinate: 技能坐标
         :param t:
         :return:
         """
-        x, y = skill_coordinate
         logger.info("执行技能攻击")
-        self.adb.touch((x, y), t)
+        self.adb.touch(skill_coordinate, t)
 
-    def combination_skill_attack(self, skill_coordinates: [Tuple[int, int]]):
+    def combination_skill_attack(self, skill_coordinates: [LayoutPoint]):
         """
         组合技能攻击
         :param skill_coordinates:
@@ -126,9 +123,8 @@ class HeroControlBase:
         :param t:
         :return:
         """
-        x, y = awaken_skill
         logger.info("执行觉醒攻击")
-        self.adb.touch((x, y), t)
+        self.adb.touch(awaken_skill, t)
 
 
 if __name__ == '__main__':
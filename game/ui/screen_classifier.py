@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/17
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import cv2 as cv
+import numpy as np
+
+from utils.logger import logger
+from utils.path_manager import PathManager
+
+
+class Screen:
+    """
+    界面类型
+    """
+    UNKNOWN = "unknown"
+    TOWN = "town"  # 城镇
+    TASK_DELEGATE = "task_delegate"  # 委托任务
+    DUNGEON_SELECT = "dungeon_select"  # 选择地下城
+    LOADING = "loading"  # 加载
+    BATTLE = "battle"  # 副本内
+    REWARD = "reward"  # 通关翻牌
+    SETTLEMENT = "settlement"  # 通关结算，可以再次挑战或者返回城镇
+
+
+# 每个字节里 1 的个数，用来算汉明距离
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def dhash(frame: cv.Mat, size: int = 16, region: Tuple[float, float, float, float] = None) -> np.ndarray:
+    """
+    差值哈希，缩成 (size + 1) x size 的灰度缩略图后比较相邻像素，得到 size * size 位的指纹
+    :param frame: 画面
+    :param size: 缩略图边长
+    :param region: 只计算这块区域，归一化的 (x1, y1, x2, y2)
+    :return: 按位打包后的 uint8 数组
+    """
+    if region is not None:
+        h, w = frame.shape[:2]
+        x1, y1, x2, y2 = region
+        frame = frame[int(y1 * h):int(y2 * h), int(x1 * w):int(x2 * w)]
+    # 先隔行隔列抽样再缩放，大图上 INTER_AREA 比较慢
+    step = max(1, min(frame.shape[0], frame.shape[1]) // (size * 8))
+    if step > 1:
+        frame = np.ascontiguousarray(frame[::step, ::step])
+    small = cv.resize(frame, (size + 1, size), interpolation=cv.INTER_AREA)
+    if small.ndim == 3:
+        small = cv.cvtColor(small, cv.COLOR_BGR2GRAY)
+    return np.packbits(small[:, 1:] > small[:, :-1])
+
+
+def hamming_distance(hash1: np.ndarray, hashes: np.ndarray) -> np.ndarray:
+    """
+    一个指纹和一组指纹的汉明距离
+    :param hash1: (n,) uint8
+    :param hashes: (m, n) uint8
+    :return: (m,)
+    """
+    return _POPCOUNT[np.bitwise_xor(hashes, hash1)].sum(axis=-1, dtype=np.int32)
+
+
+class ScreenSignature:
+    """
+    一个界面的指纹集合，同一个界面可以录多张，匹配任意一张就算
+    """
+
+    def __init__(self, name: str, hashes: List[str] = None, region: Tuple[float, float, float, float] = None, max_distance: int = 24):
+        """
+        :param name: 界面名称
+        :param hashes: 十六进制指纹
+        :param region: 只比较这块区域，归一化的 (x1, y1, x2, y2)，不传比较整个画面
+        :param max_distance: 汉明距离阈值，256 位指纹默认 24
+        """
+        self.name = name
+        self.region = tuple(region) if region else None
+        self.max_distance = max_distance
+        self.hashes = np.array([np.frombuffer(bytes.fromhex(h), dtype=np.uint8) for h in hashes or []], dtype=np.uint8)
+
+    def add(self, hash_bits: np.ndarray):
+        if len(self.hashes):
+            self.hashes = np.vstack([self.hashes, hash_bits[None]])
+        else:
+            self.hashes = hash_bits[None].copy()
+
+    def to_dict(self) -> dict:
+        return {
+            "hashes": [h.tobytes().hex() for h in self.hashes],
+            "region": list(self.region) if self.region else None,
+            "max_distance": self.max_distance,
+        }
+
+
+class ScreenClassifier:
+    """
+    界面分类，用缩略图指纹判断当前在哪个界面，一次分类不到 1 ms，菜单里不需要跑 yolo
+    指纹保存在 data/screen_signatures.json，用 record 录制
+    """
+
+    def __init__(self, path: str = PathManager.SCREEN_SIGNATURE_PATH, hash_size: int = 16):
+        self.path = path
+        self.hash_size = hash_size
+        self.signatures: Dict[str, ScreenSignature] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for name, data in json.load(f).items():
+                    self.signatures[name] = ScreenSignature(name, **data)
+        if not any(len(signature.hashes) for signature in self.signatures.values()):
+            logger.warning(f"{path} 里没有录制任何界面指纹，认不出任何界面，菜单导航会失败；"
+                           f"用 python -m game.ui.screen_classifier <界面> <截图> 录制")
+
+    def has_signature(self, name: str) -> bool:
+        signature = self.signatures.get(name)
+        return signature is not None and len(signature.hashes) > 0
+
+    def classify(self, frame: cv.Mat) -> Tuple[str, int]:
+        """
+        判断当前画面是哪个界面
+        :param frame: 画面
+        :return: (界面名称, 汉明距离)，都不匹配返回 UNKNOWN
+        """
+        if frame is None:
+            return Screen.UNKNOWN, -1
+        # 同一块区域的指纹只算一次
+        cache = {}
+        best_name, best_distance = Screen.UNKNOWN, -1
+        with self._lock:
+            signatures = list(self.signatures.values())
+        for signature in signatures:
+            if not len(signature.hashes):
+                continue
+            if signature.region not in cache:
+                cache[signature.region] = dhash(frame, self.hash_size, signature.region)
+            distance = int(hamming_distance(cache[signature.region], signature.hashes).min())
+            if distance <= signature.max_distance and (best_distance < 0 or distance < best_distance):
+                best_name, best_distance = signature.name, distance
+        return best_name, best_distance
+
+    def record(self, name: str, frame: cv.Mat, region: Tuple[float, float, float, float] = None, save: bool = True):
+        """
+        录制一个界面的指纹
+        :param name: 界面名称
+        :param frame: 画面
+        :param region: 只比较这块区域
+        :param save: 是否写回文件
+        :return:
+        """
+        with self._lock:
+            signature = self.signatures.get(name)
+            if signature is None:
+                signature = self.signatures[name] = ScreenSignature(name, region=region)
+            signature.add(dhash(frame, self.hash_size, signature.region))
+        if save:
+            self.save()
+
+    def save(self):
+        with self._lock:
+            data = {name: signature.to_dict() for name, signature in self.signatures.items()}
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+if __name__ == '__main__':
+    # 录制指纹：python -m game.ui.screen_classifier town img/town.png
+    import sys
+
+    classifier = ScreenClassifier()
+    classifier.record(sys.argv[1], cv.imread(sys.argv[2]))
+    print(classifier.classify(cv.imread(sys.argv[2])))
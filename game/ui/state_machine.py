@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/17
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple, Union
+
+from data.coordinate import game_coordinate
+from data.coordinate.layout import LayoutPoint, TextButton
+from device_manager.scrcpy_adb import ScrcpyADB
+from game.ui.screen_classifier import Screen, ScreenClassifier
+from utils.logger import logger
+
+
+class MenuStateMachine:
+    """
+    菜单导航状态机
+    界面是节点，点击序列是边，按最短路径从当前界面走到目标界面
+    目标界面没有录制指纹时无法确认点击结果，默认直接报错；打开 allow_blind 才按固定延时盲点
+    """
+
+    def __init__(self, adb: ScrcpyADB, classifier: ScreenClassifier = None, poll_interval: float = 0.2,
+                 tap_interval: float = 0.8, blind_delay: float = 3.0, allow_blind: bool = False):
+        """
+        :param adb: 设备
+        :param classifier: 界面分类
+        :param poll_interval: 检查界面的间隔
+        :param tap_interval: 连续点击之间的间隔
+        :param blind_delay: 没有指纹时，点击后等待界面切换的时间
+        :param allow_blind: 目标界面没有指纹时是否按固定延时盲点
+        """
+        self.adb = adb
+        self.classifier = classifier or ScreenClassifier()
+        self.poll_interval = poll_interval
+        self.tap_interval = tap_interval
+        self.blind_delay = blind_delay
+        self.allow_blind = allow_blind
+        self.text_locator = None
+
+    @staticmethod
+    def transitions(dungeon_name: str) -> Dict[str, Dict[str, List[Union[LayoutPoint, TextButton]]]]:
+        """
+        界面之间的跳转，{当前界面: {目标界面: 点击序列}}
+        :param dungeon_name: 要挑战的副本，对应选择地下城界面的坐标
+        :return:
+        """
+        dungeon = getattr(game_coordinate, dungeon_name)
+        return {
+            Screen.TOWN: {
+                Screen.TASK_DELEGATE: [game_coordinate.task_delegate],
+            },
+            Screen.TASK_DELEGATE: {
+                Screen.DUNGEON_SELECT: [
+                    game_coordinate.special_place_dungeon,
+                    game_coordinate.mountain_ridge,
+                    game_coordinate.move_to_enter_area,
+                ],
+                Screen.TOWN: [game_coordinate.exit_second_page],
+            },
+            Screen.DUNGEON_SELECT: {
+                Screen.BATTLE: [dungeon, game_coordinate.battle_start],
+                Screen.TOWN: [game_coordinate.close_select_dungeon],
+            },
+            Screen.SETTLEMENT: {
+                Screen.BATTLE: [game_coordinate.again_challenge],
+                Screen.TOWN: [game_coordinate.return_town],
+            },
+        }
+
+    def current_screen(self) -> str:
+        screen, _ = self.classifier.classify(self.adb.last_screen)
+        return screen
+
+    def recognizable(self, screens: List[str]) -> bool:
+        """
+        指定的界面里有没有录制了指纹的，没有时 current_screen 永远认不出这些界面，调用方不要去等
+        :param screens: 界面列表
+        :return:
+        """
+        return any(self.classifier.has_signature(screen) for screen in screens)
+
+    def wait_for(self, screens: List[str], timeout: float = 10) -> Optional[str]:
+        """
+        等待进入指定界面之一
+        :param screens: 界面列表
+        :param timeout: 超时时间
+        :return: 进入的界面，超时或者这些界面都没有指纹时返回 None
+        """
+        if not self.recognizable(screens):
+            return None
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            screen = self.current_screen()
+            if screen in screens:
+                return screen
+            time.sleep(self.poll_interval)
+        return None
+
+    def tap(self, coordinates: List[Union[LayoutPoint, TextButton]]) -> bool:
+        """
+        依次点击
+        :param coordinates: 坐标或者文字按钮
+        :return: 文字按钮没找到时返回 False，后面的不再点
+        """
+        for coordinate in coordinates:
+            if isinstance(coordinate, TextButton):
+                if not self.tap_text(coordinate.text, coordinate.region):
+                    return False
+                continue
+            self.adb.touch(coordinate, 0.1)
+            time.sleep(self.tap_interval)
+        return True
+
+    def tap_text(self, text: str, roi: Tuple[LayoutPoint, LayoutPoint] = None) -> bool:
+        """
+        按文字找按钮并点击，适合位置不固定的按钮
+        :param text: 按钮文字
+        :param roi: 只在这块区域里找，(左上, 右下) 两个归一化坐标
+        :return: 是否找到
+        """
+        from utils.text_locator import TextLocator
+
+        if self.text_locator is None:
+            self.text_locator = TextLocator()
+        frame = self.adb.last_screen
+        if frame is None:
+            return False
+        pixel_roi = None
+        if roi is not None:
+            pixel_roi = (*self.adb.resolve(roi[0]), *self.adb.resolve(roi[1]))
+        position = self.text_locator.find_text(frame, text, pixel_roi)
+        if position is None:
+            logger.info(f"没有找到文字：{text}")
+            return False
+        self.adb.touch(position, 0.1)
+        time.sleep(self.tap_interval)
+        return True
+
+    def find_path(self, start: str, target: str, dungeon_name: str) -> Optional[List[str]]:
+        """
+        广度优先找最短路径
+        :return: 经过的界面列表，不包含起点
+        """
+        graph = self.transitions(dungeon_name)
+        queue = deque([(start, [])])
+        visited = {start}
+        while queue:
+            screen, path = queue.popleft()
+            if screen == target:
+                return path
+            for next_screen in graph.get(screen, {}):
+                if next_screen not in visited:
+                    visited.add(next_screen)
+                    queue.append((next_screen, path + [next_screen]))
+        return None
+
+    def confirmable(self, from_screen: str, to_screen: str, dungeon_name: str) -> bool:
+        """
+        一条边走完能不能确认结果：目标界面有指纹，或者要点的是文字按钮（找到文字就说明在对的界面上）
+        不能确认并且不允许盲点时报错
+        :return:
+        """
+        taps = self.transitions(dungeon_name)[from_screen][to_screen]
+        if self.allow_blind or self.classifier.has_signature(to_screen) or any(isinstance(tap, TextButton) for tap in taps):
+            return True
+        logger.error(f"界面 {to_screen} 没有录制指纹，无法确认 {from_screen} -> {to_screen} 的点击结果；"
+                     f"先用 python -m game.ui.screen_classifier {to_screen} <截图> 录制，或者 allow_blind=True 按固定延时盲点")
+        return False
+
+    def go(self, from_screen: str, to_screen: str, dungeon_name: str, timeout: float = 15) -> bool:
+        """
+        执行一条边：点击后等待进入目标界面
+        :return: 是否成功
+        """
+        if not self.confirmable(from_screen, to_screen, dungeon_name):
+            return False
+        taps = self.transitions(dungeon_name)[from_screen][to_screen]
+        logger.info(f"界面跳转：{from_screen} -> {to_screen}")
+        if not self.tap(taps):
+            return False
+        if not self.classifier.has_signature(to_screen):
+            time.sleep(self.blind_delay)
+            return True
+        return self.wait_for([to_screen], timeout) == to_screen
+
+    def navigate(self, target: str, dungeon_name: str, start: str = None, timeout: float = 60) -> bool:
+        """
+        从当前界面导航到目标界面
+        :param target: 目标界面
+        :param dungeon_name: 要挑战的副本
+        :param start: 识别不出当前界面时假定的起点
+        :param timeout: 超时时间
+        :return: 是否到达
+        """
+        deadline = time.monotonic() + timeout
+        assumed = start
+        while time.monotonic() < deadline:
+            screen = self.current_screen()
+            if screen == Screen.UNKNOWN and assumed:
+                screen = assumed
+            if screen == target:
+                return True
+            if screen in (Screen.UNKNOWN, Screen.LOADING):
+                time.sleep(self.poll_interval)
+                continue
+
+            path = self.find_path(screen, target, dungeon_name)
+            if not path:
+                logger.error(f"没有从 {screen} 到 {target} 的路径")
+                return False
+            if not self.confirmable(screen, path[0], dungeon_name):
+                return False
+            # 一次只走一步，走完重新识别，防止中间弹窗把流程打乱
+            if self.go(screen, path[0], dungeon_name, max(0.0, deadline - time.monotonic())):
+                assumed = path[0] if not self.classifier.has_signature(path[0]) else None
+            else:
+                assumed = None
+        logger.error(f"导航到 {target} 超时")
+        return False
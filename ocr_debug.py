@@ -11,6 +11,8 @@ import subprocess
 import os
 import easyocr
 
+from utils.text_locator import TextLocator
+
 # 设置 Tesseract 可执行文件路径（Windows 用户需要设置）
 pytesseract.tesseract_cmd = r'D:\tesseract_ocr\tesseract.exe'
 
@@ -31,9 +33,15 @@ def capture_screenshot():
     return 'saliya.jpg'
 
 
+_easyocr_reader = None
+
+
 def read_text_with_easyocr(image_path):
-    # 创建 EasyOCR 读者对象，指定语言
-    reader = easyocr.Reader(['ch_sim', 'en'])  # 简体中文和英文
+    # 创建 EasyOCR 读者对象，指定语言，只创建一次
+    global _easyocr_reader
+    if _easyocr_reader is None:
+        _easyocr_reader = easyocr.Reader(['ch_sim', 'en'])  # 简体中文和英文
+    reader = _easyocr_reader
     # 读取图像
     results = reader.readtext(image_path)
 
@@ -82,79 +90,13 @@ def get_text_coordinates1(image_path, target_text):
     return None
 
 def get_text_coordinates2(image_path, target_text):
-    # 加载 EAST 文本检测器模型
-    net = cv2.dnn.readNet(r'D:\model\frozen_east_text_detection.pb-master\frozen_east_text_detection.pb')
-
-    # 读取图像
+    # EAST 模型缓存、向量化解析和旋转框 NMS 都在 TextLocator 里
+    locator = TextLocator(
+        model_path=r'D:\model\frozen_east_text_detection.pb-master\frozen_east_text_detection.pb',
+        recognizer=lambda roi: pytesseract.image_to_string(roi, lang='chi_sim', config='--psm 6'),
+    )
     image = cv2.imread(image_path)
-    orig = image.copy()
-    (H, W) = image.shape[:2]
-
-    # 设置新的宽度和高度，并计算比例
-    (newW, newH) = (320, 320)
-    rW = W / float(newW)
-    rH = H / float(newH)
-
-    # 调整图像大小
-    image_resized = cv2.resize(image, (newW, newH))
-    (H, W) = image_resized.shape[:2]
-
-    # 创建 blob 并进行前向传播以获取文本块的几何信息和分数
-    blob = cv2.dnn.blobFromImage(image_resized, 1.0, (W, H), (123.68, 116.78, 103.94), swapRB=True, crop=False)
-    net.setInput(blob)
-    (scores, geometry) = net.forward(['feature_fusion/Conv_7/Sigmoid', 'feature_fusion/concat_3'])
-
-    # 解析文本检测器的输出
-    (numRows, numCols) = scores.shape[2:4]
-    rects = []
-    confidences = []
-
-    for y in range(numRows):
-        scoresData = scores[0, 0, y]
-        xData0 = geometry[0, 0, y]
-        xData1 = geometry[0, 1, y]
-        xData2 = geometry[0, 2, y]
-        xData3 = geometry[0, 3, y]
-        anglesData = geometry[0, 4, y]
-
-        for x in range(numCols):
-            if scoresData[x] < 0.5:
-                continue
-
-            (offsetX, offsetY) = (x * 4.0, y * 4.0)
-            angle = anglesData[x]
-            cos = np.cos(angle)
-            sin = np.sin(angle)
-            h = xData0[x] + xData2[x]
-            w = xData1[x] + xData3[x]
-            endX = int(offsetX + (cos * xData1[x]) + (sin * xData2[x]))
-            endY = int(offsetY - (sin * xData1[x]) + (cos * xData2[x]))
-            startX = int(endX - w)
-            startY = int(endY - h)
-
-            rects.append((startX, startY, endX, endY))
-            confidences.append(scoresData[x])
-
-    # 使用非最大值抑制消除冗余框
-    boxes = cv2.dnn.NMSBoxes(rects, confidences, 0.5, 0.4)
-
-    # 遍历检测到的文本块并进行 OCR 识别
-    for i in range(len(boxes)):
-        (startX, startY, endX, endY) = rects[boxes[i]]
-        startX = int(startX * rW)
-        startY = int(startY * rH)
-        endX = int(endX * rW)
-        endY = int(endY * rH)
-
-        roi = image[startY:endY, startX:endX]
-        text = pytesseract.image_to_string(roi, lang='chi_sim', config='--psm 6')
-
-        if target_text in text:
-            center_x = (startX + endX) // 2
-            center_y = (startY + endY) // 2
-            return (center_x, center_y)
-
-    return None
+    return locator.find_text(image, target_text)
 
 # 捕获屏幕截图
 screenshot_path = capture_screenshot()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/31
+import os
+
+import cv2 as cv
+import numpy as np
+
+from data.coordinate.game_coordinate import attack, roulette_wheel
+from data.coordinate.layout import CoordinateMapper
+from device_manager.calibration import CALIBRATION_ANCHORS, calibrate, capture_templates
+
+
+def battle_screen(width: int = 2688, height: int = 1242) -> np.ndarray:
+    """
+    采集分辨率下的战斗界面：背景随机色块，轮盘和攻击按钮画成不同的图案
+    """
+    rng = np.random.default_rng(0)
+    small = rng.integers(40, 120, (height // 40, width // 40, 3), dtype=np.uint8)
+    frame = cv.resize(small, (width, height), interpolation=cv.INTER_NEAREST)
+    mapper = CoordinateMapper(width, height)
+    x, y = mapper.to_pixels(roulette_wheel)
+    cv.circle(frame, (x, y), 60, (230, 230, 230), 6)
+    cv.line(frame, (x - 40, y), (x + 40, y), (20, 20, 20), 8)
+    x, y = mapper.to_pixels(attack)
+    cv.rectangle(frame, (x - 50, y - 40), (x + 50, y + 40), (250, 250, 250), -1)
+    cv.circle(frame, (x + 10, y - 5), 25, (10, 10, 10), -1)
+    return frame
+
+
+def test_capture_and_calibrate_offset(tmp_path):
+    template_dir = str(tmp_path / "templates")
+    paths = capture_templates(battle_screen(), template_dir)
+    assert sorted(os.path.basename(path) for path in paths) == sorted(f"{name}.png" for name in CALIBRATION_ANCHORS)
+
+    # 同样分辨率，但是画面整体往右下偏了 (30, 12)
+    shifted = np.roll(battle_screen(), (12, 30), axis=(0, 1))
+    mapper = calibrate(shifted, template_dir=template_dir)
+    for point in CALIBRATION_ANCHORS.values():
+        expected = CoordinateMapper(2688, 1242).to_pixels(point)
+        x, y = mapper.to_pixels(point)
+        assert abs(x - expected[0] - 30) <= 2 and abs(y - expected[1] - 12) <= 2
+
+
+def test_missing_templates_fall_back_to_scaling(tmp_path):
+    mapper = calibrate(battle_screen(1920, 887), template_dir=str(tmp_path / "empty"))
+    assert mapper.transform("battle") == CoordinateMapper(1920, 887).transform("battle")
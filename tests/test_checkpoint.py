@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/31
+import json
+import os
+import time
+from types import SimpleNamespace
+
+from game.dengeon.checkpoint import ChallengeCheckpoint, CheckpointStore, locate_room_on_minimap
+
+
+def test_save_load_round_trip(tmp_path):
+    store = CheckpointStore(str(tmp_path))
+    checkpoint = ChallengeCheckpoint(
+        "hero", "bwj", path_name="full", path_index=3, room_coordinate=(2, 1),
+        completed_rooms=[(0, 0), (1, 0), (1, 1)], runs=5, items_picked=12, fatigue_value=80,
+    )
+    store.save(checkpoint)
+
+    loaded = store.load("hero", "bwj")
+    assert loaded == checkpoint
+    assert isinstance(loaded.room_coordinate, tuple)
+    assert all(isinstance(room, tuple) for room in loaded.completed_rooms)
+    # 原子替换，不留临时文件
+    assert os.listdir(tmp_path) == [os.path.basename(store.file("hero", "bwj"))]
+
+
+def test_load_missing_corrupt_and_expired(tmp_path):
+    store = CheckpointStore(str(tmp_path), max_age=60)
+    assert store.load("hero", "bwj") is None
+
+    with open(store.file("hero", "bwj"), "w", encoding="utf-8") as f:
+        f.write("{broken")
+    assert store.load("hero", "bwj") is None
+
+    checkpoint = ChallengeCheckpoint("hero", "bwj", updated_at=time.time() - 120)
+    with open(store.file("hero", "bwj"), "w", encoding="utf-8") as f:
+        json.dump(checkpoint.to_dict(), f)
+    assert store.load("hero", "bwj") is None
+
+    store.clear("hero", "bwj")
+    assert not os.path.exists(store.file("hero", "bwj"))
+
+
+def test_maybe_save_respects_interval(tmp_path):
+    store = CheckpointStore(str(tmp_path), min_interval=60)
+    checkpoint = ChallengeCheckpoint("hero", "bwj")
+    assert store.maybe_save(checkpoint)
+    assert not store.maybe_save(checkpoint)
+
+
+def test_locate_room_on_minimap():
+    def obj(x, y, w, h):
+        return SimpleNamespace(rect=SimpleNamespace(x=x, y=y, w=w, h=h))
+
+    coordinates = [(0, 0), (1, 0), (1, 1), (2, 1)]
+    # 3 列 2 行的小地图，英雄在右上角的格子
+    state = SimpleNamespace(objects=lambda label: {"map": [obj(0, 0, 300, 200)], "point": [obj(240, 40, 10, 10)]}[label])
+    assert locate_room_on_minimap(state, coordinates) == (2, 1)
+
+    state = SimpleNamespace(objects=lambda label: {"map": [obj(0, 0, 300, 200)], "point": []}[label])
+    assert locate_room_on_minimap(state, coordinates) is None
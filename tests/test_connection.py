@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/31
+import time
+from types import SimpleNamespace
+
+from device_manager.connection import Backoff, ConnectionManager, ConnectionState
+from device_manager.frame_rate import GamePhase
+
+
+class FakeAdb:
+    """
+    只有看门狗会用到的属性
+    """
+
+    def __init__(self, phase: str = GamePhase.COMBAT):
+        self.client = SimpleNamespace(alive=True)
+        self.governor = SimpleNamespace(phase=phase)
+        self.last_frame_time = time.monotonic()
+        self.restarting = False
+        self.restarted_with = []
+
+    def restart_stream(self, device=None):
+        self.restarted_with.append(device)
+        self.client = SimpleNamespace(alive=True)
+        self.last_frame_time = time.monotonic()
+
+
+def make_manager(adb: FakeAdb, **kwargs) -> ConnectionManager:
+    manager = ConnectionManager(stall_timeout=0.05, **kwargs)
+    # 不启动看门狗线程，直接调用 _check
+    manager._adb = adb
+    manager._set_state(ConnectionState.CONNECTED)
+    return manager
+
+
+def test_backoff():
+    backoff = Backoff(initial=1, maximum=5, factor=2, jitter=0)
+    assert [backoff.next() for _ in range(5)] == [1, 2, 4, 5, 5]
+    backoff.reset()
+    assert backoff.next() == 1
+    assert 9 <= Backoff(initial=10, jitter=0.1).next() <= 11
+
+
+def test_check_stopped_stream():
+    adb = FakeAdb()
+    manager = make_manager(adb)
+    assert manager._check() is None
+    adb.client.alive = False
+    assert manager._check() == "推流已停止"
+    adb.client = None
+    assert manager._check() == "推流已停止"
+
+
+def test_check_skipped_while_restarting():
+    adb = FakeAdb()
+    adb.client.alive = False
+    adb.restarting = True
+    assert make_manager(adb)._check() is None
+
+
+def test_stall_only_in_animated_phases():
+    adb = FakeAdb(GamePhase.MENU)
+    manager = make_manager(adb)
+    adb.last_frame_time = time.monotonic() - 60
+    # 菜单画面不变时本来就没有新帧
+    assert manager._check() is None
+    # 刚进入打怪阶段从这时开始计时
+    adb.governor.phase = GamePhase.COMBAT
+    assert manager._check() is None
+    time.sleep(0.06)
+    assert "combat" in manager._check()
+
+
+def test_reconnect_restarts_stream(monkeypatch):
+    adb = FakeAdb()
+    manager = make_manager(adb, backoff=Backoff(initial=0.01, jitter=0))
+    attempts = []
+
+    def discover():
+        attempts.append(1)
+        if len(attempts) < 2:
+            raise ConnectionError("No devices connected")
+        return "device"
+
+    monkeypatch.setattr(manager, "discover", discover)
+    manager._reconnect("推流已停止")
+    assert adb.restarted_with == ["device"]
+    assert manager.state == ConnectionState.CONNECTED and manager.connected
+    assert manager.reconnects == 1 and manager.backoff.attempts == 0
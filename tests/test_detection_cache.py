@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/31
+import time
+
+import cv2 as cv
+import numpy as np
+
+from device_manager.frame_rate import GamePhase
+from game.ui.screen_classifier import hamming_distance
+from utils.detection_cache import CachedDetector, DetectionCache, frame_key
+
+
+class CountingModel:
+    class_names = ["hero"]
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, img, classes=None):
+        self.calls += 1
+        return [self.calls]
+
+
+def make_frame(seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 255, (360, 640, 3), dtype=np.uint8)
+
+
+def make_menu(seed: int) -> np.ndarray:
+    """
+    菜单一样的画面：渐变背景加几个色块，随机噪声经过 JPEG 压缩后指纹会完全变掉
+    """
+    rng = np.random.default_rng(seed)
+    frame = np.zeros((360, 640, 3), dtype=np.uint8)
+    frame[:] = np.linspace(30, 200, 640, dtype=np.uint8)[None, :, None]
+    for _ in range(6):
+        x, y = rng.integers(0, 560), rng.integers(0, 300)
+        cv.rectangle(frame, (int(x), int(y)), (int(x) + 80, int(y) + 50), rng.integers(0, 255, 3).tolist(), -1)
+    return frame
+
+
+def jpeg(frame: np.ndarray, quality: int = 70) -> np.ndarray:
+    _, data = cv.imencode(".jpg", frame, [cv.IMWRITE_JPEG_QUALITY, quality])
+    return cv.imdecode(data, cv.IMREAD_COLOR)
+
+
+def test_same_frame_hits_cache():
+    model = CountingModel()
+    detector = CachedDetector(model, DetectionCache(max_age=10), report_interval=0)
+    frame = make_frame(1)
+    assert detector(frame) == detector(frame.copy())
+    assert model.calls == 1
+    detector(make_frame(2))
+    assert model.calls == 2
+    # 识别的标签不同，结果不能复用
+    detector(frame, classes=["hero"])
+    assert model.calls == 3
+
+
+def test_recompressed_frame_hits_within_tolerance():
+    model = CountingModel()
+    detector = CachedDetector(model, DetectionCache(max_age=10), report_interval=0)
+    frame = make_menu(1)
+    noisy = jpeg(frame)
+    distance = int(hamming_distance(frame_key(frame), frame_key(noisy)[None])[0])
+    assert 0 < distance <= detector.cache.tolerance
+    assert detector(frame) == detector(noisy)
+    assert model.calls == 1
+    # 容差为 0 时只有完全一样的指纹才能复用
+    strict = CachedDetector(CountingModel(), DetectionCache(tolerance=0, max_age=10), report_interval=0)
+    strict(frame)
+    strict(noisy)
+    assert strict.model.calls == 2
+    # 不同的菜单不会误用
+    detector(make_menu(2))
+    assert model.calls == 2
+
+
+def test_entries_expire():
+    cache = DetectionCache(max_age=0.05)
+    key = frame_key(make_frame(1))
+    cache.store(key, ["result"])
+    assert cache.lookup(key) == ["result"]
+    time.sleep(0.06)
+    assert cache.lookup(key) is None
+    assert cache.evictions == 1
+
+
+def test_lru_capacity():
+    cache = DetectionCache(capacity=2, max_age=0)
+    keys = [frame_key(make_frame(i)) for i in range(3)]
+    cache.store(keys[0], [0])
+    cache.store(keys[1], [1])
+    cache.lookup(keys[0])
+    cache.store(keys[2], [2])
+    assert cache.lookup(keys[1]) is None
+    assert cache.lookup(keys[0]) == [0]
+
+
+def test_hit_refreshes_entry():
+    cache = DetectionCache(max_age=0.05)
+    key = frame_key(make_frame(1))
+    cache.store(key, ["result"])
+    for _ in range(4):
+        time.sleep(0.03)
+        assert cache.lookup(key) == ["result"]
+
+
+def test_menu_phase_keeps_entries_longer():
+    cache = DetectionCache(max_age=0.05)
+    key = frame_key(make_frame(1))
+    cache.store(key, ["result"])
+    cache.set_phase(GamePhase.MENU)
+    assert cache.current_max_age == 5.0
+    time.sleep(0.06)
+    assert cache.lookup(key) == ["result"]
+    cache.set_phase(GamePhase.COMBAT)
+    time.sleep(0.06)
+    assert cache.lookup(key) is None
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/31
+import threading
+import time
+
+import pytest
+
+from utils.detection_pipeline import DetectionPipeline
+
+
+class FakeModel:
+    """
+    每个阶段睡一下，让三个阶段真的重叠；帧是整数，识别结果是 [帧]
+    """
+    class_names = ["hero"]
+
+    def __init__(self, fail_stage: str = None, fail_frame=None):
+        self.fail_stage = fail_stage
+        self.fail_frame = fail_frame
+
+    def _maybe_fail(self, stage: str, frame):
+        if stage == self.fail_stage and frame == self.fail_frame:
+            raise RuntimeError(f"{stage} failed")
+
+    def preprocess(self, frame):
+        self._maybe_fail("preprocess", frame)
+        time.sleep(0.002)
+        return frame, {"frame": frame}
+
+    def inference(self, mat_in):
+        self._maybe_fail("inference", mat_in)
+        time.sleep(0.005)
+        return mat_in
+
+    def postprocess(self, pred, meta, classes=None):
+        self._maybe_fail("postprocess", pred)
+        assert meta["frame"] == pred
+        return [pred]
+
+
+def test_results_keep_submit_order():
+    pipeline = DetectionPipeline(lambda: FakeModel(), report_interval=0).start()
+    results = []
+    done = threading.Event()
+
+    def _callback(frame, result, class_names):
+        results.append((frame, result, class_names))
+        if len(results) == 20:
+            done.set()
+
+    try:
+        for frame in range(20):
+            assert pipeline.submit(frame, _callback, block=True)
+        assert done.wait(5)
+        assert results == [(frame, [frame], ["hero"]) for frame in range(20)]
+        assert pipeline(99) == [99]
+        assert pipeline.stats()["completed"] == 21
+    finally:
+        pipeline.stop()
+
+
+@pytest.mark.parametrize("stage", ["preprocess", "inference", "postprocess"])
+def test_stage_error_fails_fast(stage):
+    pipeline = DetectionPipeline(lambda: FakeModel(stage, 1), report_interval=0).start()
+    try:
+        start = time.monotonic()
+        with pytest.raises(RuntimeError, match=stage):
+            pipeline(1, timeout=5)
+        # 出错的帧不用等到超时
+        assert time.monotonic() - start < 1
+        # 后面的帧照常识别
+        assert pipeline(2) == [2]
+    finally:
+        pipeline.stop()
+
+
+def test_submit_without_error_callback_keeps_running():
+    pipeline = DetectionPipeline(lambda: FakeModel("inference", 1), report_interval=0).start()
+    results = []
+    try:
+        pipeline.submit(1, lambda frame, result, names: results.append(frame), block=True)
+        assert pipeline(2) == [2]
+        assert results == []
+    finally:
+        pipeline.stop()
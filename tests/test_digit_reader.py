@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/31
+import cv2 as cv
+import numpy as np
+import pytest
+
+from utils.digit_reader import DigitReader, binarize, extract_glyphs, segment_glyphs
+
+
+def render(text: str, skip: str = "") -> np.ndarray:
+    """
+    按固定间距画出 HUD 一样的白色数字，skip 里的字符留空
+    """
+    img = np.zeros((40, 26 * len(text) + 20, 3), dtype=np.uint8)
+    for i, char in enumerate(text):
+        if char not in skip:
+            cv.putText(img, char, (10 + 26 * i, 30), cv.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+    return img
+
+
+@pytest.fixture
+def reader(tmp_path) -> DigitReader:
+    glyph_dir = str(tmp_path / "glyphs")
+    assert extract_glyphs(render("0123456789/"), "0123456789/", glyph_dir=glyph_dir) == 11
+    return DigitReader(glyph_dir=glyph_dir)
+
+
+def test_segment_glyphs():
+    binary = np.zeros((10, 20), dtype=bool)
+    binary[2:8, 1:4] = True
+    binary[4:6, 6:7] = True  # 1 像素宽的噪点
+    binary[1:9, 10:15] = True
+    glyphs = segment_glyphs(binary, min_width=2)
+    assert [glyph.shape for glyph in glyphs] == [(6, 3), (8, 5)]
+    assert len(segment_glyphs(binary)) == 3
+    assert segment_glyphs(np.zeros((10, 20), dtype=bool)) == []
+
+
+def test_read_int(reader):
+    assert reader.read_text(render("156/188")) == "156/188"
+    assert reader.read_int(render("156/188"), separator="/") == 156
+    assert reader.read_int(render("2048")) == 2048
+    assert reader.read_int(np.zeros((40, 100, 3), dtype=np.uint8)) is None
+
+
+def test_unknown_glyph_fails_whole_read(reader):
+    # 模板里没有的字符不能被丢掉，否则 156/188 会读成 156188
+    img = render("156/188", skip="/")
+    cv.putText(img, "%", (10 + 26 * 3, 30), cv.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+    assert len(segment_glyphs(binarize(img))) == 7
+    assert reader.read_text(img) is None
+    assert reader.read_int(img, separator="/") is None
+
+
+def test_missing_templates(tmp_path):
+    reader = DigitReader(glyph_dir=str(tmp_path / "empty"))
+    assert not reader.has_templates()
+    with pytest.raises(FileNotFoundError):
+        reader.read_int(render("1"))
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/31
+import numpy as np
+import pytest
+
+from utils.evaluation import DetectionMatcher, average_precision, box_iou, load_yolo_labels, match_detections
+
+
+def boxes(*rows) -> np.ndarray:
+    return np.array(rows, dtype=np.float32).reshape(-1, 6)
+
+
+def test_average_precision():
+    assert average_precision([(0.9, True), (0.8, True)], 2) == pytest.approx(1.0)
+    # 第二个预测是误检，第三个找回剩下的一半
+    assert average_precision([(0.9, True), (0.8, False), (0.7, True)], 2) == pytest.approx(0.5 + 0.5 * 2 / 3)
+    # 只找到一半
+    assert average_precision([(0.9, True)], 2) == pytest.approx(0.5)
+    # 顺序不影响结果，按置信度排序
+    assert average_precision([(0.7, True), (0.9, True), (0.8, False)], 2) == pytest.approx(0.5 + 0.5 * 2 / 3)
+    assert average_precision([], 2) == 0.0
+    assert average_precision([(0.9, False)], 0) == 0.0
+
+
+def test_box_iou():
+    iou = box_iou(np.array([[0, 0, 10, 10]], np.float32), np.array([[0, 0, 10, 10], [5, 0, 15, 10], [20, 20, 30, 30]], np.float32))
+    assert iou[0] == pytest.approx([1.0, 1 / 3, 0.0])
+
+
+def test_match_detections_one_to_one_by_confidence():
+    truths = boxes([0, 1, 0, 0, 10, 10])
+    preds = boxes([0, 0.6, 0, 0, 10, 10], [0, 0.9, 1, 1, 11, 11])
+    # 置信度高的先匹配，同一个真实框只能被命中一次
+    assert match_detections(preds, truths).tolist() == [False, True]
+
+
+def test_match_detections_requires_same_class_and_iou():
+    truths = boxes([0, 1, 0, 0, 10, 10], [1, 1, 100, 100, 110, 110])
+    preds = boxes([1, 0.9, 0, 0, 10, 10], [1, 0.8, 105, 100, 115, 110], [1, 0.7, 101, 100, 111, 110])
+    assert match_detections(preds, truths).tolist() == [False, False, True]
+    assert not match_detections(preds, boxes()).any()
+    assert len(match_detections(boxes(), truths)) == 0
+
+
+def test_detection_matcher_map():
+    matcher = DetectionMatcher()
+    matcher.add(boxes([0, 0.9, 0, 0, 10, 10], [1, 0.8, 50, 50, 60, 60]), boxes([0, 1, 0, 0, 10, 10], [1, 1, 0, 0, 5, 5]))
+    result = matcher.precision_recall()
+    assert result[0]["precision"] == 1.0 and result[0]["recall"] == 1.0
+    assert result[1]["precision"] == 0.0 and result[1]["recall"] == 0.0
+    assert matcher.mean_average_precision() == pytest.approx(0.5)
+    assert matcher.mean_average_precision([0]) == pytest.approx(1.0)
+
+
+def test_load_yolo_labels(tmp_path):
+    path = tmp_path / "frame.txt"
+    path.write_text("0 0.5 0.5 0.2 0.4\nbroken line\n", encoding="utf-8")
+    labels = load_yolo_labels(str(path), 100, 50)
+    assert labels.tolist() == [[0, 1, 40, 15, 60, 35]]
+    assert load_yolo_labels(str(tmp_path / "missing.txt"), 100, 50).shape == (0, 6)
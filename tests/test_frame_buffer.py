@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/31
+import queue
+
+import pytest
+
+from device_manager.frame_buffer import DropPolicy, FrameRingBuffer
+
+
+def test_drop_oldest_keeps_newest_frames():
+    buffer = FrameRingBuffer(capacity=3, report_interval=0)
+    cursor = buffer.cursor("perception")
+    for frame in range(5):
+        assert buffer.put(frame)
+    assert cursor.depth == 3
+    assert [cursor.get(timeout=0) for _ in range(3)] == [2, 3, 4]
+    assert cursor.dropped == 2
+    with pytest.raises(queue.Empty):
+        cursor.get(timeout=0)
+
+
+def test_drop_newest_rejects_when_a_cursor_is_full():
+    buffer = FrameRingBuffer(capacity=2, policy=DropPolicy.DROP_NEWEST, report_interval=0)
+    cursor = buffer.cursor("perception")
+    assert buffer.put(0) and buffer.put(1)
+    assert not buffer.put(2)
+    assert buffer.rejected == 1
+    assert cursor.get(timeout=0) == 0
+    # 读走一帧后有空位，可以继续写
+    assert buffer.put(3)
+    assert [cursor.get(timeout=0), cursor.get(timeout=0)] == [1, 3]
+    assert cursor.dropped == 0
+
+
+def test_latest_skips_backlog():
+    buffer = FrameRingBuffer(capacity=3, report_interval=0)
+    cursor = buffer.cursor("perception")
+    for frame in range(3):
+        buffer.put(frame)
+    assert cursor.get(timeout=0, latest=True) == 2
+    assert cursor.dropped == 2
+    assert cursor.depth == 0
+
+
+def test_cursors_are_independent():
+    buffer = FrameRingBuffer(capacity=3, report_interval=0)
+    display = buffer.cursor("display")
+    perception = buffer.cursor("perception")
+    assert buffer.cursor("display") is display
+    buffer.put(0)
+    buffer.put(1)
+    assert display.get(timeout=0) == 0
+    assert perception.get(timeout=0, latest=True) == 1
+    assert display.get(timeout=0) == 1
+    # 新游标从下一帧开始读
+    late = buffer.cursor("late")
+    assert late.depth == 0
+
+
+def test_invalid_arguments():
+    with pytest.raises(ValueError):
+        FrameRingBuffer(capacity=0)
+    with pytest.raises(ValueError):
+        FrameRingBuffer(policy="drop_random")
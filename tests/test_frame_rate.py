@@ -0,0 +1,25 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/31
+from device_manager.frame_rate import FrameRateGovernor, GamePhase
+
+
+def test_stream_fps_follows_phase_group():
+    governor = FrameRateGovernor(report_interval=0)
+    assert governor.stream_fps == 2
+    changes = []
+    governor.add_listener(lambda old, new: changes.append(governor.stream_fps))
+    governor.set_phase(GamePhase.COMBAT)
+    governor.set_phase(GamePhase.LOOTING)
+    governor.set_phase(GamePhase.MENU)
+    # 副本内各阶段共用一个推流帧率，只有进出副本时推流帧率才变
+    assert changes == [15, 15, 2]
+    assert governor.target_fps == 2
+
+
+def test_accept_throttles_to_target_fps():
+    governor = FrameRateGovernor({GamePhase.COMBAT: 10}, phase=GamePhase.COMBAT, report_interval=0)
+    accepted = [governor.accept(now=1 + i / 30) for i in range(30)]
+    assert 9 <= sum(accepted) <= 11
+    assert governor.dropped == 30 - sum(accepted)
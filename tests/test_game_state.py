@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/31
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from game.dengeon.game_state import GameStateStore
+
+CLASS_NAMES = ["hero", "Monster", "equipment"]
+
+
+def obj(label: int, x: float = 0, y: float = 0):
+    return SimpleNamespace(label=label, prob=0.9, rect=SimpleNamespace(x=x, y=y, w=10, h=20))
+
+
+def frame() -> np.ndarray:
+    return np.random.default_rng(0).integers(0, 255, (64, 64, 3), dtype=np.uint8)
+
+
+def publish_later(store: GameStateStore, results, delay: float = 0.02):
+    def _run():
+        for result in results:
+            time.sleep(delay)
+            store.publish(frame(), result, CLASS_NAMES)
+
+    thread = threading.Thread(target=_run, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_publish_builds_state():
+    store = GameStateStore()
+    state = store.publish(frame(), [obj(0, 100, 100), obj(1), obj(1)], CLASS_NAMES)
+    assert store.state is state
+    assert state.hero == (105, 120)
+    assert len(state.monsters) == 2
+    assert not state.transition
+    assert store.publish(np.zeros((64, 64, 3), np.uint8), [], CLASS_NAMES).transition
+
+
+def test_wait_until_uses_current_state():
+    store = GameStateStore()
+    state = store.publish(frame(), [], CLASS_NAMES)
+    assert store.wait_until(lambda s: not s.monsters, timeout=0) is state
+
+
+def test_wait_until_fresh_waits_for_new_frame():
+    store = GameStateStore()
+    store.publish(frame(), [], CLASS_NAMES)
+    assert store.wait_until(lambda s: not s.monsters, timeout=0.05, fresh=True) is None
+
+    thread = publish_later(store, [[obj(1)], [obj(1)], []])
+    state = store.wait_until(lambda s: not s.monsters, timeout=2, fresh=True)
+    thread.join()
+    assert state is not None and state.frame_id == 4
+
+
+def test_wait_until_timeout():
+    store = GameStateStore()
+    thread = publish_later(store, [[obj(1)]])
+    assert store.wait_until(lambda s: not s.monsters, timeout=0.2) is None
+    thread.join()
+
+
+def test_subscribe_with_predicate():
+    store = GameStateStore()
+    seen = []
+    unsubscribe = store.subscribe(seen.append, lambda s: bool(s.items))
+    store.publish(frame(), [obj(2)], CLASS_NAMES)
+    store.publish(frame(), [], CLASS_NAMES)
+    unsubscribe()
+    store.publish(frame(), [obj(2)], CLASS_NAMES)
+    assert [state.frame_id for state in seen] == [1]
+
+
+def test_wait_next():
+    store = GameStateStore()
+    store.publish(frame(), [], CLASS_NAMES)
+    assert store.wait_next(timeout=0.05) is None
+    thread = publish_later(store, [[obj(0)]])
+    state = store.wait_next(timeout=2)
+    thread.join()
+    assert state.frame_id == 2
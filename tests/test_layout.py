@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/31
+from data.coordinate.layout import CoordinateMapper, battle_point, menu_point
+
+
+def test_reference_resolution_round_trip():
+    assert CoordinateMapper(1664, 768).to_pixels(menu_point(1409, 682)) == (1409, 682)
+    assert CoordinateMapper(2688, 1242).to_pixels(battle_point(2372, 1132)) == (2372, 1132)
+
+
+def test_scale_to_other_resolution():
+    mapper = CoordinateMapper(1920, 1080)
+    # 按分辨率等比例缩放
+    assert mapper.to_pixels(battle_point(1344, 621)) == (960, 540)
+    assert mapper.to_pixels(menu_point(832, 384)) == (960, 540)
+    assert abs(mapper.scale_length(268.8, "battle") - 192) < 1e-6
+
+
+def test_fit_anchors_solves_scale_and_offset():
+    mapper = CoordinateMapper(2400, 1080)
+    p1, p2 = menu_point(127, 30), menu_point(1573, 448)
+    # 宽屏设备上菜单只占中间 2000 像素，左边留 200 像素黑边
+    expected = {p: (200 + p.x * 2000, p.y * 1080) for p in (p1, p2)}
+    mapper.fit_anchors("menu", expected)
+    for point, (x, y) in expected.items():
+        px, py = mapper.to_pixels(point)
+        assert abs(px - x) <= 1 and abs(py - y) <= 1
+    # 其他分组不受影响
+    assert mapper.transform("battle") == (2400, 0.0, 1080, 0.0)
+
+
+def test_fit_single_anchor_only_shifts():
+    mapper = CoordinateMapper(1664, 768)
+    point = menu_point(100, 100)
+    mapper.fit_anchors("menu", {point: (110, 95)})
+    assert mapper.to_pixels(point) == (110, 95)
+    assert mapper.to_pixels(menu_point(200, 200)) == (210, 195)
+
+
+def test_serialization_round_trip():
+    mapper = CoordinateMapper(2400, 1080, {"menu": (2000.0, 200.0, 1080.0, 0.0)})
+    restored = CoordinateMapper.from_dict(mapper.to_dict())
+    assert restored.width == 2400 and restored.height == 1080
+    assert restored.transform("menu") == (2000.0, 200.0, 1080.0, 0.0)
+    assert restored.to_pixels(menu_point(832, 384)) == mapper.to_pixels(menu_point(832, 384))
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/31
+import contextvars
+import json
+import logging
+import threading
+import time
+
+from utils import logger as log_module
+from device_manager.scrcpy_adb import ScrcpyADB
+from utils.logger import ContextFilter, JsonFormatter, RateLimitFilter, bind_log_device, get_log_context, log_context, update_log_context
+
+
+def make_record(msg: str = "没有找到英雄", lineno: int = 10) -> logging.LogRecord:
+    return logging.LogRecord("test", logging.INFO, "map_action.py", lineno, msg, None, None)
+
+
+def test_rate_limit_suppresses_within_interval():
+    limiter = RateLimitFilter(interval=60)
+    assert limiter.filter(make_record())
+    assert not limiter.filter(make_record())
+    assert not limiter.filter(make_record())
+    # 不同位置、不同内容的日志互不影响
+    assert limiter.filter(make_record(lineno=11))
+    assert limiter.filter(make_record("识别完成"))
+
+
+def test_rate_limit_flush_reports_when_window_closes():
+    limiter = RateLimitFilter(interval=60)
+    limiter.filter(make_record())
+    limiter.filter(make_record())
+    limiter.filter(make_record())
+    assert limiter.flush() == []
+
+    records = limiter.flush(now=time.monotonic() + 60)
+    assert len(records) == 1
+    assert records[0].suppressed == 2
+    assert "省略 2 条重复日志" in records[0].getMessage()
+    # 汇总过之后重新计数，下一条正常放行，不再重复注明
+    record = make_record()
+    assert limiter.filter(record)
+    assert not getattr(record, "suppressed", 0)
+
+
+def test_rate_limit_stop_flushes_open_windows():
+    limiter = RateLimitFilter(interval=60)
+    limiter.filter(make_record())
+    limiter.filter(make_record())
+    emitted = []
+    limiter.stop(emitted.append)
+    assert [record.suppressed for record in emitted] == [1]
+
+
+def test_rate_limit_background_flush():
+    limiter = RateLimitFilter(interval=0.1)
+    emitted = []
+    limiter.start(emitted.append)
+    try:
+        limiter.filter(make_record())
+        limiter.filter(make_record())
+        deadline = time.monotonic() + 2
+        while not emitted and time.monotonic() < deadline:
+            time.sleep(0.02)
+    finally:
+        limiter.stop()
+    assert [record.suppressed for record in emitted] == [1]
+
+
+def test_log_context_shared_with_other_threads():
+    serial = "test-device"
+
+    def _run():
+        bind_log_device(serial)
+        update_log_context(room="1,0")
+        seen = {}
+        # 新线程没有绑定设备，只有一个设备时用它的上下文
+        worker = threading.Thread(target=lambda: seen.update(get_log_context()))
+        worker.start()
+        worker.join()
+        with log_context(step="kill"):
+            assert get_log_context()["step"] == "kill"
+        return seen
+
+    try:
+        seen = contextvars.copy_context().run(_run)
+    finally:
+        with log_module._contexts_lock:
+            log_module._contexts.pop(serial, None)
+    assert seen["device"] == serial
+    assert seen["room"] == "1,0"
+    assert "step" not in seen
+
+
+def test_detection_latency_in_structured_log():
+    serial = "test-device"
+
+    def _run():
+        bind_log_device(serial)
+        # 不连设备，只用到记录延迟的部分
+        adb = ScrcpyADB.__new__(ScrcpyADB)
+        adb.record_detection_latency(time.monotonic() - 0.05)
+        record = make_record("识别完成")
+        ContextFilter().filter(record)
+        return adb, json.loads(JsonFormatter().format(record))
+
+    try:
+        adb, event = contextvars.copy_context().run(_run)
+    finally:
+        with log_module._contexts_lock:
+            log_module._contexts.pop(serial, None)
+    assert adb.last_detection_time > 0
+    assert event["device"] == serial
+    assert event["detect_ms"] >= 50
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/31
+from game.dengeon.loot_planner import LootPlanner, nearest_neighbor_route, path_length, plan_route, two_opt, two_opt_order
+
+
+def test_plan_route_orders_along_the_way_to_exit():
+    route = plan_route((0, 0), [(300, 0), (100, 0), (200, 0)], end=(400, 0))
+    assert route == [(100, 0), (200, 0), (300, 0)]
+
+
+def test_two_opt_never_longer_than_nearest_neighbor():
+    start = (0, 0)
+    items = [(100, 100), (400, 0), (120, 0), (380, 110), (250, 60)]
+    initial = nearest_neighbor_route(start, items)
+    optimized = two_opt(start, initial)
+    assert sorted(optimized) == sorted(items)
+    assert path_length(start, optimized) <= path_length(start, initial) + 1e-6
+
+
+def test_two_opt_order_with_duplicate_points():
+    route = [(100, 0), (300, 0), (100, 0), (200, 0)]
+    order = two_opt_order((0, 0), route)
+    assert sorted(order) == [0, 1, 2, 3]
+    assert [route[i] for i in order] == [(100, 0), (100, 0), (200, 0), (300, 0)]
+
+
+def test_next_target_prefers_visible_items():
+    planner = LootPlanner(vanish_frames=3)
+    assert planner.next_target((0, 0), [(300, 0), (100, 0)], (400, 0)) == (100, 0)
+    # (100, 0) 被挡住了，先去能看到的
+    assert planner.next_target((0, 0), [(300, 0)], (400, 0)) == (300, 0)
+    assert planner.route == [(100, 0), (300, 0)]
+
+
+def test_items_vanish_after_frames():
+    planner = LootPlanner(vanish_frames=2)
+    planner.next_target((0, 0), [(100, 0), (200, 0)])
+    planner.next_target((0, 0), [(200, 0)])
+    assert planner.picked == 0
+    assert planner.next_target((0, 0), [(200, 0)]) == (200, 0)
+    assert planner.picked == 1
+    assert planner.route == [(200, 0)]
+
+
+def test_duplicate_items_keep_their_own_missing_count():
+    planner = LootPlanner(vanish_frames=3)
+    planner.next_target((0, 0), [(100, 0), (100, 0), (300, 0)])
+    # 两个材料叠在一起，这一帧只识别到一个
+    planner.next_target((0, 0), [(100, 0), (300, 0)])
+    assert sorted(planner._missing) == [0, 0, 1]
+    # 出现新材料，重新规划后每个材料的计数不能串
+    planner.next_target((0, 0), [(100, 0), (300, 0), (500, 0)])
+    assert sorted(planner._missing) == [0, 0, 0, 2]
+    assert planner.route.count((100, 0)) == 2
+    planner.next_target((0, 0), [(100, 0), (300, 0), (500, 0)])
+    assert planner.picked == 1
+    assert planner.route.count((100, 0)) == 1
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/31
+import pytest
+
+from utils.model_loader import ModelLoader
+
+
+def make_loader(errors, retries: int = 2) -> ModelLoader:
+    """
+    前 len(errors) 次加载依次抛出 errors 里的异常，之后加载成功
+    """
+    loader = ModelLoader(retries=retries, retry_delay=0.01)
+    errors = list(errors)
+    loader.attempts = 0
+
+    def _build():
+        loader.attempts += 1
+        if errors:
+            raise errors.pop(0)
+        return "model"
+
+    loader._build = _build
+    return loader
+
+
+def test_retry_until_loaded():
+    loader = make_loader([RuntimeError("param"), RuntimeError("bin")]).start()
+    assert loader.get(5) == "model"
+    assert loader.attempts == 3
+    assert loader.ready and not loader.failed
+
+
+def test_failed_after_retries():
+    loader = make_loader([RuntimeError("broken")] * 3).start()
+    with pytest.raises(RuntimeError):
+        loader.get(5)
+    assert loader.failed and not loader.ready
+    assert loader.attempts == 3
+
+
+def test_missing_dependency_not_retried():
+    loader = make_loader([ImportError("ncnn")]).start()
+    with pytest.raises(ImportError):
+        loader.get(5)
+    assert loader.attempts == 1
+
+
+def test_restart_after_failure():
+    loader = make_loader([RuntimeError("broken")] * 3).start()
+    with pytest.raises(RuntimeError):
+        loader.get(5)
+    # 失败后再次 start 会重新加载，不用重启进程
+    assert loader.start().get(5) == "model"
+    assert loader.ready and not loader.failed
+    assert loader.attempts == 4
+    # 已经加载成功的不会重复加载
+    loader.start().get(5)
+    assert loader.attempts == 4
+
+
+def test_shared_rearms_failed_loader(monkeypatch):
+    monkeypatch.setattr(ModelLoader, "_shared", {})
+    builds = []
+
+    def _build(self):
+        builds.append(self)
+        if len(builds) == 1:
+            raise ImportError("ncnn")
+        return "model"
+
+    monkeypatch.setattr(ModelLoader, "_build", _build)
+    loader = ModelLoader.shared(model="test")
+    with pytest.raises(ImportError):
+        loader.get(5)
+    assert ModelLoader.shared(model="test") is loader
+    assert loader.get(5) == "model"
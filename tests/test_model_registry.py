@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/31
+import pytest
+
+from utils.model_registry import ModelSpec
+
+
+def make_spec(tmp_path, precision: str = "fp32", **kwargs) -> ModelSpec:
+    for name in ("new.param", "new.bin", "new.txt", "new.onnx"):
+        (tmp_path / name).write_text("hero\n", encoding="utf-8")
+    return ModelSpec(
+        name="new", param=str(tmp_path / "new.param"), bin=str(tmp_path / "new.bin"),
+        classes=str(tmp_path / "new.txt"), onnx=str(tmp_path / "new.onnx"), precision=precision, **kwargs,
+    )
+
+
+def test_validate_spec_precision(tmp_path):
+    make_spec(tmp_path).validate()
+    make_spec(tmp_path, "fp16").validate()
+    make_spec(tmp_path, "int8").validate()
+
+
+def test_validate_overridden_precision(tmp_path):
+    spec = make_spec(tmp_path)
+    spec.validate(precision="fp16")
+    # 普通模型不能直接开 int8
+    with pytest.raises(ValueError):
+        spec.validate(precision="int8")
+    with pytest.raises(ValueError):
+        spec.validate(precision="bf16")
+
+
+def test_validate_precision_per_backend(tmp_path):
+    spec = make_spec(tmp_path)
+    spec.validate(backend="opencv")
+    with pytest.raises(ValueError):
+        spec.validate(backend="onnxruntime", precision="fp16")
+
+
+def test_validate_missing_quantized_files(tmp_path):
+    spec = make_spec(tmp_path, "int8")
+    spec.bin = str(tmp_path / "new-int8.bin")
+    with pytest.raises(FileNotFoundError, match="quantization"):
+        spec.validate()
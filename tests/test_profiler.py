@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/31
+import signal
+import sys
+import threading
+import time
+
+from utils import profiler as profiler_module
+from utils.profiler import PROFILE_HZ_ENV, PROFILE_PORT_ENV, SamplingProfiler, start_profiler_from_env
+
+
+def test_disabled_without_env(monkeypatch):
+    monkeypatch.delenv(PROFILE_HZ_ENV, raising=False)
+    monkeypatch.delenv(PROFILE_PORT_ENV, raising=False)
+    assert start_profiler_from_env("device-1") is None
+
+
+def test_one_profiler_per_process(monkeypatch):
+    monkeypatch.setenv(PROFILE_HZ_ENV, "50")
+    monkeypatch.delenv(PROFILE_PORT_ENV, raising=False)
+    monkeypatch.setattr(profiler_module, "_profiler", None)
+    first = start_profiler_from_env("device-1")
+    try:
+        assert first.running
+        # 第二个设备拿到同一个采样器，不会重复注册 SIGALRM
+        assert start_profiler_from_env("device-2") is first
+        assert first.name == "device-1"
+    finally:
+        first.stop()
+
+
+def test_thread_mode_collects_samples(tmp_path):
+    profiler = SamplingProfiler("test", hz=200, output_dir=str(tmp_path))
+    result = []
+    # 不在主线程启动时用后台线程采样
+    worker = threading.Thread(target=lambda: result.append(profiler.start().mode))
+    worker.start()
+    worker.join()
+    time.sleep(0.1)
+    profiler.stop()
+    assert result == ["thread"]
+    assert profiler.sample_count > 0
+    collapsed_path, _ = profiler.dump()
+    assert open(collapsed_path, encoding="utf-8").read()
+
+
+def test_signal_handler_does_not_take_the_lock(tmp_path):
+    profiler = SamplingProfiler("test", output_dir=str(tmp_path))
+    # 信号可能在主线程拿着锁读结果的时候到来
+    with profiler._lock:
+        profiler._on_signal(signal.SIGALRM, sys._getframe())
+    assert profiler.sample_count > 0
+
+
+def test_signal_mode_while_reading(tmp_path):
+    profiler = SamplingProfiler("test", hz=1000, output_dir=str(tmp_path)).start()
+    try:
+        assert profiler.mode == ("signal" if hasattr(signal, "setitimer") else "thread")
+        deadline = time.monotonic() + 0.2
+        while time.monotonic() < deadline:
+            profiler.samples()
+    finally:
+        profiler.stop()
+    assert profiler.sample_count > 0
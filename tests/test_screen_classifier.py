@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/31
+import cv2 as cv
+import numpy as np
+
+from game.ui.screen_classifier import Screen, ScreenClassifier
+
+
+def make_screen(seed: int) -> np.ndarray:
+    """
+    菜单一样的画面：渐变背景加几个色块，不同的 seed 是不同的界面
+    """
+    rng = np.random.default_rng(seed)
+    frame = np.zeros((360, 640, 3), dtype=np.uint8)
+    frame[:] = np.linspace(30, 200, 640, dtype=np.uint8)[None, :, None]
+    for _ in range(6):
+        x, y = rng.integers(0, 560), rng.integers(0, 300)
+        cv.rectangle(frame, (int(x), int(y)), (int(x) + 80, int(y) + 50), rng.integers(0, 255, 3).tolist(), -1)
+    return frame
+
+
+def jpeg(frame: np.ndarray, quality: int = 70) -> np.ndarray:
+    _, data = cv.imencode(".jpg", frame, [cv.IMWRITE_JPEG_QUALITY, quality])
+    return cv.imdecode(data, cv.IMREAD_COLOR)
+
+
+def test_empty_classifier(tmp_path):
+    classifier = ScreenClassifier(str(tmp_path / "signatures.json"))
+    assert not classifier.has_signature(Screen.TOWN)
+    assert classifier.classify(make_screen(1)) == (Screen.UNKNOWN, -1)
+    assert classifier.classify(None) == (Screen.UNKNOWN, -1)
+
+
+def test_record_and_classify(tmp_path):
+    classifier = ScreenClassifier(str(tmp_path / "signatures.json"))
+    classifier.record(Screen.TOWN, make_screen(1), save=False)
+    classifier.record(Screen.DUNGEON_SELECT, make_screen(2), save=False)
+    assert classifier.classify(make_screen(1)) == (Screen.TOWN, 0)
+    # 推流压缩的噪声不影响分类
+    name, distance = classifier.classify(jpeg(make_screen(2)))
+    assert name == Screen.DUNGEON_SELECT and distance <= 24
+    assert classifier.classify(make_screen(3))[0] == Screen.UNKNOWN
+
+
+def test_region_signature(tmp_path):
+    classifier = ScreenClassifier(str(tmp_path / "signatures.json"))
+    frame = make_screen(1)
+    classifier.record(Screen.SETTLEMENT, frame, region=(0.5, 0.5, 1.0, 1.0), save=False)
+    # 区域外的变化不影响分类
+    changed = frame.copy()
+    changed[:150, :300] = 0
+    assert classifier.classify(changed) == (Screen.SETTLEMENT, 0)
+
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / "signatures.json")
+    classifier = ScreenClassifier(path)
+    classifier.record(Screen.TOWN, make_screen(1))
+    classifier.record(Screen.TOWN, make_screen(2))
+    classifier.record(Screen.REWARD, make_screen(3), region=(0.0, 0.0, 0.5, 0.5))
+
+    restored = ScreenClassifier(path)
+    assert len(restored.signatures[Screen.TOWN].hashes) == 2
+    assert restored.signatures[Screen.REWARD].region == (0.0, 0.0, 0.5, 0.5)
+    assert restored.classify(make_screen(2)) == (Screen.TOWN, 0)
+    assert restored.classify(make_screen(3))[0] == Screen.REWARD
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/31
+import os
+from types import SimpleNamespace
+
+import numpy as np
+
+from device_manager.session_recorder import RECORD_SESSION_ENV, SessionRecorder, record_event, start_session_recorder
+from utils.example_mining import HardExampleMiner, load_session
+
+
+class FakeAdb:
+    def __init__(self):
+        self.last_screen = np.zeros((36, 64, 3), dtype=np.uint8)
+        self.listeners = []
+
+    def add_frame_listener(self, listener):
+        self.listeners.append(listener)
+
+    def remove_frame_listener(self, listener):
+        self.listeners.remove(listener)
+
+
+def test_disabled_without_env(monkeypatch):
+    monkeypatch.delenv(RECORD_SESSION_ENV, raising=False)
+    assert start_session_recorder(FakeAdb()) is None
+    monkeypatch.setenv(RECORD_SESSION_ENV, "0")
+    assert start_session_recorder(FakeAdb()) is None
+    # 没有录制时记录事件什么都不做
+    record_event(FakeAdb(), "stuck")
+
+
+def test_record_frames_and_events(tmp_path):
+    adb = FakeAdb()
+    recorder = SessionRecorder(adb, root=str(tmp_path), interval=0).start()
+    assert adb.listeners == [recorder._on_frame]
+    adb.listeners[0](adb.last_screen)
+    record_event(adb, "stuck", direction="left")
+    recorder.stop()
+    assert adb.listeners == []
+
+    frames, events = load_session(recorder.session_dir)
+    assert [frame["index"] for frame in frames] == [1, 2]
+    assert all(os.path.exists(frame["path"]) for frame in frames)
+    assert events[0]["event"] == "stuck" and events[0]["direction"] == "left" and events[0]["frame"] == 2
+
+
+def test_mine_creates_output_dir(tmp_path):
+    miner = HardExampleMiner(SimpleNamespace(class_names=["hero", "Monster"]))
+    output_dir = str(tmp_path / "hard_examples")
+    assert miner.mine([], output_dir) == []
+    with open(os.path.join(output_dir, "classes.txt"), encoding="utf-8") as f:
+        assert f.read().split() == ["hero", "Monster"]
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/31
+import cv2 as cv
+import numpy as np
+
+from data.coordinate import game_coordinate
+from game.ui.screen_classifier import Screen, ScreenClassifier
+from game.ui.state_machine import MenuStateMachine
+
+SCREEN_SEEDS = {Screen.TOWN: 1, Screen.TASK_DELEGATE: 2, Screen.DUNGEON_SELECT: 3, Screen.BATTLE: 4}
+
+
+def make_screen(seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    frame = np.zeros((360, 640, 3), dtype=np.uint8)
+    frame[:] = np.linspace(30, 200, 640, dtype=np.uint8)[None, :, None]
+    for _ in range(6):
+        x, y = rng.integers(0, 560), rng.integers(0, 300)
+        cv.rectangle(frame, (int(x), int(y)), (int(x) + 80, int(y) + 50), rng.integers(0, 255, 3).tolist(), -1)
+    return frame
+
+
+class FakeDevice:
+    """
+    点到跳转按钮就切换画面
+    """
+
+    def __init__(self, screen: str):
+        self.routes = {
+            id(game_coordinate.task_delegate): Screen.TASK_DELEGATE,
+            id(game_coordinate.move_to_enter_area): Screen.DUNGEON_SELECT,
+            id(game_coordinate.battle_start): Screen.BATTLE,
+        }
+        self.taps = []
+        self.last_screen = make_screen(SCREEN_SEEDS[screen])
+
+    def touch(self, coordinate, t=0.5):
+        self.taps.append(coordinate)
+        screen = self.routes.get(id(coordinate))
+        if screen is not None:
+            self.last_screen = make_screen(SCREEN_SEEDS[screen])
+
+
+def make_classifier(tmp_path, screens=tuple(SCREEN_SEEDS)) -> ScreenClassifier:
+    classifier = ScreenClassifier(str(tmp_path / "signatures.json"))
+    for screen in screens:
+        classifier.record(screen, make_screen(SCREEN_SEEDS[screen]), save=False)
+    return classifier
+
+
+def make_machine(device, classifier, **kwargs) -> MenuStateMachine:
+    return MenuStateMachine(device, classifier, poll_interval=0, tap_interval=0, blind_delay=0, **kwargs)
+
+
+def test_find_path(tmp_path):
+    ui = make_machine(FakeDevice(Screen.TOWN), make_classifier(tmp_path))
+    assert ui.find_path(Screen.TOWN, Screen.BATTLE, "bwj") == [Screen.TASK_DELEGATE, Screen.DUNGEON_SELECT, Screen.BATTLE]
+    assert ui.find_path(Screen.SETTLEMENT, Screen.TOWN, "bwj") == [Screen.TOWN]
+    assert ui.find_path(Screen.TOWN, Screen.TOWN, "bwj") == []
+    assert ui.find_path(Screen.BATTLE, Screen.TOWN, "bwj") is None
+
+
+def test_navigate_with_signatures(tmp_path):
+    device = FakeDevice(Screen.TOWN)
+    ui = make_machine(device, make_classifier(tmp_path))
+    assert ui.navigate(Screen.BATTLE, "bwj", timeout=5)
+    assert ui.current_screen() == Screen.BATTLE
+    assert device.taps == [
+        game_coordinate.task_delegate,
+        game_coordinate.special_place_dungeon, game_coordinate.mountain_ridge, game_coordinate.move_to_enter_area,
+        game_coordinate.bwj, game_coordinate.battle_start,
+    ]
+
+
+def test_navigate_without_signatures_fails_fast(tmp_path):
+    device = FakeDevice(Screen.TOWN)
+    ui = make_machine(device, make_classifier(tmp_path, screens=()))
+    assert not ui.navigate(Screen.DUNGEON_SELECT, "bwj", start=Screen.TOWN, timeout=5)
+    assert device.taps == []
+    # 没有指纹的界面不用等
+    assert ui.wait_for([Screen.TOWN], timeout=5) is None
+
+
+def test_navigate_blind(tmp_path):
+    device = FakeDevice(Screen.TOWN)
+    ui = make_machine(device, make_classifier(tmp_path, screens=()), allow_blind=True)
+    assert ui.navigate(Screen.DUNGEON_SELECT, "bwj", start=Screen.TOWN, timeout=5)
+    assert device.taps[-1] is game_coordinate.move_to_enter_area
+
+
+def test_navigate_partial_signatures(tmp_path):
+    # 只录了选图界面，从城镇出发的第一步没法确认
+    device = FakeDevice(Screen.TOWN)
+    ui = make_machine(device, make_classifier(tmp_path, screens=(Screen.DUNGEON_SELECT,)))
+    assert not ui.navigate(Screen.DUNGEON_SELECT, "bwj", start=Screen.TOWN, timeout=5)
+    assert device.taps == []
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/31
+from types import SimpleNamespace
+
+import numpy as np
+
+from utils.tiled_detector import TiledDetector, tile_boxes
+
+
+class FakeObject:
+    def __init__(self, label, prob, x, y, w, h):
+        self.label = label
+        self.prob = prob
+        self.rect = SimpleNamespace(x=x, y=y, w=w, h=h)
+
+
+class FakeModel:
+    """
+    只在分块识别时返回一个 equipment，记录每次收到的图片
+    """
+    class_names = ["hero", "equipment"]
+    nms_threshold = 0.45
+
+    def __init__(self):
+        self.inputs = []
+
+    def __call__(self, img, classes=None):
+        self.inputs.append(img)
+        if len(self.inputs) == 1:
+            return []
+        return [FakeObject(1, 0.9, 10, 10, 20, 20)]
+
+
+def test_tile_boxes_cover_region():
+    tiles = tile_boxes(2688, 1216, region=(0.0, 0.0, 1.0, 1.0), tile_size=1024, overlap=0.2)
+    assert min(t[0] for t in tiles) == 0 and max(t[2] for t in tiles) == 2688
+    assert min(t[1] for t in tiles) == 0 and max(t[3] for t in tiles) == 1216
+    assert all(t[2] - t[0] == 1024 for t in tiles)
+
+
+def test_tiles_are_contiguous():
+    model = FakeModel()
+    detector = TiledDetector(model, expected_classes=("equipment",), min_interval=0, report_interval=0)
+    img = np.random.randint(0, 255, (1216, 2688, 3), dtype=np.uint8)
+    result = detector(img)
+
+    tiles = model.inputs[1:]
+    assert tiles
+    for tile, (x1, y1, x2, y2) in zip(tiles, tile_boxes(2688, 1216)):
+        assert tile.flags["C_CONTIGUOUS"]
+        assert np.array_equal(tile, img[y1:y2, x1:x2])
+    # 每个块都识别到同一个位置的材料，平移回原图后坐标不同，不会被合并
+    assert len(result) == len(tiles)
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/23
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import cv2 as cv
+import numpy as np
+
+from device_manager.frame_rate import GamePhase
+from game.ui.screen_classifier import dhash, hamming_distance
+from utils.logger import logger
+
+# 菜单、加载画面是静止的，帧率也低（2 fps 帧间隔 0.5 秒），缓存要保留更久才能命中
+DEFAULT_PHASE_MAX_AGE = {
+    GamePhase.MENU: 5.0,
+}
+
+
+def frame_key(frame: cv.Mat, hash_size: int = 16) -> np.ndarray:
+    """
+    画面的缓存键，用界面分类同样的 dHash，只比较亮度的相对变化
+    :param frame: 画面
+    :param hash_size: dHash 的边长，越大越能区分细小的变化
+    :return: 按位打包后的指纹
+    """
+    return dhash(frame, hash_size)
+
+
+class DetectionCache:
+    """
+    识别结果的 LRU 缓存，按画面 dHash 的汉明距离查找，距离不超过容差就直接复用识别结果
+    推流压缩的噪声会翻转少量的位，容差要能盖住这些噪声
+    菜单、加载、站着不动的时候画面几乎不变，可以完全跳过推理
+    命中时刷新时间，画面一直不变就一直有效；战斗中位置要跟得上，只保留很短的时间，静止的阶段按 phase_max_age 保留更久
+    """
+
+    def __init__(self, capacity: int = 32, tolerance: int = 8, max_age: float = 0.5, phase_max_age: Dict[str, float] = None):
+        """
+        :param capacity: 最多缓存的画面数，超过后淘汰最久没用过的
+        :param tolerance: 汉明距离容差，256 位指纹默认 8，越大越容易复用但位置越可能过时
+        :param max_age: 缓存多久没有命中就过期；战斗画面的位置要跟得上，不要超过 1 秒，0 表示不过期
+        :param phase_max_age: 各阶段的过期时间，覆盖 max_age，默认菜单阶段 5 秒
+        """
+        self.capacity = capacity
+        self.tolerance = tolerance
+        self.max_age = max_age
+        self.phase_max_age = dict(DEFAULT_PHASE_MAX_AGE if phase_max_age is None else phase_max_age)
+        self.phase = None
+
+        # {序号: [指纹, 识别参数, 识别结果, 最近使用时间]}
+        self._entries: 'OrderedDict[int, list]' = OrderedDict()
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def set_phase(self, phase: str):
+        """
+        切换游戏阶段，按阶段调整过期时间
+        :param phase: GamePhase
+        :return:
+        """
+        self.phase = phase
+
+    @property
+    def current_max_age(self) -> float:
+        return self.phase_max_age.get(self.phase, self.max_age)
+
+    def _expire(self, now: float):
+        max_age = self.current_max_age
+        if not max_age:
+            return
+        for entry_id in [entry_id for entry_id, entry in self._entries.items() if now - entry[3] > max_age]:
+            del self._entries[entry_id]
+            self.evictions += 1
+
+    def _nearest(self, key: np.ndarray, tag) -> Optional[int]:
+        """
+        找指纹最接近并且在容差内的缓存
+        :return: 缓存序号，没有返回 None
+        """
+        ids = [entry_id for entry_id, entry in self._entries.items() if entry[1] == tag]
+        if not ids:
+            return None
+        distances = hamming_distance(key, np.stack([self._entries[entry_id][0] for entry_id in ids]))
+        best = int(distances.argmin())
+        return ids[best] if distances[best] <= self.tolerance else None
+
+    def lookup(self, key: np.ndarray, tag=None) -> Optional[list]:
+        """
+        查找相近画面的识别结果
+        :param key: frame_key 生成的缓存键
+        :param tag: 识别参数，比如只识别部分标签，参数不同的结果不能复用
+        :return: 没找到或者已经过期返回 None
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry_id = self._nearest(key, tag)
+            if entry_id is None:
+                self.misses += 1
+                return None
+            entry = self._entries[entry_id]
+            entry[3] = now
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            return entry[2]
+
+    def store(self, key: np.ndarray, result: list, tag=None):
+        """
+        缓存识别结果，容差内已有的旧结果直接替换
+        :param key: 缓存键
+        :param result: 识别结果
+        :param tag: 识别参数
+        :return:
+        """
+        with self._lock:
+            entry_id = self._nearest(key, tag)
+            if entry_id is not None:
+                del self._entries[entry_id]
+            self._entries[next(self._ids)] = [key, tag, list(result), time.monotonic()]
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hit_rate, 3),
+        }
+
+    def format_stats(self) -> str:
+        stats = self.stats()
+        return f"识别缓存：命中率 {stats['hit_rate']:.1%}，命中 {stats['hits']}，未命中 {stats['misses']}，淘汰 {stats['evictions']}"
+
+
+class CachedDetector:
+    """
+    在模型前面加一层识别缓存，用法和模型一样，其他属性透传给模型
+    """
+
+    def __init__(self, model, cache: DetectionCache = None, report_interval: float = 30):
+        """
+        :param model: 识别模型
+        :param cache: 识别缓存，不传使用默认配置
+        :param report_interval: 定时输出命中率的间隔，0 表示不输出
+        """
+        self.model = model
+        self.cache = cache or DetectionCache()
+        self.report_interval = report_interval
+        self._last_report = time.monotonic()
+
+    def set_phase(self, phase: str):
+        """
+        切换游戏阶段，缓存按阶段调整过期时间
+        :param phase: GamePhase
+        :return:
+        """
+        self.cache.set_phase(phase)
+
+    def __call__(self, img: cv.Mat, classes=None) -> List:
+        now = time.monotonic()
+        if self.report_interval and now - self._last_report >= self.report_interval:
+            self._last_report = now
+            logger.info(self.cache.format_stats())
+
+        tag = tuple(classes) if classes is not None else None
+        key = frame_key(img)
+        result = self.cache.lookup(key, tag)
+        if result is not None:
+            return list(result)
+        result = self.model(img, classes=classes)
+        self.cache.store(key, result, tag)
+        return result
+
+    def __getattr__(self, name):
+        # 还没初始化完的时候不要透传，避免无限递归
+        if name == "model":
+            raise AttributeError(name)
+        return getattr(self.model, name)
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/25
+import queue
+import threading
+import time
+from typing import Callable, List
+
+from utils.logger import logger
+
+# 每个阶段的耗时统计用最近多少帧
+_STAGE_WINDOW = 100
+
+DetectionCallback = Callable[[object, List, List[str]], None]
+ErrorCallback = Callable[[object, Exception], None]
+
+
+class _Stop:
+    pass
+
+
+class _Job:
+    """
+    流水线里的一帧，各阶段依次填充
+    """
+    __slots__ = ("frame", "callback", "on_error", "classes", "model", "data", "meta")
+
+    def __init__(self, frame, callback: DetectionCallback, on_error: ErrorCallback, classes):
+        self.frame = frame
+        self.callback = callback
+        self.on_error = on_error
+        self.classes = classes
+        self.model = None
+        self.data = None
+        self.meta = None
+
+
+class DetectionPipeline:
+    """
+    三段流水线识别：预处理、推理、后处理各一个线程，阶段之间用有界队列连接
+    第 N 帧推理的同时，第 N+1 帧在预处理、第 N-1 帧在后处理，持续吞吐接近纯网络推理的耗时
+    单帧延迟不会变短，对延迟要求高的场景不要开
+    只调用模型的 preprocess / inference / postprocess，识别缓存和帧差门控不生效
+    """
+
+    def __init__(self, model_getter: Callable[[], object], queue_size: int = 2, report_interval: float = 30):
+        """
+        :param model_getter: 获取当前模型，每帧在预处理时取一次，模型热切换后新帧自动用新模型
+        :param queue_size: 阶段之间的队列长度
+        :param report_interval: 定时输出各阶段耗时的间隔，0 表示不输出
+        """
+        self.model_getter = model_getter
+        self.queue_size = queue_size
+        self.report_interval = report_interval
+        self._last_report = time.monotonic()
+
+        self._preprocess_queue = queue.Queue(maxsize=queue_size)
+        self._inference_queue = queue.Queue(maxsize=queue_size)
+        self._postprocess_queue = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        self._stage_times = {"preprocess": [], "inference": [], "postprocess": []}
+        self._stats_lock = threading.Lock()
+        self.submitted = 0
+        self.dropped = 0
+        self.completed = 0
+
+    def start(self) -> 'DetectionPipeline':
+        if self._threads:
+            return self
+        stages = [
+            ("preprocess", self._preprocess_queue, self._inference_queue, self._preprocess),
+            ("inference", self._inference_queue, self._postprocess_queue, self._inference),
+            ("postprocess", self._postprocess_queue, None, self._postprocess),
+        ]
+        for name, in_queue, out_queue, func in stages:
+            thread = threading.Thread(target=self._run_stage, args=(name, in_queue, out_queue, func),
+                                      name=f"detect-{name}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        """
+        停止流水线，已经提交的帧处理完再退出
+        :return:
+        """
+        if not self._threads:
+            return
+        self._preprocess_queue.put(_Stop())
+        for thread in self._threads:
+            thread.join(timeout=2)
+        self._threads = []
+
+    def submit(self, frame, callback: DetectionCallback, block: bool = False, classes=None,
+               on_error: ErrorCallback = None) -> bool:
+        """
+        提交一帧，识别完成后在后处理线程里回调 callback(帧, 识别结果, 标签名称列表)
+        :param frame: 画面
+        :param callback: 回调，不要做耗时操作，会拖慢后处理
+        :param block: 流水线满了是否等待，默认直接丢掉这一帧，不阻塞推流线程
+        :param classes: 只要这些标签，None 表示全部
+        :param on_error: 某个阶段出错时回调 on_error(帧, 异常)，这一帧不会再回调 callback；不传只记日志
+        :return: 是否提交成功
+        """
+        try:
+            self._preprocess_queue.put(_Job(frame, callback, on_error, classes), block=block)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.submitted += 1
+        return True
+
+    def __call__(self, frame, classes=None, timeout: float = 5) -> List:
+        """
+        同步识别一帧，等流水线处理完返回
+        :param frame:
+        :param classes: 只要这些标签，None 表示全部
+        :param timeout: 超时抛出 TimeoutError
+        :return: 某个阶段出错时直接抛出那个异常
+        """
+        done = threading.Event()
+        box = []
+        errors = []
+
+        def _callback(_, result, __):
+            box.append(result)
+            done.set()
+
+        def _on_error(_, error):
+            errors.append(error)
+            done.set()
+
+        self.submit(frame, _callback, block=True, classes=classes, on_error=_on_error)
+        if not done.wait(timeout):
+            raise TimeoutError("detection pipeline timeout")
+        if errors:
+            raise errors[0]
+        return box[0]
+
+    def _run_stage(self, name: str, in_queue: queue.Queue, out_queue: queue.Queue, func):
+        while True:
+            item = in_queue.get()
+            if isinstance(item, _Stop):
+                if out_queue is not None:
+                    out_queue.put(item)
+                return
+            start = time.perf_counter()
+            try:
+                func(item)
+            except Exception as e:
+                self._fail(name, item, e)
+                continue
+            self._record(name, time.perf_counter() - start)
+            if out_queue is not None:
+                out_queue.put(item)
+
+    @staticmethod
+    def _fail(name: str, job: _Job, error: Exception):
+        """
+        某个阶段出错，这一帧不再往下走，交给提交方处理，同步调用的不用等到超时
+        :return:
+        """
+        if job.on_error is None:
+            logger.error(f"识别流水线 {name} 出错：{error}")
+            return
+        try:
+            job.on_error(job.frame, error)
+        except Exception as e:
+            logger.error(e)
+
+    def _preprocess(self, job: _Job):
+        job.model = self.model_getter()
+        job.data, job.meta = job.model.preprocess(job.frame)
+
+    def _inference(self, job: _Job):
+        job.data = job.model.inference(job.data)
+
+    def _postprocess(self, job: _Job):
+        result = job.model.postprocess(job.data, job.meta, job.classes)
+        self.completed += 1
+        job.callback(job.frame, result, job.model.class_names)
+
+        now = time.monotonic()
+        if self.report_interval and now - self._last_report >= self.report_interval:
+            self._last_report = now
+            logger.info(self.format_stats(), extra=self.stats())
+
+    def _record(self, name: str, seconds: float):
+        with self._stats_lock:
+            times = self._stage_times[name]
+            times.append(seconds)
+            if len(times) > _STAGE_WINDOW:
+                del times[0]
+
+    def stats(self) -> dict:
+        """
+        各阶段最近的平均耗时（毫秒）和丢帧数
+        :return:
+        """
+        with self._stats_lock:
+            stage_ms = {name: round(sum(t) / len(t) * 1000, 2) if t else 0.0 for name, t in self._stage_times.items()}
+        return {"stage_ms": stage_ms, "submitted": self.submitted, "completed": self.completed, "dropped": self.dropped}
+
+    def format_stats(self) -> str:
+        stats = self.stats()
+        stages = "，".join(f"{name} {ms}ms" for name, ms in stats["stage_ms"].items())
+        return f"识别流水线：{stages}，完成 {stats['completed']} 帧，丢弃 {stats['dropped']} 帧"
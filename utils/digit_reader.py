@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/18
+import glob
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import cv2 as cv
+import numpy as np
+
+from utils.path_manager import PathManager
+
+# 文件名不能直接用的字符
+GLYPH_FILE_NAMES = {"/": "slash", ":": "colon", ",": "comma", ".": "dot"}
+
+_template_cache: Dict[Tuple[str, str, Tuple[int, int]], Tuple[List[str], np.ndarray]] = {}
+_template_cache_lock = threading.Lock()
+
+
+def binarize(roi: cv.Mat, threshold: int = None) -> np.ndarray:
+    """
+    HUD 数字是浅色描边字，转灰度后二值化，不传阈值用 OTSU
+    :param roi: 数字区域
+    :param threshold: 二值化阈值
+    :return: bool 数组
+    """
+    gray = cv.cvtColor(roi, cv.COLOR_BGR2GRAY) if roi.ndim == 3 else roi
+    if threshold is None:
+        _, binary = cv.threshold(gray, 0, 255, cv.THRESH_BINARY | cv.THRESH_OTSU)
+    else:
+        _, binary = cv.threshold(gray, threshold, 255, cv.THRESH_BINARY)
+    return binary > 0
+
+
+def segment_glyphs(binary: np.ndarray, min_width: int = 1) -> List[np.ndarray]:
+    """
+    按列投影切分字符
+    :param binary: 二值图
+    :param min_width: 最小字符宽度，过滤噪点
+    :return: 每个字符裁掉空白后的二值图
+    """
+    columns = binary.any(axis=0).astype(np.int8)
+    edges = np.diff(np.concatenate(([0], columns, [0])))
+    starts = np.where(edges == 1)[0]
+    ends = np.where(edges == -1)[0]
+    glyphs = []
+    for start, end in zip(starts, ends):
+        if end - start < min_width:
+            continue
+        glyph = binary[:, start:end]
+        rows = np.where(glyph.any(axis=1))[0]
+        glyphs.append(glyph[rows[0]:rows[-1] + 1])
+    return glyphs
+
+
+def normalize_glyphs(glyphs: List[np.ndarray], size: Tuple[int, int]) -> np.ndarray:
+    """
+    缩放到统一尺寸并归一化为零均值单位长度的向量，点积就是相关系数
+    :param glyphs: 字符二值图
+    :param size: (宽, 高)
+    :return: (n, 宽 * 高)
+    """
+    vectors = np.empty((len(glyphs), size[0] * size[1]), dtype=np.float32)
+    for i, glyph in enumerate(glyphs):
+        vectors[i] = cv.resize(glyph.astype(np.float32), size, interpolation=cv.INTER_AREA).ravel()
+    vectors -= vectors.mean(axis=1, keepdims=True)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-6)
+    return vectors
+
+
+def load_templates(font: str, glyph_dir: str, size: Tuple[int, int]) -> Tuple[List[str], np.ndarray]:
+    """
+    读取字符模板，按字体和尺寸缓存
+    模板放在 data/glyphs/<字体>/<字符>.png，用 extract_glyphs 从截图里切出来
+    :return: (字符列表, 模板矩阵)
+    """
+    key = (font, glyph_dir, size)
+    with _template_cache_lock:
+        if key in _template_cache:
+            return _template_cache[key]
+
+        file_to_char = {v: k for k, v in GLYPH_FILE_NAMES.items()}
+        chars, glyphs = [], []
+        for path in sorted(glob.glob(os.path.join(glyph_dir, font, "*.png"))):
+            name = os.path.splitext(os.path.basename(path))[0]
+            # 同一个字符可以有多张模板，文件名写成 3_1.png、3_2.png
+            char = file_to_char.get(name.split("_")[0], name.split("_")[0])
+            image = cv.imread(path, cv.IMREAD_GRAYSCALE)
+            if image is None:
+                continue
+            glyph_list = segment_glyphs(image > 127)
+            if glyph_list:
+                chars.append(char)
+                glyphs.append(glyph_list[0])
+        if not glyphs:
+            raise FileNotFoundError(f"no glyph templates in {os.path.join(glyph_dir, font)}")
+        _template_cache[key] = (chars, normalize_glyphs(glyphs, size))
+        return _template_cache[key]
+
+
+class DigitReader:
+    """
+    HUD 数字识别，固定区域 + 字符模板相关匹配，单次识别 1 ms 左右，不依赖 OCR
+    """
+
+    def __init__(self, font: str = "hud", glyph_dir: str = PathManager.GLYPH_PATH, size: Tuple[int, int] = (8, 12),
+                 threshold: int = None, min_score: float = 0.6):
+        """
+        :param font: 字体名称，对应 data/glyphs 下的目录
+        :param glyph_dir: 模板根目录
+        :param size: 匹配时统一缩放的尺寸 (宽, 高)
+        :param threshold: 二值化阈值，不传用 OTSU
+        :param min_score: 最低相关系数，任何一个字符低于这个值整次识别都算失败
+        """
+        self.font = font
+        self.glyph_dir = glyph_dir
+        self.size = size
+        self.threshold = threshold
+        self.min_score = min_score
+
+    def has_templates(self) -> bool:
+        """
+        字符模板是否存在，没有模板时什么都识别不了
+        :return:
+        """
+        try:
+            load_templates(self.font, self.glyph_dir, self.size)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def read_text(self, roi: cv.Mat) -> Optional[str]:
+        """
+        识别区域里的字符
+        漏掉一个字符会得到看起来正常但是错误的数字（156 变成 16，156/188 变成 156188），有字符认不出来时整次识别失败
+        :param roi: 数字区域
+        :return: 有字符低于 min_score 时返回 None
+        """
+        chars, templates = load_templates(self.font, self.glyph_dir, self.size)
+        glyphs = segment_glyphs(binarize(roi, self.threshold))
+        if not glyphs:
+            return ""
+        # 所有字符和所有模板一次矩阵乘法算完相关系数
+        scores = normalize_glyphs(glyphs, self.size) @ templates.T
+        best = scores.argmax(axis=1)
+        if (scores[np.arange(len(best)), best] < self.min_score).any():
+            return None
+        return "".join(chars[j] for j in best)
+
+    def read_int(self, roi: cv.Mat, separator: str = None) -> Optional[int]:
+        """
+        识别整数，比如金币；带分隔符的只取第一段，比如疲劳值 156/188 返回 156
+        :param roi: 数字区域
+        :param separator: 分隔符
+        :return: 识别失败返回 None
+        """
+        text = self.read_text(roi)
+        if text is None:
+            return None
+        if separator:
+            text = text.split(separator)[0]
+        digits = "".join(c for c in text if c.isdigit())
+        return int(digits) if digits else None
+
+
+def crop_region(frame: cv.Mat, top_left: Tuple[int, int], bottom_right: Tuple[int, int]) -> cv.Mat:
+    (x1, y1), (x2, y2) = top_left, bottom_right
+    return frame[max(0, y1):y2, max(0, x1):x2]
+
+
+def extract_glyphs(roi: cv.Mat, text: str, font: str = "hud", glyph_dir: str = PathManager.GLYPH_PATH, threshold: int = None) -> int:
+    """
+    从已知内容的截图区域切出字符模板，已经存在的字符追加编号保存
+    :param roi: 数字区域
+    :param text: 区域里的文字，比如 "156/188"
+    :param font: 字体名称
+    :param glyph_dir: 模板根目录
+    :param threshold: 二值化阈值
+    :return: 保存的模板数量
+    """
+    glyphs = segment_glyphs(binarize(roi, threshold))
+    if len(glyphs) != len(text):
+        raise ValueError(f"segmented {len(glyphs)} glyphs but text has {len(text)} chars")
+    font_dir = os.path.join(glyph_dir, font)
+    os.makedirs(font_dir, exist_ok=True)
+    saved = 0
+    for char, glyph in zip(text, glyphs):
+        name = GLYPH_FILE_NAMES.get(char, char)
+        path = os.path.join(font_dir, f"{name}.png")
+        index = 1
+        while os.path.exists(path):
+            path = os.path.join(font_dir, f"{name}_{index}.png")
+            index += 1
+        # 四周留 1 像素空白，读取时才能正确切分
+        cv.imwrite(path, np.pad(glyph.astype(np.uint8) * 255, 1))
+        saved += 1
+    with _template_cache_lock:
+        _template_cache.clear()
+    return saved
@@ -0,0 +1,372 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/14
+import glob
+import os
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Sequence, Tuple
+
+import cv2 as cv
+import numpy as np
+
+IMAGE_SUFFIXES = (".png", ".jpg", ".jpeg", ".bmp")
+
+# 必须识别可靠的关键类别，挑模型和调参数的时候重点看这几个
+KEY_LABELS = ("hero", "Monster", "Monster_ds", "Monster_szt", "go")
+
+
+def load_yolo_labels(label_path: str, img_w: int, img_h: int) -> np.ndarray:
+    """
+    读取 yolo 格式的标注，每行是 class cx cy w h，坐标是相对图片宽高的比例
+    :param label_path: 标注文件
+    :param img_w: 图片宽
+    :param img_h: 图片高
+    :return: (n, 6) 数组，每行是 label, 1, x1, y1, x2, y2
+    """
+    if not os.path.exists(label_path):
+        return np.zeros((0, 6), dtype=np.float32)
+    rows = []
+    with open(label_path, encoding="utf-8") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) < 5:
+                continue
+            label, cx, cy, w, h = int(parts[0]), *map(float, parts[1:5])
+            rows.append([
+                label, 1.0,
+                (cx - w / 2) * img_w, (cy - h / 2) * img_h,
+                (cx + w / 2) * img_w, (cy + h / 2) * img_h,
+            ])
+    return np.array(rows, dtype=np.float32).reshape(-1, 6)
+
+
+def find_labelled_images(path: str) -> List[Tuple[str, str]]:
+    """
+    查找带标注的图片，支持图片和标注放在同一个目录，或者 images/ labels/ 两个子目录
+    :param path: 数据目录
+    :return: [(图片路径, 标注路径), ...]
+    """
+    image_dir = os.path.join(path, "images")
+    label_dir = os.path.join(path, "labels")
+    if not os.path.isdir(image_dir):
+        image_dir = label_dir = path
+
+    pairs = []
+    for image_path in sorted(glob.glob(os.path.join(image_dir, "*"))):
+        if not image_path.lower().endswith(IMAGE_SUFFIXES):
+            continue
+        stem = os.path.splitext(os.path.basename(image_path))[0]
+        pairs.append((image_path, os.path.join(label_dir, stem + ".txt")))
+    return pairs
+
+
+def average_precision(scores: List[Tuple[float, bool]], num_ground_truth: int) -> float:
+    """
+    计算单个类别的 AP，按 VOC 的全点插值方式
+    :param scores: [(置信度, 是否命中), ...]
+    :param num_ground_truth: 真实框数量
+    :return:
+    """
+    if not num_ground_truth:
+        return 0.0
+    if not scores:
+        return 0.0
+    scores = sorted(scores, key=lambda item: -item[0])
+    hits = np.array([hit for _, hit in scores], dtype=np.float64)
+    tp = np.cumsum(hits)
+    fp = np.cumsum(1 - hits)
+    recall = tp / num_ground_truth
+    precision = tp / np.maximum(tp + fp, 1e-9)
+
+    recall = np.concatenate(([0.0], recall, [1.0]))
+    precision = np.concatenate(([1.0], precision, [0.0]))
+    # 让准确率单调不增
+    precision = np.flip(np.maximum.accumulate(np.flip(precision)))
+    index = np.where(recall[1:] != recall[:-1])[0]
+    return float(np.sum((recall[index + 1] - recall[index]) * precision[index + 1]))
+
+
+def detections_to_array(objs) -> np.ndarray:
+    """
+    检测结果转换成 (n, 6) 数组，每行是 label, prob, x1, y1, x2, y2
+    :param objs: Detect_Object 列表
+    :return:
+    """
+    if not len(objs):
+        return np.zeros((0, 6), dtype=np.float32)
+    return np.array(
+        [[obj.label, obj.prob, obj.rect.x, obj.rect.y, obj.rect.x + obj.rect.w, obj.rect.y + obj.rect.h] for obj in objs],
+        dtype=np.float32,
+    )
+
+
+def box_iou(boxes1: np.ndarray, boxes2: np.ndarray) -> np.ndarray:
+    """
+    计算两组框的 iou 矩阵
+    :param boxes1: (n, 4) x1, y1, x2, y2
+    :param boxes2: (m, 4) x1, y1, x2, y2
+    :return: (n, m)
+    """
+    lt = np.maximum(boxes1[:, None, :2], boxes2[None, :, :2])
+    rb = np.minimum(boxes1[:, None, 2:], boxes2[None, :, 2:])
+    inter = np.clip(rb - lt, 0, None).prod(axis=2)
+    area1 = (boxes1[:, 2:] - boxes1[:, :2]).prod(axis=1)
+    area2 = (boxes2[:, 2:] - boxes2[:, :2]).prod(axis=1)
+    return inter / np.maximum(area1[:, None] + area2[None, :] - inter, 1e-9)
+
+
+def match_detections(preds: np.ndarray, truths: np.ndarray, iou_threshold: float = 0.5) -> np.ndarray:
+    """
+    按置信度从高到低把预测框和真实框一对一匹配，同类且 iou 达到阈值算命中
+    :param preds: (n, 6) 预测框
+    :param truths: (m, 6) 真实框，prob 列忽略
+    :param iou_threshold: iou 阈值
+    :return: (n,) 每个预测框是否命中
+    """
+    hits = np.zeros(len(preds), dtype=bool)
+    if not len(preds) or not len(truths):
+        return hits
+
+    order = np.argsort(-preds[:, 1])
+    iou = box_iou(preds[:, 2:6], truths[:, 2:6])
+    # 不同类别的框不能互相匹配
+    iou[preds[:, 0:1] != truths[None, :, 0]] = 0
+    used = np.zeros(len(truths), dtype=bool)
+    for i in order:
+        candidates = np.where(~used, iou[i], 0)
+        j = int(candidates.argmax())
+        if candidates[j] >= iou_threshold:
+            hits[i] = True
+            used[j] = True
+    return hits
+
+
+class DetectionMatcher:
+    """
+    累计多帧的匹配结果，计算每个类别的准确率和召回率
+    """
+
+    def __init__(self, iou_threshold: float = 0.5):
+        self.iou_threshold = iou_threshold
+        self.true_positive = defaultdict(int)
+        self.false_positive = defaultdict(int)
+        self.ground_truth = defaultdict(int)
+        self.scores = defaultdict(list)
+
+    def add(self, preds: np.ndarray, truths: np.ndarray):
+        """
+        加入一帧的预测和真实框
+        :param preds: (n, 6)
+        :param truths: (m, 6)
+        :return:
+        """
+        hits = match_detections(preds, truths, self.iou_threshold)
+        for label in truths[:, 0].astype(int):
+            self.ground_truth[int(label)] += 1
+        for (label, prob), hit in zip(preds[:, :2], hits):
+            label = int(label)
+            self.scores[label].append((float(prob), bool(hit)))
+            if hit:
+                self.true_positive[label] += 1
+            else:
+                self.false_positive[label] += 1
+
+    def labels(self) -> List[int]:
+        return sorted(set(self.ground_truth) | set(self.scores))
+
+    def precision_recall(self) -> Dict[int, dict]:
+        """
+        每个类别的准确率和召回率
+        :return:
+        """
+        result = {}
+        for label in self.labels():
+            tp = self.true_positive[label]
+            fp = self.false_positive[label]
+            gt = self.ground_truth[label]
+            result[label] = {
+                "precision": tp / (tp + fp) if tp + fp else 0.0,
+                "recall": tp / gt if gt else 0.0,
+                "ground_truth": gt,
+                "predictions": tp + fp,
+                "ap50": average_precision(self.scores[label], gt),
+            }
+        return result
+
+    def mean_average_precision(self, labels: List[int] = None) -> float:
+        """
+        mAP@0.5，只统计有真实框的类别
+        :param labels: 只统计这些类别，不传统计全部
+        :return:
+        """
+        labels = [label for label in (labels or self.labels()) if self.ground_truth[label]]
+        if not labels:
+            return 0.0
+        return float(np.mean([average_precision(self.scores[label], self.ground_truth[label]) for label in labels]))
+
+
+def latency_summary(latencies: Sequence[float]) -> dict:
+    """
+    耗时统计，单位毫秒
+    :param latencies: 每帧耗时，单位秒
+    :return:
+    """
+    if not len(latencies):
+        return {"fps": 0.0, "mean_ms": 0.0, "p50_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0}
+    ms = np.asarray(latencies, dtype=np.float64) * 1000
+    return {
+        "fps": len(ms) / ms.sum() * 1000 if ms.sum() else 0.0,
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "max_ms": float(ms.max()),
+    }
+
+
+def evaluate_detector(detector, dataset_dir: str, iou_threshold: float = 0.5, key_labels: Sequence[str] = KEY_LABELS,
+                      warm_up: int = 3, limit: int = None) -> dict:
+    """
+    在标注好的回放数据上测试识别器的准确率、召回率、mAP@0.5 和耗时
+    识别器只要能 detector(frame) 返回 Detect_Object 列表并且有 class_names，分块、缓存等包装过的模型也可以
+    :param detector: 识别器
+    :param dataset_dir: 标注数据目录，yolo 格式
+    :param iou_threshold: iou 阈值
+    :param key_labels: 关键类别，单独算一个 mAP
+    :param warm_up: 预热帧数，不计入耗时和准确率
+    :param limit: 最多测试多少张
+    :return:
+    """
+    pairs = find_labelled_images(dataset_dir)[:limit]
+    if not pairs:
+        raise FileNotFoundError(f"{dataset_dir} has no images")
+    for image_path, _ in pairs[:warm_up]:
+        frame = cv.imread(image_path)
+        if frame is not None:
+            detector(frame)
+
+    class_names = list(detector.class_names)
+    matcher = DetectionMatcher(iou_threshold)
+    latencies = []
+    for image_path, label_path in pairs:
+        frame = cv.imread(image_path)
+        if frame is None:
+            continue
+        truths = load_yolo_labels(label_path, frame.shape[1], frame.shape[0])
+        t = time.perf_counter()
+        result = detector(frame)
+        latencies.append(time.perf_counter() - t)
+        matcher.add(detections_to_array(result), truths)
+
+    per_class = {
+        class_names[label]: value for label, value in matcher.precision_recall().items()
+        if label < len(class_names)
+    }
+    key_ids = [class_names.index(label) for label in key_labels if label in class_names]
+    return {
+        "frames": len(latencies),
+        **latency_summary(latencies),
+        "map50": matcher.mean_average_precision(),
+        "key_map50": matcher.mean_average_precision(key_ids),
+        "per_class": per_class,
+    }
+
+
+def compare_detectors(detectors: Dict[str, object], dataset_dir: str, **kwargs) -> List[dict]:
+    """
+    在同一份标注数据上对比多个识别器，第一个作为基准，给出 mAP 变化和提速倍数
+    用来判断缩小输入尺寸、量化、分块这类提速改动掉了多少点
+    :param detectors: {名称: 识别器}
+    :param dataset_dir: 标注数据目录
+    :param kwargs: 传给 evaluate_detector 的参数
+    :return:
+    """
+    report = []
+    for name, detector in detectors.items():
+        item = evaluate_detector(detector, dataset_dir, **kwargs)
+        item["name"] = name
+        report.append(item)
+
+    baseline = report[0]
+    for item in report:
+        item["map_delta"] = item["map50"] - baseline["map50"]
+        item["key_map_delta"] = item["key_map50"] - baseline["key_map50"]
+        item["speedup"] = baseline["mean_ms"] / item["mean_ms"] if item["mean_ms"] else 0.0
+    return report
+
+
+def format_evaluation_report(report: List[dict], labels: Sequence[str] = None) -> str:
+    """
+    :param report: compare_detectors 的结果
+    :param labels: 逐类输出的类别，不传输出全部
+    :return:
+    """
+    lines = []
+    for item in report:
+        lines.append(
+            f"{item['name']}: {item['frames']} 帧，平均 {item['mean_ms']:.1f} ms，p95 {item['p95_ms']:.1f} ms，"
+            f"提速 {item['speedup']:.2f}x，mAP@0.5 {item['map50']:.3f}（{item['map_delta']:+.3f}），"
+            f"关键类别 mAP@0.5 {item['key_map50']:.3f}（{item['key_map_delta']:+.3f}）"
+        )
+        for label, value in item["per_class"].items():
+            if labels and label not in labels:
+                continue
+            lines.append(
+                f"    {label}: AP {value['ap50']:.3f} precision {value['precision']:.3f} "
+                f"recall {value['recall']:.3f} ({value['ground_truth']})"
+            )
+    return "\n".join(lines)
+
+
+def parse_variant(text: str) -> Tuple[str, dict]:
+    """
+    解析命令行的识别器配置，格式是 模型名:参数=值,参数=值，比如 new:target_size=480,prob_threshold=0.3
+    :param text:
+    :return: (模型名, 参数)
+    """
+    model, _, options = text.partition(":")
+    kwargs = {}
+    for option in filter(None, options.split(",")):
+        key, _, value = option.partition("=")
+        for cast in (int, float):
+            try:
+                value = cast(value)
+                break
+            except ValueError:
+                continue
+        kwargs[key.strip()] = value
+    return model, kwargs
+
+
+def build_detector(model: str, tiled: bool = False, **kwargs):
+    """
+    按配置创建识别器
+    :param model: manifest 里的模型名称
+    :param tiled: 是否包一层分块识别
+    :param kwargs: 传给 YoloV5s 的参数
+    :return:
+    """
+    from utils.yolov5 import YoloV5s
+
+    detector = YoloV5s(model=model or None, **kwargs)
+    if tiled:
+        from utils.tiled_detector import TiledDetector
+
+        detector = TiledDetector(detector, report_interval=0)
+    return detector
+
+
+if __name__ == '__main__':
+    # python -m utils.evaluation data/replay new new:target_size=480 new-int8 new:tiled=1
+    from utils.logger import logger
+
+    dataset = sys.argv[1]
+    variants = sys.argv[2:] or [""]
+    detectors = {}
+    for variant in variants:
+        name, options = parse_variant(variant)
+        options.setdefault("num_threads", 4)
+        detectors[variant or "default"] = build_detector(name, **options)
+    logger.info("\n" + format_evaluation_report(compare_detectors(detectors, dataset)))
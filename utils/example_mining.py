@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/28
+import glob
+import json
+import os
+import shutil
+import sys
+from collections import Counter
+from typing import Dict, List, Sequence, Tuple
+
+import cv2 as cv
+import numpy as np
+
+from game.ui.screen_classifier import dhash, hamming_distance
+from utils.logger import logger
+from utils.path_manager import PathManager
+
+# 这些类别的数量在相邻帧之间来回跳，说明模型在这一帧上不稳定
+FLICKER_LABELS = ("hero", "Monster", "Monster_ds", "Monster_szt", "equipment", "go")
+
+# 副本内才会出现的类别，用来判断没识别到英雄是不是漏检
+DUNGEON_LABELS = ("Monster", "Monster_ds", "Monster_szt", "equipment", "go", "go_d", "go_r", "go_u", "map")
+
+
+def _read_jsonl(path: str) -> List[dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def load_session(session_dir: str) -> Tuple[List[dict], List[dict]]:
+    """
+    读取 SessionRecorder 录制的对局，没有 frames.jsonl 时按图片文件名排序，兼容 img_collection.py 采集的截图目录
+    :param session_dir: 录制目录
+    :return: (帧列表 [{"index", "time", "path"}], 事件列表)
+    """
+    frames = _read_jsonl(os.path.join(session_dir, "frames.jsonl"))
+    if frames:
+        for frame in frames:
+            frame["path"] = os.path.join(session_dir, "frames", frame["file"])
+    else:
+        files = sorted(
+            f for f in glob.glob(os.path.join(session_dir, "*"))
+            if f.lower().endswith((".png", ".jpg", ".jpeg", ".bmp"))
+        )
+        frames = [{"index": i + 1, "time": None, "path": f} for i, f in enumerate(files)]
+    return frames, _read_jsonl(os.path.join(session_dir, "events.jsonl"))
+
+
+def to_yolo_labels(objs, img_w: int, img_h: int) -> List[str]:
+    """
+    识别结果转换成 yolo 格式的标注，每行是 class cx cy w h，坐标是相对图片宽高的比例
+    :param objs: Detect_Object 列表
+    :param img_w: 图片宽
+    :param img_h: 图片高
+    :return:
+    """
+    lines = []
+    for obj in objs:
+        x1, y1 = max(0.0, float(obj.rect.x)), max(0.0, float(obj.rect.y))
+        x2, y2 = min(float(img_w), float(obj.rect.x + obj.rect.w)), min(float(img_h), float(obj.rect.y + obj.rect.h))
+        if x2 <= x1 or y2 <= y1:
+            continue
+        lines.append(
+            f"{int(obj.label)} {(x1 + x2) / 2 / img_w:.6f} {(y1 + y2) / 2 / img_h:.6f} "
+            f"{(x2 - x1) / img_w:.6f} {(y2 - y1) / img_h:.6f}"
+        )
+    return lines
+
+
+class HardExampleMiner:
+    """
+    难例挖掘：用模型跑一遍录制的对局生成伪标注，挑出模型表现不好的帧，人工修正标注后加到训练集
+    难例包括：英雄置信度低、英雄数量不对、相邻帧之间数量来回跳、卡死 / 过图失败等事件前后的帧
+    相似的画面按 dHash 去重，避免同一个场景重复标注
+    """
+
+    def __init__(self, model, hero_conf: float = 0.5, hash_distance: int = 6, event_window: float = 2.0,
+                 flicker_labels: Sequence[str] = FLICKER_LABELS):
+        """
+        :param model: 识别模型
+        :param hero_conf: 英雄置信度低于这个值算难例
+        :param hash_distance: dHash 汉明距离小于等于这个值算重复画面
+        :param event_window: 事件发生前多少秒内的帧算难例
+        :param flicker_labels: 检查数量跳变的类别
+        """
+        self.model = model
+        self.hero_conf = hero_conf
+        self.hash_distance = hash_distance
+        self.event_window = event_window
+        self.flicker_labels = [label for label in flicker_labels if label in model.class_names]
+        self._hashes: List[np.ndarray] = []
+
+    def _counts(self, result) -> Counter:
+        return Counter(self.model.class_names[int(obj.label)] for obj in result)
+
+    def frame_reasons(self, result, counts: Counter, prev_counts: Counter = None, next_counts: Counter = None) -> List[str]:
+        """
+        判断一帧是不是难例
+        :param result: 这一帧的识别结果
+        :param counts: 这一帧每个类别的数量
+        :param prev_counts: 上一帧每个类别的数量
+        :param next_counts: 下一帧每个类别的数量
+        :return: 难例原因，不是难例返回空列表
+        """
+        reasons = []
+        hero_probs = [float(obj.prob) for obj in result if self.model.class_names[int(obj.label)] == "hero"]
+        if len(hero_probs) > 1:
+            reasons.append("hero_count")
+        elif hero_probs and hero_probs[0] < self.hero_conf:
+            reasons.append("hero_low_conf")
+        elif not hero_probs and any(counts[label] for label in DUNGEON_LABELS):
+            reasons.append("hero_missing")
+
+        # 前后两帧一致，只有这一帧不一样，大概率是这一帧漏检或者误检
+        if prev_counts is not None and next_counts is not None:
+            for label in self.flicker_labels:
+                if prev_counts[label] == next_counts[label] != counts[label]:
+                    reasons.append(f"flicker_{label}")
+        return reasons
+
+    def is_duplicate(self, frame: cv.Mat) -> bool:
+        """
+        和已经导出的画面比较，相似就跳过，不相似就记下来
+        :param frame:
+        :return:
+        """
+        bits = dhash(frame)
+        if self._hashes and hamming_distance(bits, np.stack(self._hashes)).min() <= self.hash_distance:
+            return True
+        self._hashes.append(bits)
+        return False
+
+    def mine_session(self, session_dir: str, output_dir: str, hard_only: bool = True) -> List[dict]:
+        """
+        挖掘一个录制目录，导出图片和伪标注到 output_dir/images、output_dir/labels
+        :param session_dir: 录制目录
+        :param output_dir: 输出目录
+        :param hard_only: 只导出难例，False 时所有不重复的帧都导出
+        :return: 导出的帧 [{"image", "reasons"}]
+        """
+        frames, events = load_session(session_dir)
+        event_frames = self._event_frames(frames, events)
+        session_name = os.path.basename(os.path.normpath(session_dir))
+
+        # 先全部识别一遍，数量跳变要看前后两帧；画面不留在内存里，导出时再读
+        results = []
+        for item in frames:
+            frame = cv.imread(item["path"])
+            result = self.model(frame) if frame is not None else None
+            results.append((result, self._counts(result or [])))
+
+        image_dir = os.path.join(output_dir, "images")
+        label_dir = os.path.join(output_dir, "labels")
+        os.makedirs(image_dir, exist_ok=True)
+        os.makedirs(label_dir, exist_ok=True)
+
+        exported = []
+        for i, (item, (result, counts)) in enumerate(zip(frames, results)):
+            if result is None:
+                continue
+            prev_counts = results[i - 1][1] if i > 0 else None
+            next_counts = results[i + 1][1] if i + 1 < len(results) else None
+            reasons = self.frame_reasons(result, counts, prev_counts, next_counts)
+            reasons += event_frames.get(item["index"], [])
+            if hard_only and not reasons:
+                continue
+            frame = cv.imread(item["path"])
+            if self.is_duplicate(frame):
+                continue
+
+            stem = f"{session_name}_{item['index']:06d}"
+            image_path = os.path.join(image_dir, stem + os.path.splitext(item["path"])[1])
+            shutil.copyfile(item["path"], image_path)
+            with open(os.path.join(label_dir, stem + ".txt"), "w", encoding="utf-8") as f:
+                f.write("\n".join(to_yolo_labels(result, frame.shape[1], frame.shape[0])))
+            exported.append({"image": image_path, "session": session_name, "frame": item["index"], "reasons": reasons})
+        return exported
+
+    def _event_frames(self, frames: List[dict], events: List[dict]) -> Dict[int, List[str]]:
+        """
+        事件发生前一段时间内的帧，没有时间戳时只标记事件对应的那一帧
+        :return: {帧序号: [事件名称]}
+        """
+        marked = {}
+        for event in events:
+            name = f"event_{event.get('event', 'unknown')}"
+            for item in frames:
+                if item["time"] is not None and event.get("time") is not None:
+                    hit = 0 <= event["time"] - item["time"] <= self.event_window
+                else:
+                    hit = item["index"] == event.get("frame")
+                if hit:
+                    marked.setdefault(item["index"], []).append(name)
+        return marked
+
+    def mine(self, session_dirs: List[str], output_dir: str = PathManager.HARD_EXAMPLE_PATH, hard_only: bool = True) -> List[dict]:
+        """
+        挖掘多个录制目录，结果追加到 output_dir/hard_examples.jsonl，类别名称写到 classes.txt
+        :param session_dirs: 录制目录
+        :param output_dir: 输出目录
+        :param hard_only: 只导出难例
+        :return:
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        exported = []
+        for session_dir in session_dirs:
+            items = self.mine_session(session_dir, output_dir, hard_only)
+            logger.info(f"{session_dir}：导出 {len(items)} 帧")
+            exported.extend(items)
+
+        with open(os.path.join(output_dir, "classes.txt"), "w", encoding="utf-8") as f:
+            f.write("\n".join(self.model.class_names))
+        with open(os.path.join(output_dir, "hard_examples.jsonl"), "a", encoding="utf-8") as f:
+            for item in exported:
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+        return exported
+
+
+def format_mining_report(exported: List[dict]) -> str:
+    reasons = Counter(reason for item in exported for reason in item["reasons"])
+    lines = [f"共导出 {len(exported)} 帧"]
+    lines += [f"    {reason}: {count}" for reason, count in reasons.most_common()]
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    # python -m utils.example_mining data/sessions/20240828_153000 [更多录制目录]
+    # 不传目录时挖掘 data/sessions 下全部录制
+    from utils.yolov5 import YoloV5s
+
+    sessions = sys.argv[1:] or sorted(
+        d for d in glob.glob(os.path.join(PathManager.SESSION_PATH, "*")) if os.path.isdir(d)
+    )
+    miner = HardExampleMiner(YoloV5s(num_threads=4))
+    logger.info("\n" + format_mining_report(miner.mine(sessions)))
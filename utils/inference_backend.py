@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/26
+from typing import Dict, List, Type
+
+import cv2 as cv
+import numpy as np
+
+from utils.model_registry import ModelSpec
+
+
+class InferenceBackend:
+    """
+    推理后端，只负责把预处理好的图片跑一遍网络
+    缩放补边的几何计算、解码、nms 都在 YoloV5s 里，各个后端共用，识别结果完全一样
+    """
+    name = ""
+
+    def __init__(self, spec: ModelSpec, num_threads: int = 1, use_gpu: bool = False, precision: str = "fp32"):
+        self.spec = spec
+        self.num_threads = num_threads
+        self.use_gpu = use_gpu
+        self.precision = precision
+
+    def make_input(self, img: cv.Mat, w: int, h: int, pads: tuple):
+        """
+        缩放、补边、BGR 转 RGB、归一化
+        :param img: BGR 画面
+        :param w: 缩放后的宽
+        :param h: 缩放后的高
+        :param pads: 补边 (上, 下, 左, 右)
+        :return: 网络输入 (1, 3, H, W) float32
+        """
+        top, bottom, left, right = pads
+        resized = cv.resize(img, (w, h), interpolation=cv.INTER_LINEAR)
+        padded = cv.copyMakeBorder(resized, top, bottom, left, right, cv.BORDER_CONSTANT, value=(114, 114, 114))
+        rgb = cv.cvtColor(padded, cv.COLOR_BGR2RGB)
+        return np.ascontiguousarray(rgb.transpose(2, 0, 1)[None], dtype=np.float32) / 255.0
+
+    def infer(self, inputs) -> List[np.ndarray]:
+        """
+        网络推理
+        :param inputs: make_input 的输出
+        :return: 每个检测头一个 (锚框数, 网格数, 5 + 类别数) 的数组，按步长从大到小排列
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def normalize_outputs(outputs: List[np.ndarray]) -> List[np.ndarray]:
+        """
+        把各种导出格式的检测头输出统一成 (锚框数, 网格数, 通道数)，按网格数从小到大（步长从大到小）排列
+        onnx 导出的原始检测头一般是 (1, 锚框数, ny, nx, 通道数)
+        :param outputs:
+        :return:
+        """
+        heads = []
+        for out in outputs:
+            out = np.asarray(out)
+            while out.ndim > 3 and out.shape[0] == 1:
+                out = out[0]
+            if out.ndim == 4:
+                out = out.reshape(out.shape[0], -1, out.shape[-1])
+            heads.append(out)
+        return sorted(heads, key=lambda x: x.shape[1])
+
+
+class NcnnBackend(InferenceBackend):
+    """
+    ncnn 后端，支持 vulkan 和 fp16 / int8
+    """
+    name = "ncnn"
+
+    def __init__(self, spec: ModelSpec, num_threads: int = 1, use_gpu: bool = False, precision: str = "fp32"):
+        super().__init__(spec, num_threads, use_gpu, precision)
+        import ncnn
+        from utils.yolov5 import YoloV5Focus_layer_creator, YoloV5Focus_layer_destroyer
+
+        self._ncnn = ncnn
+        self.mean_vals = []
+        self.norm_vals = [1 / 255.0, 1 / 255.0, 1 / 255.0]
+
+        self.net = ncnn.Net()
+        self.net.opt.use_vulkan_compute = use_gpu
+        self.net.opt.num_threads = num_threads
+        self.set_precision(self.net.opt, precision)
+
+        self.net.register_custom_layer(
+            "YoloV5Focus", YoloV5Focus_layer_creator, YoloV5Focus_layer_destroyer
+        )
+
+        # original pretrained model from https://github.com/ultralytics/yolov5
+        # the ncnn model https://github.com/nihui/ncnn-assets/tree/master/models
+        self.net.load_param(spec.param)
+        self.net.load_model(spec.bin)
+
+    @staticmethod
+    def set_precision(opt, precision: str):
+        """
+        设置推理精度，必须在 load_param 之前调用
+        fp16 在支持 armv8.2 的 cpu 上会用半精度计算，其他 cpu 上只省内存带宽
+        int8 需要加载 ncnn2int8 量化后的模型，没有量化的层会自动回退到 fp32/fp16
+        :param opt: ncnn.Option
+        :param precision: fp32 / fp16 / int8
+        :return:
+        """
+        if precision not in ("fp32", "fp16", "int8"):
+            raise ValueError(f"precision {precision} is not support")
+        fp16 = precision != "fp32"
+        int8 = precision == "int8"
+        opt.use_fp16_packed = fp16
+        opt.use_fp16_storage = fp16
+        opt.use_fp16_arithmetic = fp16
+        opt.use_bf16_storage = False
+        opt.use_int8_inference = int8
+        opt.use_int8_packed = int8
+        opt.use_int8_storage = int8
+        opt.use_int8_arithmetic = int8
+
+    def make_input(self, img: cv.Mat, w: int, h: int, pads: tuple):
+        # ncnn 自带的缩放和补边比 numpy 快，直接用
+        ncnn = self._ncnn
+        top, bottom, left, right = pads
+        # from_pixels_resize 按宽高连续读取像素，传进来的切片要先拷贝成连续内存
+        img = np.ascontiguousarray(img)
+        mat_in = ncnn.Mat.from_pixels_resize(
+            img, ncnn.Mat.PixelType.PIXEL_BGR2RGB, img.shape[1], img.shape[0], w, h
+        )
+        # pad to target_size rectangle
+        # yolov5/utils/datasets.py letterbox
+        mat_in_pad = ncnn.copy_make_border(
+            mat_in, top, bottom, left, right, ncnn.BorderType.BORDER_CONSTANT, 114.0
+        )
+        mat_in_pad.substract_mean_normalize(self.mean_vals, self.norm_vals)
+        return mat_in_pad
+
+    def infer(self, inputs) -> List[np.ndarray]:
+        ex = self.net.create_extractor()
+        ex.input(self.spec.input_blob, inputs)
+
+        # 改动部分 Permute
+        # 输出层按步长从大到小排列，anchor setting from yolov5/models/yolov5s.yaml
+        pred = []
+        for blob_name in self.spec.output_blobs:
+            ret, mat_out = ex.extract(blob_name)
+            pred.append(np.array(mat_out))
+        return pred
+
+    def __del__(self):
+        self.net = None
+
+
+class OnnxRuntimeBackend(InferenceBackend):
+    """
+    ONNX Runtime 后端，需要 pip install onnxruntime，模型用 yolov5 export.py 导出原始检测头
+    """
+    name = "onnxruntime"
+
+    def __init__(self, spec: ModelSpec, num_threads: int = 1, use_gpu: bool = False, precision: str = "fp32"):
+        super().__init__(spec, num_threads, use_gpu, precision)
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = num_threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(spec.onnx, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def infer(self, inputs) -> List[np.ndarray]:
+        return self.normalize_outputs(self.session.run(None, {self.input_name: inputs}))
+
+
+class OpenCVDnnBackend(InferenceBackend):
+    """
+    OpenCV DNN 后端，不需要额外安装依赖，读取和 ONNX Runtime 同一个 onnx 文件
+    """
+    name = "opencv"
+
+    def __init__(self, spec: ModelSpec, num_threads: int = 1, use_gpu: bool = False, precision: str = "fp32"):
+        super().__init__(spec, num_threads, use_gpu, precision)
+        self.net = cv.dnn.readNetFromONNX(spec.onnx)
+        self.net.setPreferableBackend(cv.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv.dnn.DNN_TARGET_CPU)
+        # cv.dnn.Net 没有单独的线程数设置，cv.setNumThreads 是全局的，会影响其他线程里的 resize、颜色转换
+        # 所以不改，num_threads 对这个后端不生效，推理用 opencv 默认的线程池
+        self.output_names = self.net.getUnconnectedOutLayersNames()
+
+    def infer(self, inputs) -> List[np.ndarray]:
+        self.net.setInput(inputs)
+        return self.normalize_outputs(self.net.forward(self.output_names))
+
+
+BACKENDS: Dict[str, Type[InferenceBackend]] = {
+    NcnnBackend.name: NcnnBackend,
+    OnnxRuntimeBackend.name: OnnxRuntimeBackend,
+    OpenCVDnnBackend.name: OpenCVDnnBackend,
+}
+
+
+def create_backend(name: str, spec: ModelSpec, num_threads: int = 1, use_gpu: bool = False, precision: str = "fp32") -> InferenceBackend:
+    """
+    创建推理后端
+    :param name: ncnn / onnxruntime / opencv
+    :param spec: 模型描述
+    :param num_threads: 线程数
+    :param use_gpu: 是否使用 gpu，只有 ncnn 支持
+    :param precision: 推理精度，只有 ncnn 支持 fp16 / int8
+    :return:
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"backend {name} is not support")
+    return BACKENDS[name](spec, num_threads, use_gpu, precision)
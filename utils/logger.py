@@ -1,7 +1,15 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 # @Author  : huxiansheng (you@example.org)
+import atexit
+import contextvars
+import json
 import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
 from utils.path_manager import PathManager
 from logging import handlers
 import logging.config
@@ -20,17 +28,236 @@ MSG = '''
 
 # 获取日志保存的路劲
 logs_path = PathManager.LOG_PATH + PathManager.PROJECT_NAME + '.log'
-if os.path.exists(PathManager.LOG_PATH) is False:
-    os.mkdir(PathManager.LOG_PATH)
-if os.path.exists(logs_path) is False:
-    file = open(logs_path, 'w')
-    file.write(MSG)
+# 结构化日志，每行一个 json，方便用脚本分析
+json_logs_path = PathManager.LOG_PATH + PathManager.PROJECT_NAME + '.jsonl'
+
+# 日志上下文，比如设备、房间、阶段，会带到每一条结构化日志里
+# 按设备保存，所有线程共享，推流、识别、看门狗线程打的日志也能带上控制循环设置的房间和阶段，None 是整个进程共用的
+_contexts: Dict[Optional[str], dict] = {None: {}}
+_contexts_lock = threading.Lock()
+# 当前线程属于哪个设备，只有一个设备时不用绑定；多个设备时在设备自己的线程里调用 bind_log_device
+_log_device: contextvars.ContextVar = contextvars.ContextVar("log_device", default=None)
+# log_context 临时添加的字段，只对当前线程有效
+_log_context: contextvars.ContextVar = contextvars.ContextVar("log_context", default={})
+
+# LogRecord 自带的属性，其他属性都是通过 extra 传进来的结构化字段
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "context", "suppressed"}
+
+
+class LazyTimedRotatingFileHandler(handlers.TimedRotatingFileHandler):
+    """
+    第一次写日志时才创建日志目录和文件，import 的时候不做任何磁盘操作
+    """
+
+    def __init__(self, *args, header: str = MSG, **kwargs):
+        """
+        :param header: 新建日志文件时写在开头的内容，结构化日志不要写
+        """
+        kwargs['delay'] = True
+        self.header = header
+        super().__init__(*args, **kwargs)
+
+    def _open(self):
+        if os.path.exists(PathManager.LOG_PATH) is False:
+            os.makedirs(PathManager.LOG_PATH, exist_ok=True)
+        is_new_file = os.path.exists(self.baseFilename) is False
+        stream = super()._open()
+        if is_new_file and self.header:
+            stream.write(self.header)
+        return stream
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    结构化日志，每条日志一行 json，包含日志上下文和 extra 传入的字段，比如
+    logger.info("识别完成", extra={"boxes": 3})
+    控制循环的 detect_ms（收到画面到识别完成）和 act_ms（识别完成到发出操作）通过日志上下文带在每条日志上
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        event = {
+            "time": round(record.created, 3),
+            "level": record.levelname,
+            "file": record.filename,
+            "func": record.funcName,
+            "line": record.lineno,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        event.update(getattr(record, "context", {}))
+        event.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS})
+        if getattr(record, "suppressed", 0):
+            event["suppressed"] = record.suppressed
+        return json.dumps(event, ensure_ascii=False, default=str)
+
+
+class ContextFilter(logging.Filter):
+    """
+    在打日志的线程里把当前的日志上下文挂到日志上，写文件是在另一个线程里，那时候已经拿不到了
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.context = get_log_context()
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    重复日志限流：同一个位置打出的同一条日志，间隔内只保留第一条
+    间隔结束时由 flush 补一条注明省略了多少条的日志，控制循环里每帧都打的日志不会刷屏，也不会悄悄丢掉
+    """
+
+    def __init__(self, interval: float = 2.0, max_keys: int = 1000):
+        """
+        :param interval: 限流间隔
+        :param max_keys: 最多记录多少种日志，超过后清空重新计数
+        """
+        super().__init__()
+        self.interval = interval
+        self.max_keys = max_keys
+        self._last = {}  # {key: (间隔开始时间, 省略条数, 最后一条被省略的日志)}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (record.pathname, record.lineno, record.getMessage())
+        now = time.monotonic()
+        with self._lock:
+            last_time, suppressed, _ = self._last.get(key, (None, 0, None))
+            if last_time is not None and now - last_time < self.interval:
+                self._last[key] = (last_time, suppressed + 1, record)
+                return False
+            if len(self._last) >= self.max_keys:
+                self._last.clear()
+            self._last[key] = (now, 0, None)
+        # 间隔已经结束但是 flush 还没来得及补，直接记在这一条上
+        if suppressed:
+            self._mark_suppressed(record, suppressed)
+        return True
+
+    @staticmethod
+    def _mark_suppressed(record: logging.LogRecord, suppressed: int):
+        record.suppressed = suppressed
+        record.msg = f"{record.getMessage()}（省略 {suppressed} 条重复日志）"
+        record.args = None
+
+    def flush(self, now: float = None, force: bool = False) -> List[logging.LogRecord]:
+        """
+        结束已经到期的限流间隔
+        :param now: 当前时间，默认 time.monotonic()
+        :param force: 没到期的也结束，退出时用
+        :return: 有省略的间隔各生成一条汇总日志，内容是最后一条被省略的日志
+        """
+        now = time.monotonic() if now is None else now
+        records = []
+        with self._lock:
+            for key, (last_time, suppressed, record) in list(self._last.items()):
+                if not force and now - last_time < self.interval:
+                    continue
+                del self._last[key]
+                if suppressed:
+                    summary = logging.makeLogRecord(vars(record))
+                    self._mark_suppressed(summary, suppressed)
+                    records.append(summary)
+        return records
+
+    def start(self, emit: Callable[[logging.LogRecord], None]) -> 'RateLimitFilter':
+        """
+        启动后台线程定时 flush
+        :param emit: 汇总日志的输出函数，不会再经过过滤器
+        :return:
+        """
+        def _loop():
+            while not self._stop.wait(self.interval / 2):
+                for record in self.flush():
+                    emit(record)
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=_loop, name="log-rate-limit", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, emit: Callable[[logging.LogRecord], None] = None):
+        """
+        停止后台线程，把还没结束的间隔的汇总也输出
+        :param emit: 汇总日志的输出函数
+        :return:
+        """
+        self._stop.set()
+        for record in self.flush(force=True):
+            if emit is not None:
+                emit(record)
+
+
+def bind_log_device(serial: str):
+    """
+    把当前线程绑定到某个设备，之后这个线程的 update_log_context 和日志都用这个设备的上下文
+    新建的线程不会继承绑定，多个设备时用 copy_context().run 启动设备自己的线程
+    :param serial: 设备序列号
+    :return:
+    """
+    _log_device.set(serial)
+    with _contexts_lock:
+        _contexts.setdefault(serial, {})["device"] = serial
+
+
+def _current_device() -> Optional[str]:
+    device = _log_device.get()
+    if device is None:
+        # 没有绑定的线程（推流库自己的线程、后台线程），只有一个设备时就是它
+        with _contexts_lock:
+            devices = [key for key in _contexts if key is not None]
+        if len(devices) == 1:
+            device = devices[0]
+    return device
+
+
+def get_log_context() -> dict:
+    """
+    当前线程的日志上下文：进程共用的 + 所属设备的 + log_context 临时添加的
+    :return:
+    """
+    device = _current_device()
+    with _contexts_lock:
+        context = {**_contexts[None], **_contexts.get(device, {})}
+    context.update(_log_context.get())
+    return context
+
+
+def update_log_context(**fields):
+    """
+    更新当前设备的日志上下文，其他线程打的日志也能看到，值为 None 的字段会被删除
+    :param fields: 比如 room、phase
+    :return:
+    """
+    device = _current_device()
+    with _contexts_lock:
+        context = {**_contexts.get(device, {}), **fields}
+        _contexts[device] = {key: value for key, value in context.items() if value is not None}
+
+
+@contextmanager
+def log_context(**fields):
+    """
+    临时添加日志上下文，只对当前线程有效，退出时恢复
+    :param fields:
+    :return:
+    """
+    token = _log_context.set({**_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+
 # 创建一个logger
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-# 创建日志输入端，fh输入到日志文件，ch输出到控制台，定义日志级别为info
-th = handlers.TimedRotatingFileHandler(filename=logs_path, when='MIDNIGHT', backupCount=30, encoding='utf-8')
+# 创建日志输入端，fh输入到日志文件，ch输出到控制台，jh输出结构化日志，定义日志级别为info
+th = LazyTimedRotatingFileHandler(filename=logs_path, when='MIDNIGHT', backupCount=30, encoding='utf-8')
+jh = LazyTimedRotatingFileHandler(filename=json_logs_path, when='MIDNIGHT', backupCount=30, encoding='utf-8', header=None)
 ch = logging.StreamHandler()
 
 ch.setLevel(logging.INFO)
@@ -38,7 +265,22 @@ ch.setLevel(logging.INFO)
 formatter_fh = logging.Formatter('%(asctime)s - %(levelname)s - %(filename)s - %(funcName)s[line:%(lineno)d] - %(message)s')
 ch.setFormatter(formatter_fh)
 th.setFormatter(formatter_fh)
+jh.setFormatter(JsonFormatter())
+
+# 打日志的线程只把日志放进队列，格式化和写文件、写控制台都在后台线程里做，不阻塞控制循环
+log_queue = queue.SimpleQueue()
+qh = handlers.QueueHandler(log_queue)
+# 先挂上下文再限流，间隔结束时补的汇总日志也带着上下文
+qh.addFilter(ContextFilter())
+rate_limit = RateLimitFilter()
+qh.addFilter(rate_limit)
+listener = handlers.QueueListener(log_queue, ch, th, jh, respect_handler_level=True)
+listener.start()
+rate_limit.start(qh.emit)
+# 退出前把队列里剩下的日志写完，atexit 后注册的先执行，先补汇总再停止写日志
+atexit.register(listener.stop)
+atexit.register(rate_limit.stop, qh.emit)
+
 # 给logger添加handler
-logger.addHandler(ch)
-logger.addHandler(th)
+logger.addHandler(qh)
 # logger.addHandler(logstash.TCPLogstashHandler(elastic_host,5000,version=1))
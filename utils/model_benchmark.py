@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/14
+import glob
+import os
+import sys
+import time
+from typing import List
+
+import cv2 as cv
+
+from utils.evaluation import DetectionMatcher, detections_to_array
+from utils.logger import logger
+from utils.model_registry import BACKENDS, get_model_registry
+from utils.yolov5 import YoloV5s
+
+
+def load_frames(path: str, limit: int = None) -> List[cv.Mat]:
+    """
+    读取录制的帧，支持单张图片或目录
+    :param path: 图片或目录
+    :param limit: 最多读取多少张
+    :return:
+    """
+    if os.path.isdir(path):
+        files = sorted(
+            f for f in glob.glob(os.path.join(path, "*"))
+            if f.lower().endswith((".png", ".jpg", ".jpeg", ".bmp"))
+        )
+    else:
+        files = [path]
+    frames = []
+    for file in files[:limit]:
+        frame = cv.imread(file)
+        if frame is not None:
+            frames.append(frame)
+    return frames
+
+
+def benchmark_model(model: YoloV5s, frames: List[cv.Mat], warm_up: int = 3) -> dict:
+    """
+    测试模型吞吐量，同时返回每一帧的识别结果
+    :param model: 模型
+    :param frames: 帧
+    :param warm_up: 预热帧数，不计入耗时
+    :return:
+    """
+    for frame in frames[:warm_up]:
+        model(frame)
+
+    detections = []
+    latencies = []
+    for frame in frames:
+        t = time.perf_counter()
+        result = model(frame)
+        latencies.append(time.perf_counter() - t)
+        detections.append(detections_to_array(result))
+
+    total = sum(latencies)
+    return {
+        "model": model.name,
+        "frames": len(frames),
+        "fps": len(frames) / total if total else 0.0,
+        "mean_ms": total / len(frames) * 1000 if frames else 0.0,
+        "max_ms": max(latencies) * 1000 if latencies else 0.0,
+        "detections": detections,
+    }
+
+
+def compare_models(model_names: List[str], frames: List[cv.Mat], reference: str = None, **kwargs) -> List[dict]:
+    """
+    A/B 对比多个模型的吞吐量和识别一致性
+    没有标注数据时，以参考模型的识别结果作为基准计算准确率和召回率
+    :param model_names: manifest 里的模型名称
+    :param frames: 帧
+    :param reference: 参考模型，不传使用第一个
+    :param kwargs: 传给 YoloV5s 的参数
+    :return:
+    """
+    reference = reference or model_names[0]
+    results = {}
+    for name in dict.fromkeys([reference] + list(model_names)):
+        results[name] = benchmark_model(YoloV5s(model=name, **kwargs), frames)
+
+    baseline = results[reference]["detections"]
+    class_names = get_model_registry().get(reference).load_class_names()
+    report = []
+    for name in model_names:
+        result = results[name]
+        matcher = DetectionMatcher()
+        for preds, truths in zip(result["detections"], baseline):
+            matcher.add(preds, truths)
+        per_class = {class_names[label]: value for label, value in matcher.precision_recall().items() if label < len(class_names)}
+        report.append({
+            "model": name,
+            "fps": result["fps"],
+            "mean_ms": result["mean_ms"],
+            "max_ms": result["max_ms"],
+            "reference": reference,
+            "per_class": per_class,
+        })
+    return report
+
+
+def compare_backends(frames: List[cv.Mat], backends: List[str] = None, model: str = None, **kwargs) -> List[dict]:
+    """
+    对比同一个模型在不同推理后端上的速度，缺少依赖或模型文件的后端跳过
+    :param frames: 帧
+    :param backends: 要对比的后端，不传对比全部
+    :param model: manifest 里的模型名称，不传使用默认模型
+    :param kwargs: 传给 YoloV5s 的参数
+    :return: 按速度从快到慢排列
+    """
+    report = []
+    for backend in backends or list(BACKENDS):
+        try:
+            detector = YoloV5s(model=model, backend=backend, **kwargs)
+        except (ImportError, FileNotFoundError, ValueError) as e:
+            logger.info(f"跳过后端 {backend}：{e}")
+            continue
+        result = benchmark_model(detector, frames)
+        report.append({
+            "backend": backend,
+            "fps": result["fps"],
+            "mean_ms": result["mean_ms"],
+            "max_ms": result["max_ms"],
+        })
+    return sorted(report, key=lambda item: item["fps"], reverse=True)
+
+
+def select_fastest_backend(frames: List[cv.Mat], backends: List[str] = None, model: str = None, **kwargs) -> str:
+    """
+    在当前机器上选出最快的推理后端
+    :param frames: 帧
+    :param backends: 候选后端
+    :param model: manifest 里的模型名称
+    :param kwargs: 传给 YoloV5s 的参数
+    :return: 后端名称，全部不可用时返回 ncnn
+    """
+    report = compare_backends(frames, backends, model, **kwargs)
+    return report[0]["backend"] if report else "ncnn"
+
+
+def format_backend_report(report: List[dict]) -> str:
+    return "\n".join(
+        f"{item['backend']}: {item['fps']:.1f} fps，平均 {item['mean_ms']:.1f} ms，最大 {item['max_ms']:.1f} ms"
+        for item in report
+    )
+
+
+def format_report(report: List[dict]) -> str:
+    lines = []
+    for item in report:
+        lines.append(f"{item['model']}: {item['fps']:.1f} fps，平均 {item['mean_ms']:.1f} ms，最大 {item['max_ms']:.1f} ms（基准 {item['reference']}）")
+        for label, value in item["per_class"].items():
+            lines.append(f"    {label}: precision {value['precision']:.3f} recall {value['recall']:.3f} ({value['ground_truth']})")
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    # python -m utils.model_benchmark img new new_small
+    # python -m utils.model_benchmark --backends img [new]
+    if sys.argv[1] == "--backends":
+        logger.info("\n" + format_backend_report(compare_backends(load_frames(sys.argv[2]), model=(sys.argv[3:] or [None])[0], num_threads=4)))
+        sys.exit(0)
+    frames_path = sys.argv[1]
+    names = sys.argv[2:] or get_model_registry().names()
+    logger.info("\n" + format_report(compare_models(names, load_frames(frames_path), num_threads=4)))
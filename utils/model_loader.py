@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/13
+import threading
+import time
+
+from utils.logger import logger
+from utils.startup_report import startup_timer
+
+
+class ModelLoader:
+    """
+    后台加载模型并预热，整个进程只加载一次
+    连接设备和加载模型同时进行，谁先好谁等另一个
+    加载失败按退避重试，重试用完才报错，之后 get 会抛出最后一次的异常；再次 start（包括 shared 拿到同一个加载器）会重新加载
+    """
+
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, cache: bool = False, motion_gate: bool = False, tiled: bool = False, retries: int = 3,
+                 retry_delay: float = 1.0, **kwargs):
+        """
+        :param cache: 是否在模型前面加识别缓存，画面不变时跳过推理
+        :param motion_gate: 是否在模型前面加帧差门控，画面变化小时复用上次的结果
+        :param tiled: 是否开启分块识别，材料、箭头没识别到时切块再找一遍
+        :param retries: 加载失败后的重试次数，缺少依赖（ImportError）不重试
+        :param retry_delay: 第一次重试前的等待时间，之后每次翻倍
+        :param kwargs: 传给 YoloV5s 的参数
+        """
+        self.cache = cache
+        self.motion_gate = motion_gate
+        self.tiled = tiled
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.kwargs = kwargs
+        self.model = None
+        self.error = None
+        self._ready = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def shared(cls, **kwargs) -> 'ModelLoader':
+        """
+        获取共享的加载器，同样参数的模型只加载一次
+        :param kwargs: 传给 ModelLoader 的参数
+        :return:
+        """
+        key = tuple(sorted(kwargs.items()))
+        with cls._shared_lock:
+            loader = cls._shared.get(key)
+            if loader is None:
+                loader = cls(**kwargs)
+                cls._shared[key] = loader
+        return loader.start()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set() and self.error is None
+
+    @property
+    def failed(self) -> bool:
+        """
+        重试用完还是加载失败
+        :return:
+        """
+        return self._ready.is_set() and self.error is not None
+
+    def start(self) -> 'ModelLoader':
+        """
+        启动后台加载，重复调用不会重复加载；上次加载失败了就重新加载
+        :return:
+        """
+        with self._shared_lock:
+            if self._thread is not None and self.failed:
+                logger.info("模型上次加载失败，重新加载")
+                self._ready.clear()
+                self.error = None
+                self._thread = None
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._load, name="model-loader", daemon=True)
+                self._thread.start()
+        return self
+
+    def get(self, timeout: float = None):
+        """
+        获取模型，没加载完就等待
+        :param timeout: 等待超时时间
+        :return:
+        """
+        if not self._ready.wait(timeout):
+            raise TimeoutError("model loading timeout")
+        if self.error is not None:
+            raise self.error
+        return self.model
+
+    def _load(self):
+        delay = self.retry_delay
+        for attempt in range(self.retries + 1):
+            try:
+                self.model = self._build()
+                self.error = None
+                break
+            except ImportError as e:
+                self.error = e
+                break
+            except Exception as e:
+                self.error = e
+                if attempt < self.retries:
+                    logger.error(f"模型加载失败：{e}，{delay:g} 秒后第 {attempt + 1} 次重试")
+                    time.sleep(delay)
+                    delay *= 2
+        if self.error is not None:
+            logger.error(f"模型加载失败，不再重试，不会做任何识别：{self.error!r}")
+        self._ready.set()
+
+    def _build(self):
+        """
+        加载、预热模型，按参数套上分块、缓存、门控
+        :return:
+        """
+        # ncnn 和 numpy 都比较重，放到后台线程里 import
+        from utils.yolov5 import YoloV5s
+
+        startup_timer.mark("import_ncnn")
+        model = YoloV5s(**self.kwargs)
+        startup_timer.mark("model_loaded")
+        model.warm_up()
+        startup_timer.mark("model_warm_up")
+        if self.tiled:
+            from utils.tiled_detector import TiledDetector
+
+            model = TiledDetector(model)
+        if self.cache:
+            from utils.detection_cache import CachedDetector
+
+            model = CachedDetector(model)
+        if self.motion_gate:
+            from utils.motion_gate import MotionGatedDetector
+
+            model = MotionGatedDetector(model)
+        return model
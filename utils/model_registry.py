@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/14
+import json
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+from utils.path_manager import PathManager
+
+PRECISIONS = ("fp32", "fp16", "int8")
+BACKENDS = ("ncnn", "onnxruntime", "opencv")
+
+
+@dataclass
+class ModelSpec:
+    """
+    模型描述，对应 model/manifest.json 里的一项
+    输出层、步长、锚框按步长从大到小排列
+    """
+    name: str
+    param: str  # ncnn 后端用，其他后端可以为空
+    bin: str
+    classes: str
+    input_size: int = 640
+    input_blob: str = "images"
+    output_blobs: List[str] = field(default_factory=lambda: ["381", "364", "output"])
+    strides: List[int] = field(default_factory=lambda: [32, 16, 8])
+    anchors: List[List[float]] = field(default_factory=lambda: [
+        [116, 90, 156, 198, 373, 326],
+        [30, 61, 62, 45, 59, 119],
+        [10, 13, 16, 30, 33, 23],
+    ])
+    prob_threshold: float = 0.25
+    nms_threshold: float = 0.45
+    class_thresholds: Dict[str, float] = field(default_factory=dict)  # 单独配置置信度阈值的类别
+    class_nms_thresholds: Dict[str, float] = field(default_factory=dict)  # 单独配置 nms 阈值的类别
+    precision: str = "fp32"  # fp32 / fp16 / int8，int8 需要用 utils/quantization.py 量化后的模型文件
+    backend: str = "ncnn"  # ncnn / onnxruntime / opencv
+    onnx: str = ""  # onnxruntime 和 opencv 后端用的 onnx 模型，导出原始检测头
+
+    @classmethod
+    def from_dict(cls, name: str, data: dict, base_path: str = PathManager.MODEL_PATH) -> 'ModelSpec':
+        """
+        从 manifest 配置创建，相对路径以 model 目录为准
+        :param name: 模型名称
+        :param data: 配置
+        :param base_path: 相对路径的根目录
+        :return:
+        """
+        data = dict(data)
+        # 只用 onnx 的模型可以不配 ncnn 的模型文件
+        data.setdefault("param", "")
+        data.setdefault("bin", "")
+        for key in ("param", "bin", "classes", "onnx"):
+            if data.get(key) and not os.path.isabs(data[key]):
+                data[key] = os.path.join(base_path, data[key])
+        return cls(name=name, **data)
+
+    def validate(self, backend: str = None, precision: str = None):
+        """
+        检查模型文件和配置是否完整
+        :param backend: 要使用的推理后端，不传使用配置的后端
+        :param precision: 实际使用的推理精度，不传使用配置的精度
+        :return:
+        """
+        backend = backend or self.backend
+        precision = precision or self.precision
+        if backend not in BACKENDS:
+            raise ValueError(f"{self.name}: backend {backend} is not support")
+        if precision not in PRECISIONS:
+            raise ValueError(f"{self.name}: precision {precision} is not support")
+        if precision != "fp32" and backend != "ncnn":
+            raise ValueError(f"{self.name}: precision {precision} is only supported by ncnn")
+        # int8 要用量化后的模型文件，普通模型文件打开 int8 推理结果是错的
+        if precision == "int8" and self.precision != "int8":
+            raise ValueError(f"{self.name}: int8 needs a quantized model, use utils/quantization.py")
+        files = (self.param, self.bin) if backend == "ncnn" else (self.onnx,)
+        for path in files + (self.classes,):
+            if not path or not os.path.exists(path):
+                hint = ", run utils/quantization.py first" if precision == "int8" else ""
+                raise FileNotFoundError(f"{self.name}: {path or backend + ' model'} not found{hint}")
+        if not (len(self.output_blobs) == len(self.strides) == len(self.anchors)):
+            raise ValueError(f"{self.name}: output_blobs, strides and anchors must have the same length")
+
+    def load_class_names(self) -> List[str]:
+        with open(self.classes, encoding="utf-8") as f:
+            return [line.strip() for line in f.readlines() if line.strip()]
+
+
+class ModelRegistry:
+    """
+    模型注册表，支持注册多个模型，按名称获取
+    """
+
+    def __init__(self, default: str = None):
+        self.default = default
+        self._specs: Dict[str, ModelSpec] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_manifest(cls, path: str = PathManager.MODEL_MANIFEST_PATH) -> 'ModelRegistry':
+        """
+        从 manifest 文件加载
+        :param path: manifest 路径
+        :return:
+        """
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        base_path = os.path.dirname(os.path.abspath(path))
+        registry = cls(manifest.get("default"))
+        for name, data in manifest.get("models", {}).items():
+            registry.register(ModelSpec.from_dict(name, data, base_path))
+        return registry
+
+    def register(self, spec: ModelSpec):
+        """
+        注册模型，同名的会被覆盖
+        :param spec:
+        :return:
+        """
+        with self._lock:
+            self._specs[spec.name] = spec
+            if self.default is None:
+                self.default = spec.name
+
+    def get(self, name: str = None) -> ModelSpec:
+        """
+        获取模型描述，不传名称返回默认模型
+        :param name:
+        :return:
+        """
+        name = name or self.default
+        with self._lock:
+            if name not in self._specs:
+                raise ValueError(f"{name} is not registered")
+            return self._specs[name]
+
+    def names(self) -> List[str]:
+        with self._lock:
+            return list(self._specs)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry() -> ModelRegistry:
+    """
+    获取全局模型注册表，第一次调用时读取 manifest
+    :return:
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ModelRegistry.from_manifest()
+        return _registry
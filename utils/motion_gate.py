@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/24
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import cv2 as cv
+import numpy as np
+
+from utils.logger import logger
+
+# 参与比较的画面区域，归一化的 (x1, y1, x2, y2)，去掉顶部小地图、状态栏和底部轮盘、技能按钮
+DEFAULT_PLAY_AREA = (0.0, 0.12, 1.0, 0.78)
+
+
+def shift_detections(objs: List, dx: float, dy: float) -> List:
+    """
+    把识别结果整体平移，不修改原来的对象
+    :param objs: Detect_Object 列表
+    :param dx: x 方向平移的像素
+    :param dy: y 方向平移的像素
+    :return:
+    """
+    if not dx and not dy:
+        return list(objs)
+    return [type(obj)(obj.label, obj.prob, obj.rect.x + dx, obj.rect.y + dy, obj.rect.w, obj.rect.h) for obj in objs]
+
+
+class MotionGate:
+    """
+    帧差门控：和上一次完整推理的画面比较，变化小就复用上次的识别结果
+    镜头跟随英雄移动时整个画面会平移，先用相位相关估计平移量，补偿后再算残差
+    """
+
+    def __init__(self, threshold: float = 4.0, width: int = 160, play_area: Tuple[float, float, float, float] = DEFAULT_PLAY_AREA,
+                 max_interval: float = 0.5, max_shift: float = 0.1):
+        """
+        :param threshold: 补偿平移后的平均灰度差阈值，小于这个值认为画面没变
+        :param width: 比较时缩放到的宽度
+        :param play_area: 参与比较的画面区域
+        :param max_interval: 两次完整推理的最大间隔，超过就强制推理
+        :param max_shift: 平移超过画面宽度的这个比例就不复用，平移估计已经不可靠
+        """
+        self.threshold = threshold
+        self.width = width
+        self.play_area = play_area
+        self.max_interval = max_interval
+        self.max_shift = max_shift
+
+        self._reference: Optional[np.ndarray] = None
+        self._reference_time = 0.0
+        self._scale = 1.0
+        self._window = None
+
+    def _prepare(self, frame: cv.Mat) -> np.ndarray:
+        h, w = frame.shape[:2]
+        x1, y1, x2, y2 = self.play_area
+        roi = frame[int(y1 * h):int(y2 * h), int(x1 * w):int(x2 * w)]
+        self._scale = roi.shape[1] / self.width
+        height = max(1, int(round(roi.shape[0] / self._scale)))
+        # 先隔行隔列抽样再缩放，大图上 INTER_AREA 比较慢
+        step = max(1, int(self._scale) // 4)
+        if step > 1:
+            roi = np.ascontiguousarray(roi[::step, ::step])
+        small = cv.resize(roi, (self.width, height), interpolation=cv.INTER_AREA)
+        if small.ndim == 3:
+            small = cv.cvtColor(small, cv.COLOR_BGR2GRAY)
+        return small.astype(np.float32)
+
+    def check(self, frame: cv.Mat, now: float = None) -> Tuple[bool, float, float, np.ndarray]:
+        """
+        判断这一帧能不能复用上次的识别结果
+        :param frame: 当前画面
+        :param now: 当前时间
+        :return: (是否复用, 画面 x 平移, 画面 y 平移, 缩略图)，平移是原图像素
+        """
+        now = time.monotonic() if now is None else now
+        small = self._prepare(frame)
+        ref = self._reference
+        if ref is None or ref.shape != small.shape or now - self._reference_time >= self.max_interval:
+            return False, 0.0, 0.0, small
+
+        if self._window is None or self._window.shape != small.shape:
+            self._window = cv.createHanningWindow(small.shape[::-1], cv.CV_32F)
+        (sx, sy), _ = cv.phaseCorrelate(ref, small, self._window)
+        if abs(sx) > self.width * self.max_shift or abs(sy) > small.shape[0] * self.max_shift:
+            return False, 0.0, 0.0, small
+
+        # 把参考画面按估计的平移对齐，只比较重叠的部分
+        matrix = np.float32([[1, 0, sx], [0, 1, sy]])
+        aligned = cv.warpAffine(ref, matrix, small.shape[::-1], borderMode=cv.BORDER_REPLICATE)
+        mx, my = int(np.ceil(abs(sx))), int(np.ceil(abs(sy)))
+        h, w = small.shape
+        diff = cv.absdiff(aligned[my:h - my, mx:w - mx], small[my:h - my, mx:w - mx])
+        if diff.size == 0 or float(diff.mean()) >= self.threshold:
+            return False, 0.0, 0.0, small
+        return True, sx * self._scale, sy * self._scale, small
+
+    def update(self, small: np.ndarray, now: float = None):
+        """
+        完整推理后更新参考画面
+        :param small: check 返回的缩略图
+        :param now:
+        :return:
+        """
+        self._reference = small
+        self._reference_time = time.monotonic() if now is None else now
+
+    def reset(self):
+        self._reference = None
+
+
+class MotionGatedDetector:
+    """
+    在模型前面加一层帧差门控，画面没怎么变的时候复用上次的识别结果并按镜头平移修正位置
+    用法和模型一样，其他属性透传给模型
+    """
+
+    def __init__(self, model, gate: MotionGate = None, report_interval: float = 30):
+        """
+        :param model: 识别模型
+        :param gate: 帧差门控，不传使用默认配置
+        :param report_interval: 定时输出跳过比例的间隔，0 表示不输出
+        """
+        self.model = model
+        self.gate = gate or MotionGate()
+        self.report_interval = report_interval
+        self.inferred = 0
+        self.skipped = 0
+
+        self._last_result = []
+        self._last_classes = None
+        self._lock = threading.Lock()
+        self._last_report = time.monotonic()
+
+    def __call__(self, img: cv.Mat, classes=None) -> List:
+        now = time.monotonic()
+        if self.report_interval and now - self._last_report >= self.report_interval:
+            self._last_report = now
+            logger.info(self.format_stats())
+
+        with self._lock:
+            reuse, dx, dy, small = self.gate.check(img, now)
+            # 识别的标签变了，上次的结果不能用
+            if reuse and self._last_classes == classes:
+                self.skipped += 1
+                return shift_detections(self._last_result, dx, dy)
+
+        result = self.model(img, classes=classes)
+        with self._lock:
+            self.gate.update(small, now)
+            self._last_result = result
+            self._last_classes = classes
+            self.inferred += 1
+        return result
+
+    def format_stats(self) -> str:
+        total = self.inferred + self.skipped
+        ratio = self.skipped / total if total else 0.0
+        return f"帧差门控：完整推理 {self.inferred} 帧，复用 {self.skipped} 帧，跳过比例 {ratio:.1%}"
+
+    def __getattr__(self, name):
+        # 还没初始化完的时候不要透传，避免无限递归
+        if name == "model":
+            raise AttributeError(name)
+        return getattr(self.model, name)
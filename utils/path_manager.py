@@ -15,6 +15,26 @@ class PathManager:
 
     LOG_PATH = ROOT_OATH + '/logs/'
 
+    PROFILE_PATH = LOG_PATH + 'profiles/'
+
     MODEL_PATH = ROOT_OATH + '/model/'
 
+    MODEL_MANIFEST_PATH = MODEL_PATH + 'manifest.json'
+
+    EAST_MODEL_PATH = MODEL_PATH + 'frozen_east_text_detection.pb'
+
     DUNGEON_INFO_PATH = ROOT_OATH + '/data/dungeon_info.json'
+
+    SCREEN_SIGNATURE_PATH = ROOT_OATH + '/data/screen_signatures.json'
+
+    GLYPH_PATH = ROOT_OATH + '/data/glyphs/'
+
+    LAYOUT_TEMPLATE_PATH = ROOT_OATH + '/data/coordinate/templates/'
+
+    DEVICE_CALIBRATION_PATH = ROOT_OATH + '/config/device_calibration.json'
+
+    SESSION_PATH = ROOT_OATH + '/data/sessions/'
+
+    CHECKPOINT_PATH = ROOT_OATH + '/data/checkpoints/'
+
+    HARD_EXAMPLE_PATH = ROOT_OATH + '/data/hard_examples/'
@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/30
+import atexit
+import json
+import os
+import signal
+import socketserver
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Dict, List, Optional, Tuple
+
+from utils.logger import logger
+from utils.path_manager import PathManager
+
+# 通过环境变量开启：DNFM_PROFILE_HZ=100 启动时就开始采样，DNFM_PROFILE_PORT=9900 开启本地控制端口
+PROFILE_HZ_ENV = "DNFM_PROFILE_HZ"
+PROFILE_PORT_ENV = "DNFM_PROFILE_PORT"
+
+Frame = Tuple[str, str, int]  # (函数名, 文件, 行号)
+
+
+class SamplingProfiler:
+    """
+    采样分析器：按固定频率抓取所有线程的调用栈，统计每个调用栈出现的次数
+    能看出时间花在 ncnn 推理、numpy 解码、画框还是 sleep 上，输出 collapsed stacks 给 flamegraph.pl，或者 speedscope 文件
+    能用 SIGALRM 的时候用信号定时采样，不能用的时候（windows、不在主线程）用一个后台线程采样
+    信号处理函数在主线程里打断任意代码执行，不能拿锁，样本先放进无锁队列，读结果的时候再合并
+    整个进程只有一个采样器，多个设备的线程都在同一份输出里，按调用栈最底层的线程名区分
+    没开启的时候不装任何钩子，没有额外开销
+    """
+
+    def __init__(self, name: str = "bot", hz: float = 100, output_dir: str = PathManager.PROFILE_PATH, max_depth: int = 64):
+        """
+        :param name: 名称，作为输出文件名前缀
+        :param hz: 采样频率
+        :param output_dir: 输出目录
+        :param max_depth: 调用栈最多保留多少层
+        """
+        self.name = name
+        self.hz = hz
+        self.output_dir = output_dir
+        self.max_depth = max_depth
+        self.mode = None
+        self.started_at = 0.0
+        self.duration = 0.0
+
+        self._samples: Counter = Counter()
+        # 采样直接追加到这里，deque 的 append 是原子的，不用加锁
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._old_handler = None
+
+    @property
+    def running(self) -> bool:
+        return self.mode is not None
+
+    @property
+    def sample_count(self) -> int:
+        return sum(self.samples().values())
+
+    def start(self, hz: float = None) -> 'SamplingProfiler':
+        """
+        开始采样，已经在采样时什么都不做
+        :param hz: 采样频率，不传用初始化时的
+        :return:
+        """
+        if self.running:
+            return self
+        self.hz = hz or self.hz
+        with self._lock:
+            self._pending.clear()
+            self._samples.clear()
+        self.started_at = time.time()
+        interval = 1.0 / self.hz
+        # 信号处理函数只能在主线程注册
+        if hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread():
+            self.mode = "signal"
+            self._old_handler = signal.signal(signal.SIGALRM, self._on_signal)
+            signal.setitimer(signal.ITIMER_REAL, interval, interval)
+        else:
+            self.mode = "thread"
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._sample_loop, args=(interval,), name="profiler", daemon=True)
+            self._thread.start()
+        logger.info(f"开始采样分析：{self.name}，{self.hz:g} Hz，{self.mode} 模式")
+        return self
+
+    def stop(self) -> 'SamplingProfiler':
+        """
+        停止采样，采样结果保留到下一次 start
+        :return:
+        """
+        if not self.running:
+            return self
+        if self.mode == "signal":
+            signal.setitimer(signal.ITIMER_REAL, 0, 0)
+            signal.signal(signal.SIGALRM, self._old_handler or signal.SIG_DFL)
+        else:
+            self._stop.set()
+            self._thread.join(timeout=2)
+            self._thread = None
+        self.duration = time.time() - self.started_at
+        self.mode = None
+        logger.info(f"停止采样分析：{self.name}，{self.duration:.1f} 秒，{self.sample_count} 个样本")
+        return self
+
+    def _on_signal(self, signum, frame):
+        self._sample(frame)
+
+    def _sample_loop(self, interval: float):
+        while not self._stop.wait(interval):
+            self._sample()
+
+    def _sample(self, current_frame=None):
+        """
+        抓一次所有线程的调用栈
+        :param current_frame: 信号模式下被打断的那一帧，主线程的栈从这里开始，跳过信号处理函数本身
+        :return:
+        """
+        me = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks = []
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                if current_frame is None:
+                    continue
+                frame = current_frame
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            stacks.append((names.get(ident, str(ident)), tuple(reversed(stack))))
+        self._pending.append(stacks)
+
+    def samples(self) -> Dict[Tuple[str, Tuple[Frame, ...]], int]:
+        with self._lock:
+            while self._pending:
+                self._samples.update(self._pending.popleft())
+            return dict(self._samples)
+
+    @staticmethod
+    def _frame_label(frame: Frame) -> str:
+        name, filename, line = frame
+        return f"{name} ({os.path.basename(filename)}:{line})"
+
+    def collapsed(self) -> List[str]:
+        """
+        collapsed stacks 格式，每行是 线程;栈底;...;栈顶 次数，可以直接给 flamegraph.pl 或者 speedscope
+        :return:
+        """
+        lines = []
+        for (thread_name, stack), count in sorted(self.samples().items(), key=lambda item: -item[1]):
+            frames = [thread_name] + [self._frame_label(frame).replace(";", ":") for frame in stack]
+            lines.append(f"{';'.join(frames)} {count}")
+        return lines
+
+    def speedscope(self) -> dict:
+        """
+        speedscope 的 json 格式，每个线程一个 profile
+        :return:
+        """
+        frame_index: Dict[Frame, int] = {}
+        frames = []
+        profiles: Dict[str, dict] = {}
+        interval = 1.0 / self.hz
+        for (thread_name, stack), count in self.samples().items():
+            indexes = []
+            for frame in stack:
+                if frame not in frame_index:
+                    frame_index[frame] = len(frames)
+                    frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+                indexes.append(frame_index[frame])
+            profile = profiles.setdefault(thread_name, {
+                "type": "sampled", "name": thread_name, "unit": "seconds",
+                "startValue": 0, "endValue": 0, "samples": [], "weights": [],
+            })
+            profile["samples"].append(indexes)
+            profile["weights"].append(count * interval)
+            profile["endValue"] += count * interval
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": self.name,
+            "exporter": "utils.profiler",
+            "shared": {"frames": frames},
+            "profiles": list(profiles.values()),
+        }
+
+    def dump(self) -> Tuple[str, str]:
+        """
+        把当前的采样结果写到输出目录，可以在采样过程中调用
+        :return: (collapsed 文件, speedscope 文件)
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        prefix = os.path.join(self.output_dir, f"{self.name}_{time.strftime('%Y%m%d_%H%M%S')}".replace(":", "_"))
+        collapsed_path = prefix + ".collapsed.txt"
+        speedscope_path = prefix + ".speedscope.json"
+        with open(collapsed_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(self.collapsed()))
+        with open(speedscope_path, "w", encoding="utf-8") as f:
+            json.dump(self.speedscope(), f, ensure_ascii=False)
+        logger.info(f"采样结果已保存：{speedscope_path}")
+        return collapsed_path, speedscope_path
+
+
+class ProfilerControlServer:
+    """
+    本地控制端口，不用重启进程就能开关采样，只监听 127.0.0.1
+    命令每行一个：start [hz]、stop、dump、status，比如 echo "start 200" | nc 127.0.0.1 9900
+    """
+
+    def __init__(self, profiler: SamplingProfiler, port: int = 9900):
+        self.profiler = profiler
+        self.port = port
+        self._server: Optional[socketserver.ThreadingTCPServer] = None
+
+    def handle_command(self, line: str) -> str:
+        parts = line.split()
+        if not parts:
+            return "empty command"
+        command, args = parts[0].lower(), parts[1:]
+        profiler = self.profiler
+        if command == "start":
+            profiler.start(float(args[0]) if args else None)
+            return f"started {profiler.mode} {profiler.hz:g}Hz"
+        if command == "stop":
+            profiler.stop()
+            return " ".join(profiler.dump())
+        if command == "dump":
+            return " ".join(profiler.dump())
+        if command == "status":
+            return f"running={profiler.running} mode={profiler.mode} samples={profiler.sample_count}"
+        return f"unknown command {command}"
+
+    def start(self) -> 'ProfilerControlServer':
+        if self._server is not None:
+            return self
+        control = self
+
+        class _Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for raw in self.rfile:
+                    try:
+                        reply = control.handle_command(raw.decode("utf-8", "ignore"))
+                    except Exception as e:
+                        reply = f"error {e}"
+                    self.wfile.write((reply + "\n").encode("utf-8"))
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self._server = socketserver.ThreadingTCPServer(("127.0.0.1", self.port), _Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="profiler-control", daemon=True).start()
+        logger.info(f"采样分析控制端口：127.0.0.1:{self.port}")
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def start_profiler_from_env(name: str = "bot") -> Optional[SamplingProfiler]:
+    """
+    按环境变量开启采样分析，两个变量都没设置时返回 None，不做任何事
+    采样本来就抓所有线程，整个进程只有一个采样器，多个设备都会调用这里，第一次调用才创建，之后返回同一个
+    DNFM_PROFILE_HZ：启动时就开始采样的频率
+    DNFM_PROFILE_PORT：控制端口
+    :param name: 输出文件名前缀，一般用第一个设备的设备号
+    :return:
+    """
+    global _profiler
+    hz = os.environ.get(PROFILE_HZ_ENV)
+    port = os.environ.get(PROFILE_PORT_ENV)
+    if not hz and not port:
+        return None
+    with _profiler_lock:
+        if _profiler is not None:
+            return _profiler
+        profiler = SamplingProfiler(name=name, hz=float(hz) if hz else 100)
+        if port:
+            ProfilerControlServer(profiler, int(port)).start()
+        if hz:
+            profiler.start()
+        # 退出时把还在采样的结果写出来
+        atexit.register(lambda: profiler.running and profiler.stop().dump())
+        _profiler = profiler
+    return profiler
+
+
+_profiler: Optional[SamplingProfiler] = None
+_profiler_lock = threading.Lock()
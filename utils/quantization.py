@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/15
+import os
+import random
+import shutil
+import subprocess
+import sys
+from typing import List
+
+import cv2 as cv
+
+from utils.evaluation import KEY_LABELS, evaluate_detector, find_labelled_images
+from utils.logger import logger
+from utils.model_registry import ModelSpec, get_model_registry
+from utils.path_manager import PathManager
+from utils.yolov5 import YoloV5s
+
+
+def write_calibration_imagelist(frames_dir: str, imagelist_path: str, limit: int = 300, seed: int = 0) -> List[str]:
+    """
+    从录制的帧里随机挑选校准图片，写成 ncnn2table 需要的图片列表
+    :param frames_dir: 录制帧目录
+    :param imagelist_path: 图片列表输出路径
+    :param limit: 最多挑多少张，几百张就够了
+    :param seed: 随机种子，保证每次挑的一样
+    :return:
+    """
+    files = [file for file, _ in find_labelled_images(frames_dir)]
+    if not files:
+        raise FileNotFoundError(f"{frames_dir} has no images")
+    random.Random(seed).shuffle(files)
+    files = sorted(files[:limit])
+    with open(imagelist_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(os.path.abspath(file) for file in files) + "\n")
+    return files
+
+
+def calibration_input_shape(spec: ModelSpec, frame_shape) -> tuple:
+    """
+    按实际画面比例计算量化校准的输入尺寸，和 YoloV5s 的缩放、补边规则一致
+    :param spec: 模型描述
+    :param frame_shape: 画面的高、宽
+    :return: (宽, 高)
+    """
+    h, w = frame_shape[:2]
+    max_stride = max(spec.strides)
+    scale = spec.input_size / max(w, h)
+    w, h = int(w * scale), int(h * scale)
+    w = (w + max_stride - 1) // max_stride * max_stride
+    h = (h + max_stride - 1) // max_stride * max_stride
+    return w, h
+
+
+def _run_tool(tools_dir: str, name: str, *args):
+    executable = shutil.which(name, path=tools_dir) if tools_dir else shutil.which(name)
+    if executable is None:
+        raise FileNotFoundError(f"{name} not found, build ncnn tools and pass tools_dir")
+    logger.info(f"执行 {name} {' '.join(args)}")
+    subprocess.run([executable, *args], check=True)
+
+
+def quantize_int8(model: str, frames_dir: str, output_name: str = None, tools_dir: str = None, limit: int = 300) -> ModelSpec:
+    """
+    用录制的帧校准并生成 int8 模型，需要 ncnn 编译出来的 ncnnoptimize、ncnn2table、ncnn2int8
+    生成的文件放在模型同一目录，返回新模型的描述并注册到当前进程，持久化需要手动加到 manifest.json
+    :param model: 原始 fp32 模型名称
+    :param frames_dir: 录制帧目录
+    :param output_name: 新模型名称，默认是 原名称-int8
+    :param tools_dir: ncnn 工具目录
+    :param limit: 校准图片数量
+    :return:
+    """
+    spec = get_model_registry().get(model)
+    output_name = output_name or f"{spec.name}-int8"
+    model_dir = os.path.dirname(spec.param)
+    opt_param = os.path.join(model_dir, f"{spec.name}-opt.param")
+    opt_bin = os.path.join(model_dir, f"{spec.name}-opt.bin")
+    table = os.path.join(model_dir, f"{spec.name}.table")
+    imagelist = os.path.join(model_dir, f"{spec.name}-calibration.txt")
+    int8_param = os.path.join(model_dir, f"{output_name}.param")
+    int8_bin = os.path.join(model_dir, f"{output_name}.bin")
+
+    files = write_calibration_imagelist(frames_dir, imagelist, limit)
+    frame = cv.imread(files[0])
+    w, h = calibration_input_shape(spec, frame.shape)
+
+    norm = 1 / 255.0
+    _run_tool(tools_dir, "ncnnoptimize", spec.param, spec.bin, opt_param, opt_bin, "0")
+    _run_tool(
+        tools_dir, "ncnn2table", opt_param, opt_bin, imagelist, table,
+        "mean=[0,0,0]", f"norm=[{norm},{norm},{norm}]", f"shape=[{w},{h},3]",
+        "pixel=RGB", f"thread={os.cpu_count() or 4}", "method=kl",
+    )
+    _run_tool(tools_dir, "ncnn2int8", opt_param, opt_bin, int8_param, int8_bin, table)
+
+    int8_spec = ModelSpec(**{**spec.__dict__, "name": output_name, "param": int8_param, "bin": int8_bin, "precision": "int8"})
+    get_model_registry().register(int8_spec)
+    logger.info(f"int8 模型已生成：{int8_param}，需要把 {output_name} 加到 {PathManager.MODEL_MANIFEST_PATH}")
+    return int8_spec
+
+
+def evaluate_model(model: YoloV5s, dataset_dir: str, iou_threshold: float = 0.5) -> dict:
+    """
+    在标注好的回放数据上测试模型的 mAP 和帧率
+    :param model: 模型
+    :param dataset_dir: 标注数据目录，yolo 格式
+    :param iou_threshold: iou 阈值
+    :return:
+    """
+    result = evaluate_detector(model, dataset_dir, iou_threshold, warm_up=0)
+    return {"model": model.name, "precision": model.precision, **result}
+
+
+def accuracy_speed_report(model_names: List[str], dataset_dir: str, max_map_drop: float = 0.02, **kwargs) -> List[dict]:
+    """
+    对比多个精度版本的模型，给出 mAP 和帧率，推荐关键类别掉点不超过阈值的最快模型
+    :param model_names: manifest 里的模型名称，第一个作为精度基准
+    :param dataset_dir: 标注数据目录
+    :param max_map_drop: 关键类别允许的最大 mAP 下降
+    :param kwargs: 传给 YoloV5s 的参数
+    :return:
+    """
+    report = []
+    for name in model_names:
+        model = YoloV5s(model=name, **kwargs)
+        # 预热，避免第一帧的内存分配算进耗时
+        for image_path, _ in find_labelled_images(dataset_dir)[:3]:
+            model.warm_up(cv.imread(image_path).shape)
+        report.append(evaluate_model(model, dataset_dir))
+
+    baseline = report[0]["key_map50"]
+    candidates = [item for item in report if baseline - item["key_map50"] <= max_map_drop]
+    recommended = max(candidates, key=lambda item: item["fps"])["model"] if candidates else report[0]["model"]
+    for item in report:
+        item["recommended"] = item["model"] == recommended
+    return report
+
+
+def format_accuracy_speed_report(report: List[dict]) -> str:
+    lines = []
+    for item in report:
+        mark = " <- 推荐" if item["recommended"] else ""
+        lines.append(
+            f"{item['model']}({item['precision']}): {item['fps']:.1f} fps，mAP@0.5 {item['map50']:.3f}，"
+            f"关键类别 mAP@0.5 {item['key_map50']:.3f}{mark}"
+        )
+        for label in KEY_LABELS:
+            value = item["per_class"].get(label)
+            if value:
+                lines.append(f"    {label}: AP {value['ap50']:.3f} precision {value['precision']:.3f} recall {value['recall']:.3f}")
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    # 量化：python -m utils.quantization quantize new data/replay
+    # 对比：python -m utils.quantization report data/replay new new-fp16 new-int8
+    if sys.argv[1] == "quantize":
+        quantize_int8(sys.argv[2], sys.argv[3], tools_dir=sys.argv[4] if len(sys.argv) > 4 else None)
+    else:
+        names = sys.argv[3:] or get_model_registry().names()
+        logger.info("\n" + format_accuracy_speed_report(accuracy_speed_report(names, sys.argv[2], num_threads=4)))
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/13
+import threading
+import time
+
+from utils.logger import logger
+
+
+class StartupTimer:
+    """
+    启动耗时统计，记录每个阶段距离进程启动的时间
+    """
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.stages = {}
+        self._lock = threading.Lock()
+        self._reported = False
+
+    def mark(self, stage: str):
+        """
+        记录一个阶段完成，同一个阶段只记第一次
+        :param stage: 阶段名称
+        :return:
+        """
+        with self._lock:
+            if stage not in self.stages:
+                self.stages[stage] = time.perf_counter() - self.start_time
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start_time
+
+    def report(self) -> str:
+        """
+        输出启动报告
+        :return:
+        """
+        with self._lock:
+            stages = sorted(self.stages.items(), key=lambda item: item[1])
+            self._reported = True
+        lines = [f"{stage}: {seconds * 1000:.0f} ms" for stage, seconds in stages]
+        text = "启动耗时 " + "，".join(lines)
+        logger.info(text)
+        return text
+
+    def report_once(self):
+        """
+        只输出一次启动报告
+        :return:
+        """
+        if not self._reported:
+            self.report()
+
+
+# 进程级的启动计时，越早 import 越准
+startup_timer = StartupTimer()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/19
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+import cv2 as cv
+import numpy as np
+
+from utils.path_manager import PathManager
+
+EAST_OUTPUT_LAYERS = ['feature_fusion/Conv_7/Sigmoid', 'feature_fusion/concat_3']
+
+_net_cache = {}
+_net_cache_lock = threading.Lock()
+
+
+def get_east_net(model_path: str = PathManager.EAST_MODEL_PATH):
+    """
+    加载 EAST 模型，同一个路径整个进程只加载一次
+    :param model_path: frozen_east_text_detection.pb 路径
+    :return:
+    """
+    with _net_cache_lock:
+        net = _net_cache.get(model_path)
+        if net is None:
+            net = _net_cache[model_path] = cv.dnn.readNet(model_path)
+        return net
+
+
+def decode_predictions(scores: np.ndarray, geometry: np.ndarray, min_score: float = 0.5):
+    """
+    向量化解析 EAST 输出，一次处理所有超过阈值的格子
+    :param scores: (1, 1, h, w) 分数
+    :param geometry: (1, 5, h, w) 到四条边的距离和角度
+    :param min_score: 分数阈值
+    :return: (旋转框列表 [((cx, cy), (w, h), angle), ...], 分数数组)
+    """
+    ys, xs = np.nonzero(scores[0, 0] >= min_score)
+    if not len(ys):
+        return [], np.zeros(0, dtype=np.float32)
+
+    confidences = scores[0, 0, ys, xs]
+    d_top, d_right, d_bottom, d_left, angle = geometry[0, :, ys, xs].T
+    cos, sin = np.cos(angle), np.sin(angle)
+    h = d_top + d_bottom
+    w = d_right + d_left
+
+    # 每个格子对应输入图上 4x4 的区域
+    offset_x = xs * 4.0 + cos * d_right + sin * d_bottom
+    offset_y = ys * 4.0 - sin * d_right + cos * d_bottom
+    p1_x, p1_y = -sin * h + offset_x, -cos * h + offset_y
+    p3_x, p3_y = -cos * w + offset_x, sin * w + offset_y
+    center_x = 0.5 * (p1_x + p3_x)
+    center_y = 0.5 * (p1_y + p3_y)
+    angle_deg = -angle * 180.0 / np.pi
+
+    boxes = [((float(cx), float(cy)), (float(bw), float(bh)), float(a))
+             for cx, cy, bw, bh, a in zip(center_x, center_y, w, h, angle_deg)]
+    return boxes, confidences.astype(np.float32)
+
+
+def decode_predictions_loop(scores: np.ndarray, geometry: np.ndarray, min_score: float = 0.5):
+    """
+    原来 ocr_debug.get_text_coordinates2 里逐像素循环的解析方式，只用来做性能对比
+    :return: (轴对齐框列表 [(x1, y1, x2, y2), ...], 分数列表)
+    """
+    (num_rows, num_cols) = scores.shape[2:4]
+    rects = []
+    confidences = []
+    for y in range(num_rows):
+        scores_data = scores[0, 0, y]
+        x_data0, x_data1, x_data2, x_data3, angles_data = [geometry[0, i, y] for i in range(5)]
+        for x in range(num_cols):
+            if scores_data[x] < min_score:
+                continue
+            (offset_x, offset_y) = (x * 4.0, y * 4.0)
+            angle = angles_data[x]
+            cos = np.cos(angle)
+            sin = np.sin(angle)
+            h = x_data0[x] + x_data2[x]
+            w = x_data1[x] + x_data3[x]
+            end_x = int(offset_x + (cos * x_data1[x]) + (sin * x_data2[x]))
+            end_y = int(offset_y - (sin * x_data1[x]) + (cos * x_data2[x]))
+            rects.append((int(end_x - w), int(end_y - h), end_x, end_y))
+            confidences.append(scores_data[x])
+    return rects, confidences
+
+
+class TextLocator:
+    """
+    EAST 文字定位：模型缓存、向量化解析、旋转框 NMS，只对找到的文字区域做 OCR
+    """
+
+    def __init__(self, model_path: str = PathManager.EAST_MODEL_PATH, input_size: Tuple[int, int] = (320, 320),
+                 min_score: float = 0.5, nms_threshold: float = 0.4, recognizer: Callable[[cv.Mat], str] = None):
+        """
+        :param model_path: EAST 模型路径
+        :param input_size: 网络输入尺寸 (宽, 高)，必须是 32 的倍数
+        :param min_score: 文字分数阈值
+        :param nms_threshold: NMS 阈值
+        :param recognizer: 文字识别函数，输入文字区域返回文字，不传用 pytesseract
+        """
+        self.model_path = model_path
+        self.input_size = input_size
+        self.min_score = min_score
+        self.nms_threshold = nms_threshold
+        self.recognizer = recognizer
+
+    def forward(self, image: cv.Mat):
+        """
+        跑一次 EAST 网络
+        :return: (scores, geometry)
+        """
+        net = get_east_net(self.model_path)
+        blob = cv.dnn.blobFromImage(image, 1.0, self.input_size, (123.68, 116.78, 103.94), swapRB=True, crop=False)
+        # cv.dnn.Net 不是线程安全的
+        with _net_cache_lock:
+            net.setInput(blob)
+            scores, geometry = net.forward(EAST_OUTPUT_LAYERS)
+        return scores, geometry
+
+    def locate(self, image: cv.Mat, roi: Tuple[int, int, int, int] = None) -> List[Tuple[int, int, int, int]]:
+        """
+        定位文字区域
+        :param image: 画面
+        :param roi: 只在这块区域里找 (x1, y1, x2, y2)，不传找整个画面
+        :return: 原图坐标下的轴对齐框 [(x1, y1, x2, y2), ...]
+        """
+        ox, oy = 0, 0
+        if roi is not None:
+            ox, oy, x2, y2 = roi
+            image = image[oy:y2, ox:x2]
+        h, w = image.shape[:2]
+        rw, rh = w / float(self.input_size[0]), h / float(self.input_size[1])
+
+        scores, geometry = self.forward(image)
+        boxes, confidences = decode_predictions(scores, geometry, self.min_score)
+        if not boxes:
+            return []
+        indices = cv.dnn.NMSBoxesRotated(boxes, confidences.tolist(), self.min_score, self.nms_threshold)
+
+        result = []
+        for i in np.array(indices).reshape(-1):
+            points = cv.boxPoints(boxes[i])
+            x1, y1 = points.min(axis=0)
+            x2, y2 = points.max(axis=0)
+            result.append((
+                max(0, int(x1 * rw) + ox), max(0, int(y1 * rh) + oy),
+                min(w, int(x2 * rw)) + ox, min(h, int(y2 * rh)) + oy,
+            ))
+        return result
+
+    def recognize(self, roi: cv.Mat) -> str:
+        if self.recognizer is None:
+            from pytesseract import pytesseract
+
+            self.recognizer = lambda image: pytesseract.image_to_string(image, lang='chi_sim', config='--psm 7')
+        return self.recognizer(roi)
+
+    def find_text(self, image: cv.Mat, target_text: str, roi: Tuple[int, int, int, int] = None) -> Optional[Tuple[int, int]]:
+        """
+        找到包含目标文字的区域，返回中心坐标
+        :param image: 画面
+        :param target_text: 目标文字
+        :param roi: 只在这块区域里找
+        :return: 中心坐标，找不到返回 None
+        """
+        for x1, y1, x2, y2 in self.locate(image, roi):
+            if x2 <= x1 or y2 <= y1:
+                continue
+            if target_text in self.recognize(image[y1:y2, x1:x2]):
+                return (x1 + x2) // 2, (y1 + y2) // 2
+        return None
+
+
+def benchmark_decode(scores: np.ndarray, geometry: np.ndarray, rounds: int = 20) -> dict:
+    """
+    对比循环解析和向量化解析的耗时
+    :return:
+    """
+    t = time.perf_counter()
+    for _ in range(rounds):
+        decode_predictions_loop(scores, geometry)
+    loop_ms = (time.perf_counter() - t) / rounds * 1000
+
+    t = time.perf_counter()
+    for _ in range(rounds):
+        decode_predictions(scores, geometry)
+    vectorized_ms = (time.perf_counter() - t) / rounds * 1000
+    return {"loop_ms": loop_ms, "vectorized_ms": vectorized_ms, "speedup": loop_ms / max(vectorized_ms, 1e-9)}
+
+
+if __name__ == '__main__':
+    # python -m utils.text_locator saliya.jpg
+    import sys
+
+    image = cv.imread(sys.argv[1])
+    locator = TextLocator()
+    print(benchmark_decode(*locator.forward(image)))
+    print(locator.locate(image))
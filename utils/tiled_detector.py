@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Author  : huxiansheng (you@example.org)
+# @Date    : 2024/8/27
+import math
+import threading
+import time
+from typing import List, Sequence, Tuple
+
+import cv2 as cv
+import numpy as np
+
+from utils.logger import logger
+from utils.motion_gate import shift_detections
+
+# 切块的画面区域，归一化的 (x1, y1, x2, y2)，去掉顶部小地图和状态栏
+DEFAULT_TILE_REGION = (0.0, 0.1, 1.0, 0.9)
+
+
+def tile_boxes(width: int, height: int, region: Tuple[float, float, float, float] = DEFAULT_TILE_REGION,
+               tile_size: int = 1024, overlap: float = 0.2) -> List[Tuple[int, int, int, int]]:
+    """
+    把画面区域切成有重叠的小块，边上的块贴着区域边缘，不会超出画面
+    :param width: 画面宽
+    :param height: 画面高
+    :param region: 切块的区域
+    :param tile_size: 块的边长（原图像素）
+    :param overlap: 相邻块重叠的比例，要大于目标尺寸占块的比例，目标才不会被切开
+    :return: [(x1, y1, x2, y2), ...]
+    """
+    rx1, ry1 = int(region[0] * width), int(region[1] * height)
+    rx2, ry2 = int(region[2] * width), int(region[3] * height)
+
+    def _starts(start: int, end: int) -> List[int]:
+        length = end - start
+        size = min(tile_size, length)
+        if length <= size:
+            return [start]
+        step = size * (1 - overlap)
+        count = int(math.ceil((length - size) / step)) + 1
+        return [start + int(round(i * (length - size) / (count - 1))) for i in range(count)]
+
+    tiles = []
+    size_x, size_y = min(tile_size, rx2 - rx1), min(tile_size, ry2 - ry1)
+    for y in _starts(ry1, ry2):
+        for x in _starts(rx1, rx2):
+            tiles.append((x, y, x + size_x, y + size_y))
+    return tiles
+
+
+def merge_detections(objs: List, nms_threshold: float = 0.45) -> List:
+    """
+    跨块合并识别结果，同一个类别重叠的框只保留置信度最高的
+    :param objs: Detect_Object 列表
+    :param nms_threshold: iou 阈值
+    :return:
+    """
+    if len(objs) < 2:
+        return list(objs)
+    merged = []
+    labels = np.array([int(obj.label) for obj in objs])
+    for label in np.unique(labels):
+        group = [objs[i] for i in np.nonzero(labels == label)[0]]
+        boxes = [[float(o.rect.x), float(o.rect.y), float(o.rect.w), float(o.rect.h)] for o in group]
+        scores = [float(o.prob) for o in group]
+        keep = cv.dnn.NMSBoxes(boxes, scores, 0.0, nms_threshold)
+        merged.extend(group[int(i)] for i in np.array(keep).reshape(-1))
+    return merged
+
+
+class TiledDetector:
+    """
+    分块识别：整张 2688 宽的画面压到 640 输入后，地上的材料和箭头太小容易漏
+    先正常识别一遍，期望的类别没识别到时，再把画面切成有重叠的小块分别识别，结果跨块做 nms 合并
+    块之间按顺序识别，模型本身已经用多线程推理，再并行跑只会抢 cpu
+    其他属性透传给模型
+    """
+
+    def __init__(self, model, expected_classes: Sequence[str] = ("equipment", "go"),
+                 region: Tuple[float, float, float, float] = DEFAULT_TILE_REGION, tile_size: int = 1024,
+                 overlap: float = 0.2, min_interval: float = 0.5, report_interval: float = 30):
+        """
+        :param model: 识别模型
+        :param expected_classes: 期望出现的类别，快速识别没找到时才分块
+        :param region: 切块的区域
+        :param tile_size: 块的边长（原图像素）
+        :param overlap: 相邻块重叠的比例
+        :param min_interval: 两次分块识别的最小间隔，期望的类别确实不存在时不会每帧都分块
+        :param report_interval: 定时输出分块次数的间隔，0 表示不输出
+        """
+        self.model = model
+        self.expected_classes = tuple(expected_classes)
+        self.region = region
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.min_interval = min_interval
+        self.report_interval = report_interval
+
+        self.calls = 0
+        self.tiled = 0
+        self.recovered = 0  # 分块后新找到的目标数
+        self._lock = threading.Lock()
+        self._last_tiled = 0.0
+        self._last_report = time.monotonic()
+
+    def __call__(self, img: cv.Mat, classes=None) -> List:
+        now = time.monotonic()
+        if self.report_interval and now - self._last_report >= self.report_interval:
+            self._last_report = now
+            logger.info(self.format_stats())
+
+        result = self.model(img, classes=classes)
+        self.calls += 1
+
+        expected = [c for c in self.expected_classes if classes is None or c in classes]
+        found = {self.model.class_names[int(obj.label)] for obj in result}
+        missing = [c for c in expected if c not in found]
+        if not missing:
+            return result
+        with self._lock:
+            if now - self._last_tiled < self.min_interval:
+                return result
+            self._last_tiled = now
+
+        extra = self.detect_tiles(img, missing)
+        self.tiled += 1
+        self.recovered += len(extra)
+        return result + extra if extra else result
+
+    def detect_tiles(self, img: cv.Mat, classes: Sequence[str]) -> List:
+        """
+        分块识别指定的类别
+        :param img: 画面
+        :param classes: 要找的类别
+        :return: 合并后的识别结果，坐标是原图坐标
+        """
+        h, w = img.shape[:2]
+        tiles = tile_boxes(w, h, self.region, self.tile_size, self.overlap)
+
+        objs = []
+        for x1, y1, x2, y2 in tiles:
+            # 切片是不连续的内存，ncnn 按宽高读像素不看步长，必须拷贝成连续的
+            tile = np.ascontiguousarray(img[y1:y2, x1:x2])
+            objs.extend(shift_detections(self.model(tile, classes=classes), x1, y1))
+        return merge_detections(objs, float(getattr(self.model, "nms_threshold", 0.45)))
+
+    def format_stats(self) -> str:
+        return f"分块识别：识别 {self.calls} 帧，分块 {self.tiled} 次，新找到 {self.recovered} 个目标"
+
+    def __getattr__(self, name):
+        # 还没初始化完的时候不要透传，避免无限递归
+        if name == "model":
+            raise AttributeError(name)
+        return getattr(self.model, name)
@@ -11,14 +11,12 @@
 # under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR
 # CONDITIONS OF ANY KIND, either express or implied. See the License for the
 # specific language governing permissions and limitations under the License.
-import os.path
-import time
 import numpy as np
 import ncnn
-from ncnn.model_zoo.model_store import get_model_file
 from ncnn.utils.objects import Detect_Object
 from ncnn.utils.functional import *
-from utils.path_manager import PathManager
+from utils.inference_backend import NcnnBackend, create_backend
+from utils.model_registry import ModelSpec, get_model_registry
 
 
 class YoloV5Focus(ncnn.Layer):
@@ -62,63 +60,89 @@ def YoloV5Focus_layer_destroyer(layer):
 class YoloV5s:
     def __init__(
             self,
-            target_size=640,
-            prob_threshold=0.25,
-            nms_threshold=0.45,
+            target_size=None,
+            prob_threshold=None,
+            nms_threshold=None,
             num_threads=1,
             use_gpu=False,
+            model=None,
+            precision=None,
+            backend=None,
     ):
-        self.target_size = target_size
-        self.prob_threshold = prob_threshold
-        self.nms_threshold = nms_threshold
+        """
+        :param target_size: 输入尺寸，不传使用模型配置
+        :param prob_threshold: 置信度阈值，不传使用模型配置
+        :param nms_threshold: nms 阈值，不传使用模型配置
+        :param num_threads: 线程数
+        :param use_gpu: 是否使用 gpu
+        :param model: 模型名称或者 ModelSpec，不传使用 manifest 里的默认模型
+        :param precision: 推理精度 fp32 / fp16 / int8，不传使用模型配置
+        :param backend: 推理后端 ncnn / onnxruntime / opencv，不传使用模型配置
+        """
+        self.spec = model if isinstance(model, ModelSpec) else get_model_registry().get(model)
+        self.backend_name = backend or self.spec.backend
+        self.precision = precision or self.spec.precision
+        self.spec.validate(self.backend_name, self.precision)
+
+        self.target_size = target_size or self.spec.input_size
+        self.prob_threshold = self.spec.prob_threshold if prob_threshold is None else prob_threshold
+        self.nms_threshold = self.spec.nms_threshold if nms_threshold is None else nms_threshold
         self.num_threads = num_threads
         self.use_gpu = use_gpu
 
-        self.mean_vals = []
-        self.norm_vals = [1 / 255.0, 1 / 255.0, 1 / 255.0]
+        self.backend = create_backend(self.backend_name, self.spec, num_threads, use_gpu, self.precision)
 
-        self.net = ncnn.Net()
-        self.net.opt.use_vulkan_compute = self.use_gpu
-        self.net.opt.num_threads = self.num_threads
+        self.stride = np.array(self.spec.strides)
+        # 每个输出层的锚框宽高 (锚框数, 2)
+        self.anchors = np.array(self.spec.anchors, dtype=np.float32).reshape((len(self.spec.strides), -1, 2))
 
-        self.net.register_custom_layer(
-            "YoloV5Focus", YoloV5Focus_layer_creator, YoloV5Focus_layer_destroyer
-        )
+        self.class_names = self.spec.load_class_names()
+        # 每个类别的置信度和 nms 阈值，没单独配置的用统一阈值
+        self.class_prob_thresholds = self._class_values(self.spec.class_thresholds, self.prob_threshold)
+        self.class_nms_thresholds = self._class_values(self.spec.class_nms_thresholds, self.nms_threshold)
 
-        # original pretrained model from https://github.com/ultralytics/yolov5
-        # the ncnn model https://github.com/nihui/ncnn-assets/tree/master/models
-        param_path = os.path.join(PathManager.MODEL_PATH, "new.param")
-        bin_path = os.path.join(PathManager.MODEL_PATH, "new.bin")
-        classes_path = os.path.join(PathManager.MODEL_PATH, "new.txt")
-
-        # 确保文件存在
-        if not os.path.exists(param_path):
-            raise FileNotFoundError(f"{param_path} not found")
-        if not os.path.exists(bin_path):
-            raise FileNotFoundError(f"{bin_path} not found")
-        # original pretrained model from https://github.com/ultralytics/yolov5
-        # the ncnn model https://github.com/nihui/ncnn-assets/tree/master/models
-        self.net.load_param(param_path)
-        self.net.load_model(bin_path)
-
-        self.grid = [make_grid(10, 6), make_grid(20, 12), make_grid(40, 24)]
-        self.stride = np.array([32, 16, 8])
-        self.anchor_grid = np.array(
-            [
-                [116, 90, 156, 198, 373, 326],
-                [30, 61, 62, 45, 59, 119],
-                [10, 13, 16, 30, 33, 23],
-            ]
-        ).reshape((3, 1, 3, 1, 1, 2))
+    @property
+    def name(self) -> str:
+        return self.spec.name
 
-        self.class_names = [
-            line.strip() for line in open(classes_path).readlines()
-        ]
+    @staticmethod
+    def set_precision(opt, precision: str):
+        """
+        设置 ncnn 的推理精度
+        :param opt: ncnn.Option
+        :param precision: fp32 / fp16 / int8
+        :return:
+        """
+        NcnnBackend.set_precision(opt, precision)
 
     def __del__(self):
-        self.net = None
+        self.backend = None
+
+    def warm_up(self, frame_shape=(1242, 2688)):
+        """
+        用一张空白图跑一次推理，提前完成内存分配，第一帧识别就不会卡顿
+        :param frame_shape: 实际画面的高、宽
+        :return:
+        """
+        dummy = np.zeros((frame_shape[0], frame_shape[1], 3), dtype=np.uint8)
+        self(dummy)
 
-    def __call__(self, img):
+    def __call__(self, img, classes=None):
+        """
+        :param img: BGR 画面
+        :param classes: 只要这些标签，名称或序号，None 表示全部
+        :return: 识别结果
+        """
+        inputs, meta = self.preprocess(img)
+        pred = self.inference(inputs)
+        return self.postprocess(pred, meta, classes)
+
+    def preprocess(self, img):
+        """
+        缩放、补边、归一化，补边按最大步长对齐
+        :param img: BGR 画面
+        :return: (网络输入, 还原坐标需要的信息)
+        """
         img_w = img.shape[1]
         img_h = img.shape[0]
 
@@ -134,170 +158,116 @@ class YoloV5s:
             h = self.target_size
             w = int(w * scale)
 
-        mat_in = ncnn.Mat.from_pixels_resize(
-            img, ncnn.Mat.PixelType.PIXEL_BGR2RGB, img_w, img_h, w, h
-        )
-        # pad to target_size rectangle
-        # yolov5/utils/datasets.py letterbox
-        wpad = (w + 31) // 32 * 32 - w
-        hpad = (h + 31) // 32 * 32 - h
-        mat_in_pad = ncnn.copy_make_border(
-            mat_in,
-            hpad // 2,
-            hpad - hpad // 2,
-            wpad // 2,
-            wpad - wpad // 2,
-            ncnn.BorderType.BORDER_CONSTANT,
-            114.0,
-        )
+        max_stride = int(self.stride.max())
+        wpad = (w + max_stride - 1) // max_stride * max_stride - w
+        hpad = (h + max_stride - 1) // max_stride * max_stride - h
+        pads = (hpad // 2, hpad - hpad // 2, wpad // 2, wpad - wpad // 2)
+        inputs = self.backend.make_input(img, w, h, pads)
+        meta = (scale, wpad, hpad, w + wpad, h + hpad)
+        return inputs, meta
 
-        mat_in_pad.substract_mean_normalize(self.mean_vals, self.norm_vals)
+    def inference(self, inputs):
+        """
+        网络推理
+        :param inputs: preprocess 的输出
+        :return: 各输出层的结果
+        """
+        return self.backend.infer(inputs)
 
-        ex = self.net.create_extractor()
-        ex.input("images", mat_in_pad)
+    def class_ids(self, classes) -> np.ndarray or None:
+        """
+        把标签名称或序号转换成序号数组
+        :param classes: 标签名称或序号，None 表示全部
+        :return:
+        """
+        if classes is None:
+            return None
+        ids = []
+        for label in classes:
+            if isinstance(label, str):
+                if label not in self.class_names:
+                    raise ValueError(f"{label} is not in {self.name} classes")
+                label = self.class_names.index(label)
+            ids.append(int(label))
+        return np.array(sorted(set(ids)), dtype=np.int64)
+
+    def _class_values(self, overrides: dict, default: float) -> np.ndarray:
+        values = np.full(len(self.class_names), default, dtype=np.float32)
+        for label, value in overrides.items():
+            if label in self.class_names:
+                values[self.class_names.index(label)] = value
+        return values
+
+    def postprocess(self, pred, meta, classes=None):
+        """
+        解码、nms，把坐标还原到原图
+        先按目标置信度筛掉不可能达到阈值的格子，再按类别和阈值筛选，最后只解码留下来的框
+        :param pred: inference 的输出
+        :param meta: preprocess 返回的信息
+        :param classes: 只要这些标签，名称或序号，None 表示全部
+        :return: 识别结果
+        """
+        scale, wpad, hpad, pad_w, pad_h = meta
+        class_ids = self.class_ids(classes)
+        prob_thresholds = self.class_prob_thresholds if class_ids is None else self.class_prob_thresholds[class_ids]
+        if not len(prob_thresholds):
+            return []
 
-        # 改动部分 Permute
-        # anchor setting from yolov5/models/yolov5s.yaml
-        ret1, mat_out1 = ex.extract("output")  # stride 8
-        ret2, mat_out2 = ex.extract("364")  # stride 16
-        ret3, mat_out3 = ex.extract("381")  # stride 32
+        # 最终置信度 = 目标置信度 * 类别置信度，目标置信度的 logit 低于最小阈值的格子直接跳过
+        min_prob = float(prob_thresholds.min())
+        min_logit = np.log(min_prob / (1 - min_prob)) if 0 < min_prob < 1 else (-np.inf if min_prob <= 0 else np.inf)
 
-        pred = [np.array(mat_out3), np.array(mat_out2), np.array(mat_out1)]
-        z = []
+        all_boxes, all_labels, all_confs = [], [], []
         for i in range(len(pred)):
-            num_grid = pred[i].shape[1]
-            if mat_in_pad.w > mat_in_pad.h:
-                num_grid_x = mat_in_pad.w // self.stride[i]
-                num_grid_y = num_grid // num_grid_x
+            if pad_w > pad_h:
+                num_grid_x = pad_w // self.stride[i]
             else:
-                num_grid_y = mat_in_pad.h // self.stride[i]
-                num_grid_x = num_grid // num_grid_y
-            if (
-                    self.grid[i].shape[0] != num_grid_x
-                    or self.grid[i].shape[1] != num_grid_y
-            ):
-                self.grid[i] = make_grid(num_grid_x, num_grid_y)
-
-            y = sigmoid(pred[i])
-            y = y.reshape(pred[i].shape[0], num_grid_y, num_grid_x, pred[i].shape[2])
-            y[..., 0:2] = (y[..., 0:2] * 2.0 - 0.5 + self.grid[i]) * self.stride[
-                i
-            ]  # xy
-            y[..., 2:4] = (y[..., 2:4] * 2) ** 2 * self.anchor_grid[i]  # wh
-            z.append(y.reshape(1, -1, y.shape[-1]))
-        pred = np.concatenate(z, 1)
-
-        result = self.non_max_suppression(
-            pred, self.prob_threshold, self.nms_threshold
-        )[0]
-
-        if result is None:
+                num_grid_x = pred[i].shape[1] // (pad_h // self.stride[i])
+
+            anchor, cell = np.nonzero(pred[i][..., 4] > min_logit)
+            if not len(anchor):
+                continue
+            y = pred[i][anchor, cell]
+            # 先只算要的类别的置信度，每个类别按自己的阈值筛选，一个框可以属于多个类别
+            cls = y[:, 5:] if class_ids is None else y[:, 5 + class_ids]
+            scores = sigmoid(cls) * sigmoid(y[:, 4:5])
+            index, column = np.nonzero(scores > prob_thresholds)
+            if not len(index):
+                continue
+
+            # 只解码筛选后留下的框
+            box = sigmoid(y[index, :4])
+            grid_y, grid_x = np.divmod(cell[index], num_grid_x)
+            xy = (box[:, 0:2] * 2.0 - 0.5 + np.stack([grid_x, grid_y], axis=1)) * self.stride[i]
+            wh = (box[:, 2:4] * 2) ** 2 * self.anchors[i][anchor[index]]
+            all_boxes.append(xywh2xyxy(np.concatenate([xy, wh], axis=1)))
+            all_labels.append(column if class_ids is None else class_ids[column])
+            all_confs.append(scores[index, column])
+
+        if not all_boxes:
             return []
+        boxes = np.concatenate(all_boxes)
+        labels = np.concatenate(all_labels)
+        confs = np.concatenate(all_confs)
+
+        # 每个类别按自己的 nms 阈值单独做
+        keep = []
+        for label in np.unique(labels):
+            idx = np.nonzero(labels == label)[0]
+            picked = nms(boxes[idx], confs[idx], iou_threshold=float(self.class_nms_thresholds[label]))
+            keep.extend(idx[picked])
+        keep = sorted(keep, key=lambda k: -confs[k])[:300]
 
         objects = [
             Detect_Object(
-                obj[5],
-                obj[4],
-                (obj[0] - (wpad / 2)) / scale,
-                (obj[1] - (hpad / 2)) / scale,
-                (obj[2] - obj[0]) / scale,
-                (obj[3] - obj[1]) / scale,
+                labels[k],
+                confs[k],
+                (boxes[k, 0] - (wpad / 2)) / scale,
+                (boxes[k, 1] - (hpad / 2)) / scale,
+                (boxes[k, 2] - boxes[k, 0]) / scale,
+                (boxes[k, 3] - boxes[k, 1]) / scale,
             )
-            for obj in result
+            for k in keep
         ]
 
         return objects
-
-    def non_max_suppression(
-            self,
-            prediction,
-            conf_thres=0.1,
-            iou_thres=0.6,
-            merge=False,
-            classes=None,
-            agnostic=False,
-    ):
-        """Performs Non-Maximum Suppression (NMS) on inference results
-
-        Returns:
-            detections with shape: nx6 (x1, y1, x2, y2, conf, cls)
-        """
-        nc = prediction[0].shape[1] - 5  # number of classes
-        xc = prediction[..., 4] > conf_thres  # candidates
-
-        # Settings
-        min_wh, max_wh = 2, 4096  # (pixels) minimum and maximum box width and height
-        max_det = 300  # maximum number of detections per image
-        time_limit = 10.0  # seconds to quit after
-        redundant = True  # require redundant detections
-        multi_label = nc > 1  # multiple labels per box (adds 0.5ms/img)
-
-        t = time.time()
-        output = [None] * prediction.shape[0]
-        for xi, x in enumerate(prediction):  # image index, image inference
-            # Apply constraints
-            # x[((x[..., 2:4] < min_wh) | (x[..., 2:4] > max_wh)).any(1), 4] = 0  # width-height
-            x = x[xc[xi]]  # confidence
-
-            # If none remain process next image
-            if not x.shape[0]:
-                continue
-
-            # Compute conf
-            x[:, 5:] *= x[:, 4:5]  # conf = obj_conf * cls_conf
-
-            # Box (center x, center y, width, height) to (x1, y1, x2, y2)
-            box = xywh2xyxy(x[:, :4])
-
-            # Detections matrix nx6 (xyxy, conf, cls)
-            if multi_label:
-                i, j = (x[:, 5:] > conf_thres).nonzero()
-                x = np.concatenate(
-                    (box[i], x[i, j + 5, None], j[:, None].astype(np.float32)), axis=1
-                )
-            else:  # best class only
-                conf, j = x[:, 5:].max(1, keepdim=True)
-                x = np.concatenate((box, conf, j.float()), axis=1)[
-                    conf.view(-1) > conf_thres
-                    ]
-
-            # Filter by class
-            if classes:
-                x = x[(x[:, 5:6] == np.array(classes)).any(1)]
-
-            # Apply finite constraint
-            # if not torch.isfinite(x).all():
-            #     x = x[torch.isfinite(x).all(1)]
-
-            # If none remain process next image
-            n = x.shape[0]  # number of boxes
-            if not n:
-                continue
-
-            # Sort by confidence
-            # x = x[x[:, 4].argsort(descending=True)]
-
-            # Batched NMS
-            c = x[:, 5:6] * (0 if agnostic else max_wh)  # classes
-            boxes, scores = x[:, :4] + c, x[:, 4]  # boxes (offset by class), scores
-            i = nms(boxes, scores, iou_threshold=iou_thres)
-            if len(i) > max_det:  # limit detections
-                i = i[:max_det]
-            if merge and (1 < n < 3e3):  # Merge NMS (boxes merged using weighted mean)
-                try:  # update boxes as boxes(i,4) = weights(i,n) * boxes(n,4)
-                    iou = box_iou(boxes[i], boxes) > iou_thres  # iou matrix
-                    weights = iou * scores[None]  # box weights
-                    x[i, :4] = torch.mm(weights, x[:, :4]).float() / weights.sum(
-                        1, keepdim=True
-                    )  # merged boxes
-                    if redundant:
-                        i = i[iou.sum(1) > 1]  # require redundancy
-                except:  # possible CUDA error https://github.com/ultralytics/yolov3/issues/1139
-                    # print(x, i, x.shape, i.shape)
-                    pass
-
-            output[xi] = x[i]
-            if (time.time() - t) > time_limit:
-                break  # time limit exceeded
-
-        return output